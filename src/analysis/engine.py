@@ -0,0 +1,384 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+An analysis engine over a results root (a directory of experiments by TreeLine, PerfFuzz, or SlackLine). The root is
+indexed once: each experiment gets a row of metadata (tool, algorithm, app, budget, and all the "Config:"/"Globals:"
+keys of its config-and-stats-report.txt), and its saved inputs are loaded into columnar arrays (id, exec, dur, cost,
+hotspot). The costs come from the measurements of collect_costs.py when its CSV for the experiment is in the root
+(the same measurement for all the tools), otherwise from what the search recorded (TreeLine names or corpus index).
+An experiment with neither (e.g., PerfFuzz before collect_costs.py) is unmeasured (its source is 'none'): its costs
+are NaN in the comparisons, thus it is left out of the aggregates (see unmeasured()).
+
+Both the index and the arrays of each experiment are cached in <root>/.treeline-analysis/ and only rebuilt for the
+experiments that changed since the last invocation.
+
+On top of the columns, the comparisons are vectorized over all the experiments at once:
+    - time_to_max_curves(): the max cost found by each experiment over a common time grid.
+    - auc(): the area under those curves (normalized by the time span, i.e., the average max cost over time).
+    - final_stats(): the final max cost of each experiment and the time it was first reached.
+    - summarize(): the per-config aggregates across the repetitions.
+
+:Usage example:
+.. code-block:: python
+
+    results = ResultsIndex("/tmp/treeline")
+    summary = results.summarize(by=['tool', 'algorithm', 'budget'], grid_s=np.arange(0, 3601, 60))
+
+or from the command line (in src/):
+.. code-block:: shell
+
+    python -m analysis.engine /tmp/treeline --by tool algorithm budget --step 60
+"""
+
+import os
+import csv
+import json
+import hashlib
+import argparse
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from mcts.corpus import CORPUS_DIR_NAME, INDEX_FILE_NAME, is_corpus_dir, read_index
+from helpers import parse_input_name
+
+INPUT_DIRS = {'queue': 'tool:PerfFuzz', 'buffer': 'tool:TreeLine', 'list': 'tool:SlackLine',
+              CORPUS_DIR_NAME: 'tool:TreeLine'}
+"""The directories of saved inputs and the tool that writes each of them."""
+
+COLUMNS = ['id', 'exec', 'dur', 'cost', 'hotspot']
+"""The columns loaded for the inputs of each experiment (dur is in milliseconds since the search started)."""
+
+CACHE_DIR_NAME = '.treeline-analysis'
+_CACHE_VERSION = 1
+_REPORT_FILE_NAME = 'config-and-stats-report.txt'
+_trapezoid = getattr(np, 'trapezoid', None) or np.trapz  # numpy 2 renamed trapz
+
+
+def read_stats_report(file_path: str) -> Dict[str, str]:
+    """Parse a config-and-stats-report.txt (see helpers.beautify_final_report).
+
+    :param file_path: The report file.
+    :return: The report keys to values.
+    """
+    report = {}
+    with open(file_path, 'r') as report_file:
+        for line in report_file:
+            key, sep, value = line.rstrip('\n').partition(' = ')
+            if sep:
+                report[key] = value
+    return report
+
+
+def _signature(paths: Sequence[str]) -> List[List[int]]:
+    """The modification time and size of each path (zeros if missing), to know if an experiment changed."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append([stat.st_mtime_ns, stat.st_size])
+        except FileNotFoundError:
+            signature.append([0, 0])
+    return signature
+
+
+def _to_number(value: str):
+    """A report value as a number if it is one (e.g., "8,329" or "30"), otherwise as is."""
+    try:
+        return int(value.replace(',', ''))
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+class ResultsIndex:
+    """The experiments of a results root, with their inputs as columns.
+
+    :param root: The results root directory.
+    :param use_cache: If False, the cache is neither read nor written.
+    """
+
+    def __init__(self, root: str, use_cache: bool = True):
+        """Constructor method
+        """
+        if not os.path.isdir(root):
+            raise RuntimeError(f'The path given "{root}" is not a directory')
+        self.root = os.path.abspath(root)
+        self.use_cache = use_cache
+        self.cache_dir = os.path.join(self.root, CACHE_DIR_NAME)
+        self._uncached_arrays: Dict[str, Dict[str, np.ndarray]] = {}  # the arrays when the cache is not used
+
+        self.experiments: pd.DataFrame = pd.DataFrame()  # a row per experiment
+        self.inputs: pd.DataFrame = pd.DataFrame(columns=['expr'] + COLUMNS)  # a row per input (expr is the row #)
+        self.refresh()
+
+    def refresh(self):
+        """Scan the root and (re)load the experiments that are new or changed since they were cached.
+        """
+        cached = self._read_cached_index()
+        index = {}
+        for entry in sorted(os.scandir(self.root), key=lambda e: e.name):
+            if not entry.is_dir() or entry.name.startswith(('.', 'expr:')):
+                continue
+            inputs_dir = next((d for d in INPUT_DIRS if os.path.isdir(os.path.join(entry.path, d))), None)
+            if inputs_dir is None or (inputs_dir == CORPUS_DIR_NAME and not is_corpus_dir(
+                    os.path.join(entry.path, inputs_dir))):
+                continue
+            technique = INPUT_DIRS[inputs_dir]
+            measured_csv = os.path.join(self.root, f'{technique}-{entry.name}.csv')
+            signature = _signature([os.path.join(entry.path, inputs_dir),
+                                    os.path.join(entry.path, inputs_dir, INDEX_FILE_NAME),
+                                    os.path.join(entry.path, _REPORT_FILE_NAME), measured_csv])
+            record = cached.get(entry.name)
+            if record is None or record['signature'] != signature or not os.path.isfile(self._arrays_file(entry.name)):
+                record = self._load_experiment(entry.name, inputs_dir, technique, measured_csv, signature)
+            index[entry.name] = record
+
+        self._write_cached_index(index)
+        self._build_frames(index)
+
+    def _arrays_file(self, name: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(name.encode('utf-8')).hexdigest() + '.npz')
+
+    def _read_cached_index(self) -> Dict[str, dict]:
+        if not self.use_cache:
+            return {}
+        try:
+            with open(os.path.join(self.cache_dir, 'index.json'), 'r') as index_file:
+                cached = json.load(index_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return cached['experiments'] if cached.get('version') == _CACHE_VERSION else {}
+
+    def _write_cached_index(self, index: Dict[str, dict]):
+        if not self.use_cache:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_file = os.path.join(self.cache_dir, 'index.json.tmp')
+        with open(tmp_file, 'w') as index_file:
+            json.dump({'version': _CACHE_VERSION, 'experiments': index}, index_file)
+        os.replace(tmp_file, os.path.join(self.cache_dir, 'index.json'))
+
+    def _load_experiment(self, name: str, inputs_dir: str, technique: str, measured_csv: str,
+                         signature: List[List[int]]) -> dict:
+        """Load the inputs of an experiment into arrays (cached as a .npz) and collect its metadata.
+
+        :return: The index record of the experiment.
+        """
+        path = os.path.join(self.root, name)
+        if os.path.isfile(measured_csv):
+            source = 'measured'
+            frame = pd.read_csv(measured_csv, comment='#', usecols=['id', 'exec', 'dur', 'cost', 'hotspot'])
+            arrays = {column: frame[column].to_numpy(dtype=np.int64) for column in COLUMNS}
+        elif inputs_dir == CORPUS_DIR_NAME:
+            source = 'reported'
+            records = read_index(os.path.join(path, inputs_dir))
+            arrays = {'id': [r['id'] for r in records], 'exec': [r['exec'] for r in records],
+                      'dur': [r['dur'] for r in records], 'cost': [r['cost'] for r in records],
+                      'hotspot': [r['hs'] for r in records]}
+        else:
+            rows = []
+            has_cost = True
+            for entry in os.scandir(os.path.join(path, inputs_dir)):
+                if not entry.is_file():
+                    continue
+                parsed = parse_input_name(entry.name, technique)
+                if parsed is None:
+                    continue
+                indicators = dict(i.split(':', 1) for i in entry.name.split(',') if i.count(':') == 1)
+                if 'cost' not in indicators or 'hs' not in indicators:
+                    has_cost = False
+                    cost = hotspot = 0
+                else:
+                    cost = int(indicators['cost'])
+                    hotspot = int(indicators['hs'])
+                rows.append((parsed[0], parsed[1], parsed[3], cost, hotspot))
+            source = 'reported' if has_cost else 'none'  # e.g., PerfFuzz names have no cost, run collect_costs.py
+            arrays = {column: [row[i] for row in rows] for i, column in enumerate(COLUMNS)}
+
+        arrays = {column: np.asarray(values, dtype=np.int64) for column, values in arrays.items()}
+        if self.use_cache:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.savez(self._arrays_file(name), **arrays)
+        else:
+            self._uncached_arrays[name] = arrays
+
+        report_path = os.path.join(path, _REPORT_FILE_NAME)
+        report = read_stats_report(report_path) if os.path.isfile(report_path) else {}
+        config = {k: v for k, v in report.items() if k.startswith(('Config:', 'Globals:', 'Duration-Config:'))}
+        config['Results: Max Observed Cost'] = report.get('Results: Max Observed Cost', '')
+        return {'signature': signature, 'tool': technique.split(':')[1], 'source': source, 'config': config}
+
+    def _build_frames(self, index: Dict[str, dict]):
+        """Build the experiments frame and concatenate the inputs of all the experiments into one columnar frame.
+        """
+        rows = []
+        columns = {column: [] for column in COLUMNS}
+        codes = []
+        for code, (name, record) in enumerate(index.items()):
+            config = record['config']
+            rows.append({'name': name, 'tool': record['tool'], 'source': record['source'],
+                         'algorithm': config.get('Config: Search Algorithm', record['tool'].lower()),
+                         'app': config.get('Config: Target App', ''),
+                         'grammar': config.get('Config: Grammar name', ''),
+                         'budget': _to_number(config.get('Config: Budget', '')),
+                         **{key: _to_number(value) for key, value in config.items()}})
+            if self.use_cache:
+                with np.load(self._arrays_file(name)) as arrays:
+                    loaded = {column: arrays[column] for column in COLUMNS}
+            else:
+                loaded = self._uncached_arrays[name]
+            for column in COLUMNS:
+                columns[column].append(loaded[column])
+            codes.append(np.full(len(loaded['id']), code, dtype=np.int64))
+
+        self.experiments = pd.DataFrame(rows)
+        if codes:
+            self.inputs = pd.DataFrame({'expr': np.concatenate(codes),
+                                        **{column: np.concatenate(values) for column, values in columns.items()}})
+        self.inputs = self.inputs.sort_values(['expr', 'dur'], kind='stable').reset_index(drop=True)
+
+    def unmeasured(self) -> np.ndarray:
+        """
+        :return: A boolean per experiment, True if its inputs have no cost (neither measured nor reported).
+        """
+        if self.experiments.empty:
+            return np.zeros(0, dtype=bool)
+        return (self.experiments['source'] == 'none').to_numpy()
+
+    def time_to_max_curves(self, grid_s: Sequence[float]) -> np.ndarray:
+        """The max cost found by each experiment at each point of a time grid (zero before its first input).
+
+        :param grid_s: The time grid in seconds since the search started (ascending).
+        :return: An array of shape (# of experiments, len(grid_s)).
+        """
+        grid_ms = np.asarray(grid_s, dtype=np.float64) * 1_000
+        n = len(self.experiments)
+        curves = np.zeros((n, len(grid_ms)), dtype=np.int64)
+        if self.inputs.empty or n == 0:
+            return curves
+        expr = self.inputs['expr'].to_numpy()
+        dur = self.inputs['dur'].to_numpy(dtype=np.float64)
+        running_max = self.inputs.groupby('expr', sort=False)['cost'].cummax().to_numpy()
+
+        # one sorted key per input (experiment, time), thus a single searchsorted finds for every experiment and
+        # every grid point the last input found by then.
+        span = max(dur.max(), grid_ms.max()) + 1
+        keys = expr * span + dur
+        grid_keys = (np.arange(n)[:, None] * span + grid_ms[None, :]).ravel()
+        positions = np.searchsorted(keys, grid_keys, side='right') - 1
+        valid = positions >= 0
+        valid[valid] = expr[positions[valid]] == np.repeat(np.arange(n), len(grid_ms))[valid]
+        curves.ravel()[valid] = running_max[positions[valid]]
+        return curves
+
+    def auc(self, grid_s: Sequence[float], curves: Optional[np.ndarray] = None) -> np.ndarray:
+        """The area under the time-to-max curves, normalized by the time span (i.e., the average max cost over time).
+
+        :param grid_s: The time grid in seconds.
+        :param curves: The curves of the grid (computed if None).
+        :return: An array with a value per experiment (NaN for the unmeasured ones).
+        """
+        grid_s = np.asarray(grid_s, dtype=np.float64)
+        if curves is None:
+            curves = self.time_to_max_curves(grid_s)
+        if len(grid_s) < 2:
+            areas = curves[:, -1].astype(np.float64) if curves.size else np.zeros(len(curves))
+        else:
+            areas = _trapezoid(curves, grid_s, axis=1) / (grid_s[-1] - grid_s[0])
+        areas[self.unmeasured()] = np.nan
+        return areas
+
+    def final_stats(self) -> pd.DataFrame:
+        """
+        :return: A frame with a row per experiment: its final max cost, the time (s) it was first reached, the number
+            of saved inputs, and the max hotspot. The costs, the time, and the hotspot of the unmeasured experiments are
+            NaN.
+        """
+        stats = pd.DataFrame({'max_cost': 0.0, 'time_to_max_s': np.nan, 'inputs': 0, 'max_hotspot': 0.0},
+                             index=pd.RangeIndex(len(self.experiments)))
+        stats.loc[self.unmeasured(), ['max_cost', 'max_hotspot']] = np.nan
+        if self.inputs.empty:
+            return stats
+        groups = self.inputs.groupby('expr', sort=True)
+        first_max = self.inputs.loc[groups['cost'].idxmax()]  # idxmax gives the first (earliest) of the max values
+        stats.loc[first_max['expr'].to_numpy(), 'max_cost'] = first_max['cost'].to_numpy()
+        stats.loc[first_max['expr'].to_numpy(), 'time_to_max_s'] = first_max['dur'].to_numpy() / 1_000
+        stats.loc[groups.size().index, 'inputs'] = groups.size().to_numpy()
+        stats.loc[groups.size().index, 'max_hotspot'] = groups['hotspot'].max().to_numpy()
+        stats.loc[self.unmeasured(), ['max_cost', 'time_to_max_s', 'max_hotspot']] = np.nan
+        return stats
+
+    def max_cost_distribution(self, by: Sequence[str], quantiles: Sequence[float] = (0, .25, .5, .75, 1)) \
+            -> pd.DataFrame:
+        """The distribution of the final max costs across the repetitions of each config.
+
+        :param by: The experiments columns defining a config (e.g., ['tool', 'algorithm', 'budget']).
+        :param quantiles: The quantiles reported.
+        :return: A frame with a row per config and a column per quantile.
+        """
+        frame = pd.concat([self.experiments[list(by)], self.final_stats()['max_cost']], axis=1)
+        distribution = frame.groupby(list(by), dropna=False)['max_cost'].quantile(list(quantiles)).unstack()
+        distribution.columns = [f'q{int(q * 100)}' for q in quantiles]
+        return distribution
+
+    def summarize(self, by: Sequence[str], grid_s: Sequence[float]) -> pd.DataFrame:
+        """The per-config aggregates across the repetitions (of the measured experiments, the repetitions column
+        counts all of them).
+
+        :param by: The experiments columns defining a config (e.g., ['tool', 'algorithm', 'budget']).
+        :param grid_s: The time grid (in seconds) of the curves used for the AUC.
+        :return: A frame with a row per config.
+        """
+        stats = self.final_stats()
+        stats['auc'] = self.auc(grid_s)
+        frame = pd.concat([self.experiments[list(by)], stats], axis=1)
+        return frame.groupby(list(by), dropna=False).agg(
+            repetitions=('max_cost', 'size'),
+            measured=('max_cost', 'count'),
+            max_cost_mean=('max_cost', 'mean'),
+            max_cost_median=('max_cost', 'median'),
+            max_cost_std=('max_cost', 'std'),
+            max_cost_min=('max_cost', 'min'),
+            max_cost_max=('max_cost', 'max'),
+            auc_mean=('auc', 'mean'),
+            auc_median=('auc', 'median'),
+            time_to_max_s_median=('time_to_max_s', 'median'),
+            inputs_mean=('inputs', 'mean'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the experiments of a results root.")
+    parser.add_argument("root", type=str, help="The results root directory.")
+    parser.add_argument("--by", nargs='+', default=['tool', 'algorithm', 'app', 'budget'],
+                        help="The experiment columns defining a config.")
+    parser.add_argument("--step", type=float, default=60, help="The time grid step in seconds.")
+    parser.add_argument("--until", type=float, default=None,
+                        help="The end of the time grid in seconds (default: the last input found).")
+    parser.add_argument("--curves", type=str, default=None, help="Also write the time-to-max curves to this CSV.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the index cache.")
+    args = parser.parse_args()
+
+    results = ResultsIndex(args.root, use_cache=not args.no_cache)
+    until = args.until if args.until is not None else \
+        (results.inputs['dur'].max() / 1_000 if not results.inputs.empty else 0)
+    grid = np.arange(0, until + args.step, args.step)
+    print(f"{len(results.experiments)} experiments, {len(results.inputs)} inputs")
+    unmeasured = results.experiments['name'][results.unmeasured()].tolist()
+    if unmeasured:
+        print(f"{len(unmeasured)} experiment(s) have no costs and are left out of the aggregates (run "
+              f"collect_costs.py): {', '.join(unmeasured)}")
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(results.summarize(args.by, grid))
+    if args.curves is not None:
+        curves = results.time_to_max_curves(grid)
+        with open(args.curves, 'w', newline='') as curves_file:
+            writer = csv.writer(curves_file, lineterminator='\n')
+            writer.writerow(['name'] + [f'{t:g}' for t in grid])
+            for name, curve in zip(results.experiments['name'], curves):
+                writer.writerow([name] + curve.tolist())
@@ -0,0 +1,107 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+A persistent cache of the afl-showmax measurements (cost, hotspot, and coverage) of inputs, kept in a sqlite database.
+A measurement is keyed by the content hash of the input and the identity of the target (see AppRunner.identity), so
+an input is never measured twice against the same binary, whichever experiment (or file name) it comes from. Results
+are committed as they are recorded, thus an interrupted collection resumes where it stopped.
+"""
+
+import time
+import hashlib
+import sqlite3
+from typing import Dict, Iterable, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    sha TEXT NOT NULL,
+    target TEXT NOT NULL,
+    cost INTEGER NOT NULL,
+    hotspot INTEGER NOT NULL,
+    coverage INTEGER NOT NULL,
+    measured REAL NOT NULL,
+    PRIMARY KEY (sha, target)
+) WITHOUT ROWID
+"""
+
+
+def file_sha(path: str) -> str:
+    """
+    :param path: A file.
+    :return: The sha256 hex digest of the file content.
+    """
+    with open(path, 'rb') as input_file:
+        return hashlib.sha256(input_file.read()).hexdigest()
+
+
+class MeasurementCache:
+    """The measurements of inputs against targets.
+
+    :param db_path: The sqlite database file (created if missing).
+    :param commit_every: The number of recorded measurements between two commits.
+    """
+
+    def __init__(self, db_path: str, commit_every: int = 32):
+        """Constructor method
+        """
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self._pending = 0
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+
+    def get(self, sha: str, target: str) -> Optional[Tuple[int, int, int]]:
+        """
+        :param sha: The content hash of the input.
+        :param target: The identity of the target.
+        :return: The (cost, hotspot, coverage) of the input, or None if it was not measured.
+        """
+        row = self._db.execute("SELECT cost, hotspot, coverage FROM measurements WHERE sha = ? AND target = ?",
+                               (sha, target)).fetchone()
+        return None if row is None else tuple(row)
+
+    def get_many(self, shas: Iterable[str], target: str) -> Dict[str, Tuple[int, int, int]]:
+        """
+        :param shas: The content hashes of the inputs.
+        :param target: The identity of the target.
+        :return: The (cost, hotspot, coverage) of each input that was measured, by content hash.
+        """
+        wanted = set(shas)
+        found = {}
+        for sha, cost, hotspot, coverage in self._db.execute(
+                "SELECT sha, cost, hotspot, coverage FROM measurements WHERE target = ?", (target,)):
+            if sha in wanted:
+                found[sha] = (cost, hotspot, coverage)
+        return found
+
+    def put(self, sha: str, target: str, cost: int, hotspot: int, coverage: int):
+        """Record the measurement of an input.
+
+        :param sha: The content hash of the input.
+        :param target: The identity of the target.
+        :param cost: The measured cost (path length).
+        :param hotspot: The measured hotspot.
+        :param coverage: The measured coverage.
+        """
+        self._db.execute("INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?, ?)",
+                         (sha, target, cost, hotspot, coverage, time.time()))
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        """Make the recorded measurements durable.
+        """
+        self._db.commit()
+        self._pending = 0
+
+    def close(self):
+        """Commit and close the database.
+        """
+        self.commit()
+        self._db.close()
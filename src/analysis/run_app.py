@@ -4,6 +4,7 @@ __status__ = "Testing"
 
 import os
 import shutil
+import hashlib
 import subprocess
 from collections import defaultdict
 import warnings
@@ -28,19 +29,45 @@ class AppRunner:
         if shutil.which(self.target_app_bin) is None:  # if the path to binary can't be resolved, throw an error!
             raise RuntimeError(f"The binary given {self.target_app_bin} does not exist!")
         self.timeout_flag = '-t 10000'
+        self._identity = None
+
+    def identity(self) -> str:
+        """
+        An identifier of what a measurement depends on: the content of the binary, its flags, and the timeout. Two
+        runners with the same identity measure the same cost for the same input.
+        :return: A hex digest.
+        """
+        if self._identity is None:
+            digest = hashlib.sha256()
+            with open(shutil.which(self.target_app_bin), 'rb') as binary:
+                for chunk in iter(lambda: binary.read(1 << 20), b''):
+                    digest.update(chunk)
+            digest.update(" ".join([self.timeout_flag] + self.target_flags).encode('utf-8'))
+            self._identity = digest.hexdigest()
+        return self._identity
 
     def run_showmax(self, path_to_input: str) -> tuple:
         """
         Given a file, this method runs the target app using the input file and return the path length, the hotspot,
-        and the coverage count of the input based on target app.
+        and the coverage count of the input based on target app. All three are derived from a single run that dumps
+        the whole perf map (-a): the path length is the sum of the edge hits, the hotspot is the max, and the coverage
+        is the number of edges hit.
         :param path_to_input: input file.
         :return: A tuple of three integers (path_len, hotspot, coverage).
         """
-        if not os.path.isfile(path_to_input):
-            raise RuntimeError(f"The path given {path_to_input} is not for a file!")
+        return self.run_showmax_measurement(path_to_input)[:3]
 
-        return self.run_showmax_path_len(path_to_input), self.run_showmax_hotspot(
-            path_to_input), self.run_showmax_coverage(path_to_input)
+    def run_showmax_measurement(self, path_to_input: str) -> tuple:
+        """
+        The same measurement as run_showmax, and whether afl-showmax succeeded. A failed (or timed out) run gives the
+        partial perf map it dumped, which must not be kept as the measurement of the input (e.g., in a cache).
+        :param path_to_input: input file.
+        :return: A tuple of (path_len, hotspot, coverage, succeeded).
+        """
+        perf_map, succeeded = self._run_showmax_perf_map(path_to_input)
+        if not perf_map:
+            return 0, 0, 0, succeeded
+        return sum(perf_map.values()), max(perf_map.values()), len(perf_map), succeeded
 
     def run_showmax_path_len(self, path_to_input: str) -> int:
         if not os.path.isfile(path_to_input):
@@ -71,6 +98,9 @@ class AppRunner:
         return len(self.run_showmax_perf_map(path_to_input))
 
     def run_showmax_perf_map(self, path_to_input: str) -> dict:
+        return self._run_showmax_perf_map(path_to_input)[0]
+
+    def _run_showmax_perf_map(self, path_to_input: str) -> tuple:
         if not os.path.isfile(path_to_input):
             raise RuntimeError(f"The path given {path_to_input} is not for a file!")
         command = subprocess.run(['afl-showmax', '-a', self.timeout_flag, self.target_app_bin] + self.target_flags +
@@ -87,7 +117,7 @@ class AppRunner:
             perf_map[int(p[0])] = int(p[1])
         # return perf_map
         if command.returncode == 0:
-            return perf_map
+            return perf_map, True
         else:
             warnings.warn(f"Command failed with message: {command.stderr}. On file: {path_to_input}")
-            return perf_map
+            return perf_map, False
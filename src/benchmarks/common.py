@@ -0,0 +1,16 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+What the benchmarks share besides their results (see report).
+"""
+
+
+def first(value):
+    """
+    :param value: A setting of a configuration. A hyper-parameter is a list of values (a single one in the
+        configurations.yaml of an experiment).
+    :return: The first value of a list (a benchmark runs a single configuration), or the setting itself.
+    """
+    return value[0] if isinstance(value, list) else value
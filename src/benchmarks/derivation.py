@@ -0,0 +1,252 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+Microbenchmarks of the derivation steps the search makes on every iteration, without a target (see end_to_end for the
+whole engine). For each grammar of the target apps (target_apps/*/grammars) and each budget (at least the min tokens of
+the grammar, the smaller ones are skipped), the time per call (ns) of:
+    - node_construction: a child MCTSNode derived from a node (MCTSNode.derive).
+    - valid_children: the valid grammar choices of a node (MCTSNode._get_gram_valid_children).
+    - select_random_child / select_biased_child: MCTSNode.select_random_child without and with the bias.
+    - populate_children: the expansion of a node (MCTSNode.populate_children).
+    - rollout / biased_rollout: a full derivation from the root to a terminal (MonteCarloTreeSearch._derive_terminal).
+    - backpropagate@<depth>: the back-propagation from a node at that depth (MonteCarloTreeSearch._backpropagate).
+    - get_ucb1: the UCB1 value of a visited node (MCTSNode.get_ucb1).
+The nodes the steps are timed on are sampled by seeded rollouts, thus two commits time the same nodes:
+
+    python -m benchmarks.derivation --json new.json --baseline old.json
+
+Run it from the src directory (with pygramm on the path).
+"""
+
+import gc
+import os
+import glob
+import time
+import random
+import logging
+import argparse
+import statistics
+from typing import Callable, Dict, List
+
+from pygramm.biased_choice import Bias
+from mcts import grammar_cache
+from mcts.mcts import MonteCarloTreeSearch
+from mcts.mctsnode import MCTSNode
+from mcts.search_context import SearchContext
+from benchmarks import report
+
+BUDGETS = [10, 30, 60, 120]
+"""The default budgets of the derivations."""
+
+BACKPROPAGATE_DEPTHS = [4, 16, 64]
+"""The depths of the nodes back-propagated from (the deepest node up to the depth if a grammar has none at it)."""
+
+GRAMMARS = "../target_apps/*/grammars/*"
+"""The benchmarked grammars (relative to the src directory)."""
+
+
+class _SearchStandIn:
+    """The part of a search the derivation steps need (a search itself needs a target server). The steps are the
+    methods of MonteCarloTreeSearch, thus their current code is what is timed.
+
+    :param root: The root of the tree.
+    :param use_bias: Whether the rollouts use the bias.
+    """
+
+    _derive_terminal = MonteCarloTreeSearch._derive_terminal
+    _backpropagate = MonteCarloTreeSearch._backpropagate
+
+    def __init__(self, root: MCTSNode, use_bias: bool):
+        self.log = logging.getLogger(MonteCarloTreeSearch.__name__)
+        self.root = root
+        self.current = root
+        self.use_bias = use_bias
+        self.allowed_budget = root.budget + root.symbol.min_tokens()
+
+
+def time_per_call(calls: List[Callable[[], object]], min_batch_s: float, repeat: int) -> float:
+    """Time the calls as timeit does (with the garbage collector off), in batches of a few rounds over all of them.
+
+    :param calls: The calls (e.g., the same step on different nodes).
+    :param min_batch_s: The minimal duration of a batch (the rounds of a batch are doubled until it is reached).
+    :param repeat: The number of timed batches.
+    :return: The median time per call in nanoseconds.
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        rounds = 1
+        while True:
+            start = time.perf_counter_ns()
+            for _ in range(rounds):
+                for call in calls:
+                    call()
+            elapsed = time.perf_counter_ns() - start
+            if elapsed >= min_batch_s * 1e9:
+                break
+            rounds *= 2
+        batches = [elapsed]
+        for _ in range(repeat - 1):
+            start = time.perf_counter_ns()
+            for _ in range(rounds):
+                for call in calls:
+                    call()
+            batches.append(time.perf_counter_ns() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return statistics.median(batches) / (rounds * len(calls))
+
+
+def sample_nodes(root: MCTSNode, rollouts: int, use_bias: bool) -> List[MCTSNode]:
+    """
+    :param root: The root of the tree.
+    :param rollouts: The number of rollouts.
+    :param use_bias: Whether the rollouts use the bias.
+    :return: The root and the non-terminal nodes of seeded rollouts from it (each linked to its parents up to the
+        root).
+    """
+    nodes = [] if root.is_terminal() else [root]
+    for _ in range(rollouts):
+        node = root
+        while not node.is_terminal():
+            node = node.select_random_child(using_bias=use_bias)
+            if not node.is_terminal():
+                nodes.append(node)
+    return nodes
+
+
+def _populate(node: MCTSNode):
+    node.get_children().clear()
+    node.populate_children()
+
+
+def bench_grammar(gram_file: str, budget: int, seed: int, samples: int, min_batch_s: float,
+                  repeat: int) -> Dict[str, float]:
+    """Time the derivation steps on one grammar given a budget.
+
+    :param gram_file: The grammar.
+    :param budget: The budget of the derivations.
+    :param seed: The seed of the sampled nodes.
+    :param samples: The number of rollouts the nodes are sampled from.
+    :param min_batch_s: The minimal duration of a timed batch.
+    :param repeat: The number of timed batches.
+    :return: The time per call (ns) of each step.
+    """
+    random.seed(seed)
+    gram, _ = grammar_cache.load_grammar(gram_file)
+    context = SearchContext()
+    root = MCTSNode(budget=budget, text=b"", stack=[gram.start], tokens=0, use_locking=True, bias=Bias(),
+                    context=context)
+    search = _SearchStandIn(root, use_bias=False)
+    biased_search = _SearchStandIn(root, use_bias=True)
+
+    # train the bias a little, so the biased choices are not all uniform
+    for _ in range(samples):
+        terminal = biased_search._derive_terminal(root)
+        if random.random() < 0.2:
+            terminal.bias.reward()
+        else:
+            terminal.bias.penalize()
+
+    nodes = sample_nodes(root, samples, use_bias=False)
+    if not nodes:
+        raise RuntimeError(f"No derivation of {gram_file} within a budget of {budget}")
+    choices = [(node, random.choice(node.get_valid_choices())) for node in nodes]
+
+    # a tree of a few levels with visits, for the UCB1 values
+    frontier = [root]
+    for _ in range(3):
+        expanded = []
+        for node in frontier[:32]:
+            if not node.is_terminal() and node.is_leaf():
+                node.populate_children()
+                expanded.extend(node.get_children())
+        frontier = expanded
+    for node in frontier:
+        search.current = node
+        for _ in range(3):
+            search._backpropagate(random.random())
+    visited = [node for node in frontier if node.get_visits() > 0]
+
+    results = {}
+    results['node_construction'] = time_per_call([lambda n=node, c=choice: n.derive(c) for node, choice in choices],
+                                                 min_batch_s, repeat)
+    results['valid_children'] = time_per_call([node._get_gram_valid_children for node in nodes], min_batch_s, repeat)
+    results['select_random_child'] = time_per_call([lambda n=node: n.select_random_child(using_bias=False)
+                                                    for node in nodes], min_batch_s, repeat)
+    results['select_biased_child'] = time_per_call([lambda n=node: n.select_random_child(using_bias=True)
+                                                    for node in nodes], min_batch_s, repeat)
+    leaves = [node for node in nodes if node is not root]  # the root is expanded for the UCB1 values
+    results['populate_children'] = time_per_call([lambda n=node: _populate(n) for node in leaves or nodes],
+                                                 min_batch_s, repeat)
+    results['rollout'] = time_per_call([lambda: search._derive_terminal(root)], min_batch_s, repeat)
+    results['biased_rollout'] = time_per_call([lambda: biased_search._derive_terminal(root)], min_batch_s, repeat)
+
+    # the depths: the deepest sampled node up to each depth
+    for depth in BACKPROPAGATE_DEPTHS:
+        node = max((node for node in nodes if node.level <= depth), key=lambda n: n.level)
+        walker = _SearchStandIn(root, use_bias=False)
+        walker.current = node
+        results[f'backpropagate@{depth}'] = time_per_call([lambda w=walker: w._backpropagate(0.5)], min_batch_s,
+                                                          repeat)
+    if visited:
+        results['get_ucb1'] = time_per_call([node.get_ucb1 for node in visited], min_batch_s, repeat)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the derivation steps of the search.")
+    parser.add_argument("--grammars", type=str, nargs="+", default=[],
+                        help=f"The grammar files (default: {GRAMMARS}).")
+    parser.add_argument("--budgets", type=int, nargs="+", default=BUDGETS, help="The budgets of the derivations.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the sampled nodes.")
+    parser.add_argument("--samples", type=int, default=50, help="The rollouts the timed nodes are sampled from.")
+    parser.add_argument("--min-batch-ms", type=float, default=20, help="The minimal duration of a timed batch.")
+    parser.add_argument("--repeat", type=int, default=5, help="The number of timed batches of each step.")
+    parser.add_argument("--json", type=str, default="", help="Write the result to this JSON file.")
+    parser.add_argument("--baseline", type=str, default="", help="Compare with the JSON result of an earlier run.")
+    parser.add_argument("--compare-all", action="store_true", help="Compare every grammar and budget with the baseline "
+                                                                   "(default: the geometric mean of each step).")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    gram_files = args.grammars or sorted(glob.glob(GRAMMARS))
+    runs: Dict[str, Dict[str, Dict[str, float]]] = {}
+    summary = {}
+    for gram_file in gram_files:
+        gram_name = os.path.basename(gram_file)
+        runs[gram_name] = {}
+        min_tokens = grammar_cache.load_grammar(gram_file)[0].start.min_tokens()
+        for budget in args.budgets:
+            if budget < min_tokens:  # no derivation of the grammar fits in the budget
+                print(f"{gram_name:<32} budget {budget:>4}: skipped (below the {min_tokens} min tokens of the grammar)")
+                runs[gram_name][str(budget)] = dict(skipped=f"below the {min_tokens} min tokens of the grammar")
+                continue
+            try:
+                results = bench_grammar(gram_file, budget, args.seed, args.samples, args.min_batch_ms / 1000,
+                                        args.repeat)
+            except Exception as e:
+                print(f"{gram_name:<32} budget {budget:>4}: failed: {e!r}")
+                runs[gram_name][str(budget)] = dict(error=repr(e))
+                continue
+            runs[gram_name][str(budget)] = results
+            print(f"{gram_name:<32} budget {budget:>4}: " +
+                  ", ".join(f"{name} {ns:,.0f}" for name, ns in results.items()) + " (ns/call)")
+            summary.update({f"{gram_name}/{budget}/{name}": ns for name, ns in results.items()})
+
+    # the geometric mean of each step over the grammars and budgets (a single number per step to track)
+    steps = sorted({key.rsplit('/', 1)[1] for key in summary})
+    for step in steps:
+        values = [ns for key, ns in summary.items() if key.rsplit('/', 1)[1] == step and ns > 0]
+        summary[f"geomean/{step}"] = statistics.geometric_mean(values)
+        print(f"geomean {step:<24} {summary[f'geomean/{step}']:>12,.0f} ns/call")
+
+    if args.json:
+        report.write_result(args.json, dict(benchmark="derivation", budgets=args.budgets, seed=args.seed,
+                                            samples=args.samples, runs=runs, summary=summary))
+    if args.baseline:
+        compared = [key for key in summary if args.compare_all or key.startswith("geomean/")]
+        print("\n".join(report.compare(summary, args.baseline, {key: False for key in compared})))
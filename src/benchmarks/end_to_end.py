@@ -0,0 +1,248 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+Benchmark the whole engine end to end (derivation, search, and the socket round trip) against a synthetic target (see
+synthetic_target) instead of an instrumented application, thus without Docker or AFL. Each grammar of the target apps
+(target_apps/*/grammars) is searched by each algorithm for a number of iterations, and each search reports:
+    - execs_per_s: the executions per second.
+    - nodes_per_s: the tree nodes created per second (the random search builds no tree).
+    - peak_rss_mb: the peak resident memory of the search process (each search runs in a fresh process).
+    - time_to_known_max_s: the time to first reach the known max of the grammar, i.e., the max cost found by any of the
+      searches of the grammar in this benchmark (also as execs_to_known_max).
+The searches are seeded and the synthetic target is deterministic, thus two commits with the same search behaviour
+make the exact same executions, and their numbers are comparable:
+
+    python -m benchmarks.end_to_end --iterations 2000 --json new.json --baseline old.json
+
+Run it from the src directory (with pygramm on the path). The search settings (c, e, budget, ...) are the first values
+of the configuration file (defaults.yaml).
+"""
+
+import os
+import sys
+import glob
+import time
+import codecs
+import contextlib
+import logging
+import argparse
+import resource
+import subprocess
+import multiprocessing
+import tempfile
+from typing import Dict, List, Optional, Tuple, Union
+
+import synthetic_target
+import configuration_loader
+from mcts import grammar_cache
+from mcts.mcts import MonteCarloTreeSearch
+from mcts.search_context import SearchContext
+from executors import Executor
+from targetAppConnect import InputHandler
+from benchmarks import report
+from benchmarks.common import first
+
+ALGORITHMS = ['treeline', 'random']
+"""The benchmarked search algorithms."""
+
+GRAMMARS = "../target_apps/*/grammars/*"
+"""The benchmarked grammars (relative to the src directory)."""
+
+HIGHER_IS_BETTER = dict(execs_per_s=True, nodes_per_s=True, peak_rss_mb=False, time_to_known_max_s=False)
+"""The numbers of a search compared with a baseline."""
+
+
+class _TimedExecutor:
+    """An executor that records when each new max cost was found (seconds and executions since the search started).
+
+    :param executor: The connection to the target server.
+    """
+
+    def __init__(self, executor: Executor):
+        self.executor = executor
+        self.max_cost = 0
+        self.executions = 0
+        self.history: List[Tuple[float, int, int]] = []  # (seconds, executions, cost) of each new max cost
+        self._start = time.perf_counter()
+
+    def restart(self):
+        """Count the time, executions, and max cost from now on (e.g., after the dry run).
+        """
+        self.max_cost, self.executions, self.history = 0, 0, []
+        self._start = time.perf_counter()
+
+    def elapsed(self) -> float:
+        """
+        :return: The seconds since the search started.
+        """
+        return time.perf_counter() - self._start
+
+    def run_input(self, test_case: Union[str, bytes], run_type: str = "nml") -> Tuple[int, int, bool, int]:
+        cost, hnb, hnm, hs = self.executor.run_input(test_case, run_type=run_type)
+        self.executions += 1
+        if cost > self.max_cost:
+            self.max_cost = cost
+            self.history.append((self.elapsed(), self.executions, cost))
+        return cost, hnb, hnm, hs
+
+    def is_connected(self) -> bool:
+        return self.executor.is_connected()
+
+    def open_connection(self):
+        self.executor.open_connection()
+
+    def close_connection(self):
+        self.executor.close_connection()
+
+
+def run_search(config: dict, gram_file: str, algorithm: str, iterations: int, seed: int, port: int) -> dict:
+    """Run one search against the synthetic target (in the calling process).
+
+    :param config: The search settings.
+    :param gram_file: The grammar.
+    :param algorithm: The search algorithm (see ALGORITHMS).
+    :param iterations: The number of iterations (executions) of the search.
+    :param seed: The seed of the search.
+    :param port: The port of the synthetic target server.
+    :return: The numbers of the search, and its history of new max costs.
+    """
+    logging.disable(logging.WARNING)  # the search logs its findings, not part of what is measured
+    gram, _ = grammar_cache.load_grammar(gram_file)
+    executor = _TimedExecutor(InputHandler(port=port))
+    context = SearchContext(c=first(config['c']), e=first(config['e']),
+                            literal_encoding=codecs.lookup(config.get('literal_encoding', 'utf-8')).name,
+                            input_handler=executor)
+    with tempfile.TemporaryDirectory() as output_dir:
+        mcts = MonteCarloTreeSearch(gram=gram, output_dir=output_dir + "/", expr_id="end-to-end",
+                                    budget=first(config['budget']), reward_type=first(config['reward_type']),
+                                    use_locking=first(config['lock']), use_bias=first(config['use_bias']),
+                                    tail_len=first(config['tail_len']),
+                                    max_threshold=first(config['max_cutting_threshold']),
+                                    threshold_decay=first(config['threshold_decay_rate']),
+                                    surrogate_candidates=config.get('surrogate_candidates', 1),
+                                    surrogate_exploration=config.get('surrogate_exploration', 0.2),
+                                    profile_phases=config.get('profile_phases', True), progress_bar_hz=0, seed=seed,
+                                    context=context)
+        mcts.dry_run()
+        executor.restart()
+        if algorithm == 'treeline':
+            mcts.treeline(False, num_iter=iterations)
+        elif algorithm == 'random':
+            mcts.random_search(False, num_iter=iterations)
+        else:
+            raise RuntimeError(f"Unknown algorithm {algorithm}")
+        seconds = executor.elapsed()
+        nodes = int(mcts.report_dict['Stats: # total edges'] or 0)
+    context.close()
+    return dict(seconds=seconds, executions=executor.executions, execs_per_s=executor.executions / seconds,
+                nodes=nodes, nodes_per_s=nodes / seconds,
+                peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # KB on linux
+                max_cost=executor.max_cost, history=executor.history)
+
+
+def _run_search_in_process(args: tuple) -> dict:
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):  # the progress prints
+            return run_search(*args)
+    except Exception as e:  # e.g., a grammar that can't be derived within the budget, keep benchmarking the others
+        return dict(error=repr(e))
+
+
+def time_to_known_max(history: List[Tuple[float, int, int]], known_max: int) -> Tuple[Optional[float], Optional[int]]:
+    """
+    :param history: The new max costs of a search as (seconds, executions, cost).
+    :param known_max: The known max cost.
+    :return: The seconds and the executions it took the search to reach the known max (None if it never did).
+    """
+    for seconds, executions, cost in history:
+        if cost >= known_max:
+            return seconds, executions
+    return None, None
+
+
+def start_server(model: str, constructs: List[str]) -> Tuple[subprocess.Popen, int]:
+    """Start the synthetic target server in its own process (it must not share the interpreter of the search).
+
+    :param model: The cost model.
+    :param constructs: The constructs of the 'constructs' model (as CONSTRUCT=WEIGHT).
+    :return: The server process and its port.
+    """
+    command = [sys.executable, "-m", "synthetic_target", "--port", "0", "--model", model]
+    for construct in constructs:
+        command += ["--construct", construct]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                              cwd=os.path.dirname(os.path.abspath(synthetic_target.__file__)))
+    line = server.stdout.readline()
+    if not line:
+        raise RuntimeError(f"The synthetic target server did not start ({' '.join(command)})")
+    return server, int(line.rsplit(':', 1)[1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the search end to end against a synthetic target.")
+    parser.add_argument("--grammars", type=str, nargs="+", default=[],
+                        help=f"The grammar files (default: {GRAMMARS}).")
+    parser.add_argument("--algorithms", type=str, nargs="+", default=ALGORITHMS, choices=ALGORITHMS,
+                        help="The search algorithms.")
+    parser.add_argument("--iterations", type=int, default=2000, help="The iterations of a search.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the searches.")
+    parser.add_argument("--model", type=str, default="depth", choices=synthetic_target.COST_MODELS,
+                        help="The synthetic cost model.")
+    parser.add_argument("--construct", type=str, action="append", default=[],
+                        help="A construct of the 'constructs' model as CONSTRUCT=WEIGHT (can be repeated).")
+    parser.add_argument("--config", type=str, default="defaults.yaml", help="The search settings.")
+    parser.add_argument("--budget", type=int, default=0, help="The budget of the searches (0 takes the config one).")
+    parser.add_argument("--json", type=str, default="", help="Write the result to this JSON file.")
+    parser.add_argument("--baseline", type=str, default="", help="Compare with the JSON result of an earlier run.")
+    args = parser.parse_args()
+
+    settings = configuration_loader.Settings()
+    settings.read_yaml(open(args.config))
+    configurations = settings.values
+    if args.budget:
+        configurations['budget'] = args.budget
+    gram_files = args.grammars or sorted(glob.glob(GRAMMARS))
+
+    server, port = start_server(args.model, args.construct)
+    runs: Dict[str, Dict[str, dict]] = {}
+    try:
+        # a fresh process per search: its peak memory is its own, and no search inherits the garbage of another
+        with multiprocessing.get_context('fork').Pool(processes=1, maxtasksperchild=1) as pool:
+            for gram_file in gram_files:
+                gram_name = os.path.basename(gram_file)
+                runs[gram_name] = {}
+                for algorithm in args.algorithms:
+                    run = pool.apply(_run_search_in_process, ((configurations, gram_file, algorithm, args.iterations,
+                                                               args.seed, port),))
+                    runs[gram_name][algorithm] = run
+                    if 'error' in run:
+                        print(f"{gram_name:<32} {algorithm:<9} failed: {run['error']}")
+    finally:
+        server.terminate()
+        server.wait()
+
+    summary = {}
+    for gram_name, gram_runs in runs.items():
+        known_max = max((run['max_cost'] for run in gram_runs.values() if 'error' not in run), default=0)
+        for algorithm, run in gram_runs.items():
+            if 'error' in run:
+                continue
+            run['known_max'] = known_max
+            run['time_to_known_max_s'], run['execs_to_known_max'] = time_to_known_max(run.pop('history'), known_max)
+            to_max = "never" if run['time_to_known_max_s'] is None else \
+                f"{run['time_to_known_max_s']:.2f} s ({run['execs_to_known_max']:,} execs)"
+            print(f"{gram_name:<32} {algorithm:<9} {run['execs_per_s']:>9,.1f} execs/s {run['nodes_per_s']:>10,.1f} "
+                  f"nodes/s {run['peak_rss_mb']:>7,.1f} MB  max {run['max_cost']:,} of {known_max:,}, "
+                  f"reached in {to_max}")
+            for name in HIGHER_IS_BETTER:
+                if run[name] is not None:
+                    summary[f"{gram_name}/{algorithm}/{name}"] = run[name]
+
+    if args.json:
+        report.write_result(args.json, dict(benchmark="end_to_end", model=args.model, constructs=args.construct,
+                                            seed=args.seed, iterations=args.iterations, runs=runs, summary=summary))
+    if args.baseline:
+        higher_is_better = {key: HIGHER_IS_BETTER[key.rsplit('/', 1)[1]] for key in summary}
+        print("\n".join(report.compare(summary, args.baseline, higher_is_better)))
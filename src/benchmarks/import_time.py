@@ -0,0 +1,105 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+The import-time budget of the search modules. Each module is imported in a fresh interpreter (python -X importtime)
+where any connection attempt is refused and recorded, and the check fails if a module:
+    - takes longer than the budget to import (the best of a few runs),
+    - tries to connect (e.g., to the target server), or
+    - pulls in a heavy dependency that should only be imported on first use (e.g., pandas or graphviz).
+
+Run it from the src directory (with pygramm on the path):
+    python -m benchmarks.import_time [--budget-ms 150] [--repeat 5] [modules ...]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+MODULES = ['mcts.mctsnode', 'mcts.mcts', 'helpers', 'collect_costs', 'treeline']
+"""The modules checked by default (the search engine and the tools built on it)."""
+
+HEAVY_MODULES = ['pandas', 'numpy', 'graphviz', 'psutil', 'requests', 'tdigest']
+"""The dependencies that must not be imported by the modules above (they are imported where they are used)."""
+
+_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = """
+import sys, json, socket
+attempts = []
+def _refuse(self, address):
+    attempts.append(repr(address))
+    raise ConnectionRefusedError("no connection at import")
+socket.socket.connect = _refuse
+import {module}
+print(json.dumps({{'connects': attempts, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module: str) -> Tuple[float, List[str], List[str]]:
+    """Import a module in a fresh interpreter.
+
+    :param module: The module name (e.g., mcts.mcts).
+    :return: A tuple of (the cumulative import time in ms, the connection attempts, the heavy modules imported).
+    """
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", _CHILD.format(module=module,
+                                                                                     heavy=HEAVY_MODULES)],
+                           cwd=_SRC_DIR, capture_output=True, text=True)
+    if child.returncode != 0:
+        raise RuntimeError(f"Could not import {module}:\n{child.stderr[-2000:]}")
+
+    # the lines are "import time: self [us] | cumulative | imported package", the top-level ones are not indented
+    cumulative_us = None
+    for line in child.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].rstrip() == f" {module}":
+            cumulative_us = int(parts[1])
+    if cumulative_us is None:
+        raise RuntimeError(f"No import time reported for {module}")
+    report = json.loads(child.stdout.strip().splitlines()[-1])
+    return cumulative_us / 1_000, report['connects'], report['heavy']
+
+
+def check(modules: List[str], budget_ms: float, repeat: int) -> Dict[str, dict]:
+    """
+    :param modules: The modules to import.
+    :param budget_ms: The allowed import time of each module.
+    :param repeat: The number of fresh imports per module (the best one is kept).
+    :return: The results by module: import time in ms, connection attempts, heavy modules, and whether it passed.
+    """
+    results = {}
+    for module in modules:
+        runs = [measure_import(module) for _ in range(max(repeat, 1))]
+        ms = min(run[0] for run in runs)
+        connects = sorted({attempt for run in runs for attempt in run[1]})
+        heavy = sorted({name for run in runs for name in run[2]})
+        results[module] = dict(ms=ms, connects=connects, heavy=heavy,
+                               passed=ms <= budget_ms and not connects and not heavy)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the import time (and side effects) of the search modules.")
+    parser.add_argument("modules", type=str, nargs="*", default=MODULES, help="The modules to check.")
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="The allowed import time of each module.")
+    parser.add_argument("--repeat", type=int, default=5, help="The fresh imports per module (the best is kept).")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    args = parser.parse_args()
+
+    results = check(args.modules, args.budget_ms, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for module, result in results.items():
+            status = "ok" if result['passed'] else "FAIL"
+            notes = ""
+            if result['connects']:
+                notes += f" connects to {', '.join(result['connects'])}"
+            if result['heavy']:
+                notes += f" imports {', '.join(result['heavy'])}"
+            print(f"{status:>4} {module:<20} {result['ms']:8.1f} ms (budget {args.budget_ms:.0f} ms){notes}")
+    sys.exit(0 if all(result['passed'] for result in results.values()) else 1)
@@ -0,0 +1,56 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+The results of a benchmark as JSON, and their comparison with the results of an earlier run (e.g., of another commit).
+A result is a dictionary with a 'summary' of numbers (e.g., {"iterations_per_s": 812.5, "rss_mb": 91.2}).
+"""
+
+import json
+import platform
+import subprocess
+from typing import Dict, List
+
+
+def environment() -> dict:
+    """
+    :return: What a result depends on besides the code: the python version, the machine, and the git commit.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return dict(python=platform.python_version(), machine=platform.machine(), node=platform.node(), commit=commit)
+
+
+def write_result(file_path: str, result: dict):
+    """
+    :param file_path: The JSON file.
+    :param result: The result (with its environment added).
+    """
+    with open(file_path, 'w') as result_file:
+        json.dump(dict(result, environment=environment()), result_file, indent=2)
+
+
+def compare(summary: Dict[str, float], baseline_file: str, higher_is_better: Dict[str, bool]) -> List[str]:
+    """Compare the summary of a result with the one of a baseline result.
+
+    :param summary: The summary of the current result.
+    :param baseline_file: The JSON file of the baseline result (see write_result).
+    :param higher_is_better: The compared numbers, each with whether a higher value is an improvement.
+    :return: A line per compared number: baseline, current, and the relative change.
+    """
+    with open(baseline_file) as result_file:
+        baseline = json.load(result_file)
+    lines = [f"compared with {baseline_file} (commit {baseline.get('environment', {}).get('commit') or '?'})"]
+    for name, higher in higher_is_better.items():
+        old, new = baseline.get('summary', {}).get(name), summary.get(name)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        better = change > 0 if higher else change < 0
+        verdict = "" if abs(change) < 1 else (" (better)" if better else " (worse)")
+        lines.append(f"  {name:<24} {old:>12,.2f} -> {new:>12,.2f} {change:+7.1f}%{verdict}")
+    return lines
@@ -0,0 +1,138 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+Benchmark the search itself (the Python side of an iteration) by replaying a recorded experiment without its target.
+The experiment must have been run with record_executions (see replay), its configurations.yaml gives the search
+settings. The search is re-run a few times with the same seed against the recorded answers, and the speed
+(iterations/s), memory, and allocations are reported. Since the runs are seeded, they make the exact same executions
+(same fingerprint), thus the numbers of two commits are comparable:
+
+    python -m benchmarks.search_replay <experiment-dir> --json new.json --baseline old.json
+
+Run it from the src directory (with pygramm on the path).
+"""
+
+import gc
+import sys
+import time
+import codecs
+import logging
+import argparse
+import statistics
+import tempfile
+import tracemalloc
+from typing import Optional
+
+import replay
+import configuration_loader
+from mcts import grammar_cache
+from mcts.mcts import MonteCarloTreeSearch
+from mcts.search_context import SearchContext
+from mcts.tree_stats import process_rss
+from benchmarks import report
+from benchmarks.common import first
+
+HIGHER_IS_BETTER = dict(iterations_per_s=True, rss_mb=False, peak_traced_mb=False, allocated_blocks=False)
+"""The summary numbers compared with a baseline."""
+
+
+def run_replay(config: dict, recording: str, iterations: int, seed: Optional[int], model: str,
+               trace_allocations: bool) -> dict:
+    """Replay one search.
+
+    :param config: The configurations of the recorded experiment.
+    :param recording: The recorded executions.
+    :param iterations: The number of iterations (executions) of the search.
+    :param seed: The seed of the search.
+    :param model: The replay model of the unseen inputs (see replay.REPLAY_MODELS).
+    :param trace_allocations: If True, the allocations of the search are traced (slower).
+    :return: The numbers of the run.
+    """
+    gram, _ = grammar_cache.load_grammar(first(config['grams']))
+    executor = replay.ReplayExecutor(recording, model=model)
+    context = SearchContext(c=first(config['c']), e=first(config['e']),
+                            literal_encoding=codecs.lookup(config.get('literal_encoding', 'utf-8')).name,
+                            input_handler=executor)
+    algorithm = first(config['algorithm'])
+    with tempfile.TemporaryDirectory() as output_dir:
+        mcts = MonteCarloTreeSearch(gram=gram, output_dir=output_dir + "/", expr_id="search-replay",
+                                    budget=first(config['budget']), reward_type=first(config['reward_type']),
+                                    use_locking=first(config['use_locking']), use_bias=first(config['use_bias']),
+                                    tail_len=first(config['tail_len']),
+                                    max_threshold=first(config['max_cutting_threshold']),
+                                    threshold_decay=first(config['threshold_decay_rate']),
+                                    surrogate_candidates=config.get('surrogate_candidates', 1),
+                                    surrogate_exploration=config.get('surrogate_exploration', 0.2),
+                                    progress_bar_hz=0, seed=seed, context=context)
+        mcts.dry_run()
+        gc.collect()
+        if trace_allocations:
+            tracemalloc.start()
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        if algorithm == 'treeline':
+            mcts.treeline(False, num_iter=iterations)
+        elif algorithm == 'random':
+            mcts.random_search(False, num_iter=iterations)
+        else:
+            raise RuntimeError(f"Unknown algorithm {algorithm}")
+        seconds = time.perf_counter() - start
+        result = dict(seconds=seconds, iterations=mcts.exec_count, iterations_per_s=mcts.exec_count / seconds,
+                      rss_mb=process_rss() / 1_048_576, allocated_blocks=sys.getallocatedblocks() - blocks,
+                      max_cost=mcts.max_observed_cost, fingerprint=executor.fingerprint(),
+                      replayed=executor.replayed, repeated=executor.repeated, unseen=executor.unseen)
+        if trace_allocations:
+            result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1_048_576
+            tracemalloc.stop()
+    del mcts
+    gc.collect()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the search by replaying a recorded experiment.")
+    parser.add_argument("experiment", type=str, help="The output dir of an experiment run with record_executions.")
+    parser.add_argument("--iterations", type=int, default=0, help="The iterations of a run (0 takes the recorded "
+                                                                  "num_iter).")
+    parser.add_argument("--seed", type=int, default=None, help="The seed of the runs (default: the recorded seed, "
+                                                               "or 0).")
+    parser.add_argument("--model", type=str, default="nearest", choices=replay.REPLAY_MODELS,
+                        help="The cost of the inputs the recording does not have.")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of runs.")
+    parser.add_argument("--trace-allocations", action="store_true", help="Trace the allocations (peak traced memory).")
+    parser.add_argument("--json", type=str, default="", help="Write the result to this JSON file.")
+    parser.add_argument("--baseline", type=str, default="", help="Compare with the JSON result of an earlier run.")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # the search logs its findings, not part of what is measured
+
+    settings = configuration_loader.Settings()
+    settings.read_yaml(open(f"{args.experiment}/configurations.yaml"))
+    configurations = settings.values
+    iterations = args.iterations or first(configurations['num_iter'])
+    seed = args.seed if args.seed is not None else (configurations.get('seed') or 0)
+    recording = f"{args.experiment}/{replay.RECORDING_FILE_NAME}"
+
+    runs = []
+    for run in range(args.repeat):
+        runs.append(run_replay(configurations, recording, iterations, seed, args.model, args.trace_allocations))
+        print(f"run {run + 1}: {runs[-1]['iterations']:,} iterations in {runs[-1]['seconds']:.2f} s "
+              f"({runs[-1]['iterations_per_s']:,.1f}/s), max cost {runs[-1]['max_cost']:,}, "
+              f"{runs[-1]['unseen']:,} unseen input(s)")
+
+    summary = dict(iterations_per_s=statistics.median(r['iterations_per_s'] for r in runs),
+                   rss_mb=max(r['rss_mb'] for r in runs),
+                   allocated_blocks=statistics.median(r['allocated_blocks'] for r in runs))
+    if args.trace_allocations:
+        summary['peak_traced_mb'] = statistics.median(r['peak_traced_mb'] for r in runs)
+    deterministic = len({r['fingerprint'] for r in runs}) == 1
+    print(f"median {summary['iterations_per_s']:,.1f} iterations/s, max rss {summary['rss_mb']:,.1f} MB, "
+          f"deterministic: {deterministic}")
+
+    if args.json:
+        report.write_result(args.json, dict(benchmark="search_replay", experiment=args.experiment, seed=seed,
+                                            iterations=iterations, model=args.model, runs=runs, summary=summary,
+                                            deterministic=deterministic))
+    if args.baseline:
+        print("\n".join(report.compare(summary, args.baseline, HIGHER_IS_BETTER)))
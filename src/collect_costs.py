@@ -7,19 +7,40 @@ A helper script to collect the cost of experiment(s) and save them
 to an easy to process CSV file.
 
 It is important to know that this could be expensive in terms of time. 
-The script will run each input 3-times collecting all possible information. 
-And if the majority of the inputs are timing out, then each run will spend
-the timeout duration x 3. 
+The script runs each input once (collecting the cost, hotspot, and coverage
+from the same run), and runs as many inputs in parallel as there are CPUs
+(see --jobs). If the majority of the inputs are timing out, then each run
+will spend the timeout duration.
+
+The measurements are cached by the content of the input and the identity of
+the target binary (see --cache), so re-running the script (e.g., after it was
+interrupted, or after adding an experiment) only runs the inputs that were
+never measured against that binary.
 
 TODO: replace this script with the inputs name parser script.  
 """
 
 import os
+import csv
 import argparse
-from collections import defaultdict
+import multiprocessing
 
 import helpers as helper
 from analysis.run_app import AppRunner
+from analysis.measure_cache import MeasurementCache, file_sha
+from mcts.corpus import CORPUS_DIR_NAME, is_corpus_dir
+
+
+_runner = None  # the app runner of a worker process
+
+
+def _init_runner(target: str):
+    global _runner
+    _runner = AppRunner(target)
+
+
+def _run_input(path_to_input: str) -> tuple:
+    return _runner.run_showmax_measurement(path_to_input)
 
 
 if __name__ == "__main__":
@@ -28,6 +49,12 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Command line utility for afl-showmax bulk runner.")
     parser.add_argument("dir", type=str, help="The directory to the experiment(s) for which inputs to be ran.")
     parser.add_argument("target", type=str, help="Target-App binary file")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="The number of inputs ran in parallel (default: the number of CPUs).")
+    parser.add_argument("--cache", type=str, default=None,
+                        help="The measurements cache (default: measurements.sqlite in the experiments directory).")
+    parser.add_argument("--link", action="store_true",
+                        help="Also hardlink the inputs with their normalized names in the inputs dir of each expr.")
 
     # get arguments
     args = parser.parse_args()
@@ -40,7 +67,7 @@ if __name__ == "__main__":
         raise RuntimeError(f'The path given in dir "{args.dir}" is not a directory')
     single_expr = False
     if os.path.exists(args.dir + '/queue') or os.path.exists(args.dir + '/buffer') or \
-            os.path.exists(args.dir + '/list'):
+            os.path.exists(args.dir + '/list') or is_corpus_dir(args.dir + f'/{CORPUS_DIR_NAME}'):
         expr_dir = [os.path.dirname(args.dir).split('/')[-1]]
         args.dir = os.path.join(os.path.dirname(os.path.dirname(args.dir)))  # parent dir
         single_expr = True
@@ -50,13 +77,17 @@ if __name__ == "__main__":
         expr_dir = []  # expr sub-dir only
         for d in sub_dir:
             if os.path.exists(args.dir + f'/{d}' + '/queue') or os.path.exists(args.dir + f'/{d}' + '/buffer') or \
-                    os.path.exists(args.dir + f'/{d}' + '/list'):
+                    os.path.exists(args.dir + f'/{d}' + '/list') or is_corpus_dir(args.dir + f'/{d}/{CORPUS_DIR_NAME}'):
                 expr_dir.append(d)
     if not expr_dir:
-        raise RuntimeError(f"Could not find queue/buffer dir in {args.dir} or any of its sub-directories.")
+        raise RuntimeError(f"Could not find queue/buffer/list/corpus dir in {args.dir} or any of its sub-directories.")
 
-    # Copy inputs into new dirs and files with fixed names without losing important information
-    helper.prep_expr_for_showmax(args.dir, expr_dir)
+    # the measurements of earlier collections (of any experiment) against the same target are reused.
+    cache = MeasurementCache(args.cache or os.path.join(args.dir, 'measurements.sqlite'))
+    target = ar.identity()
+
+    # List the inputs with fixed names without losing important information (nothing is copied)
+    helper.prep_expr_for_showmax(args.dir, expr_dir, link=args.link)
     expr_dir = helper.get_expr_dirs(args.dir)
 
     for expr in expr_dir:
@@ -65,41 +96,48 @@ if __name__ == "__main__":
             expr_info = file.read().replace('\n', '')
 
         print(f'Collecting data for {expr_info} in file {expr} ...')
-        report = defaultdict(list)
 
         # we can get the name of the tool from the expr_info, but do we need it?
 
-        # get names of all files in queue/buffer
-        inputs = [f.name for f in os.scandir(args.dir + f'/{expr}/inputs') if f.is_file()]
-
-        for file_name in sorted(inputs):
-            # collect data from the file name
-            indicators = file_name.split(',')
-
-            # collect and store the data from name
-            for indicator in indicators:  # e.g. id:****, exec:****, ... etc
-                broken_indicator = indicator.split(':')
-                if len(broken_indicator) != 2:
-                    raise RuntimeError(f'Unexpected file name pattern {broken_indicator}')
-                indicator_id, indicator_val = broken_indicator
-                report[indicator_id].append(indicator_val)
-
-            # collect data from the file system stat (timestamp, size-bytes)
-            report['mtime(seconds)'].append(os.path.getmtime(args.dir + f'/{expr}/inputs' + f'/{file_name}'))
-            report['size(byte)'].append(os.path.getsize(args.dir + f'/{expr}/inputs' + f'/{file_name}'))
-
-            # collect data by running the input (cost, hotspot, coverage)
-            pl, hs, cov = ar.run_showmax(args.dir + f'/{expr}/inputs' + f'/{file_name}')
-            report['cost'].append(pl)
-            report['hotspot'].append(hs)
-            report['coverage'].append(cov)
-
-        # validate that headers have list of the same size
-        base_array_size = len(report['id'])
-        for k, v in report.items():
-            if len(v) != base_array_size:
-                raise \
-                    RuntimeError(f'The key {k}, has {len(v)} items that does not match the base size {base_array_size}')
-
-        helper.write_dict_to_csv(report, output_dir=f'{args.dir}', file_name=f'{expr_info}')
+        # the inputs (and the data from their names) as listed in the manifest of the expr.
+        manifest = helper.read_manifest(f'{args.dir}/{expr}')
+        header = helper.MANIFEST_COLUMNS[:-1]  # all but the path
+        name_values = [[row[column] for column in header] for row in manifest]
+        paths = [os.path.join(args.dir, row['path']) for row in manifest]
+
+        # collect data by running the inputs (cost, hotspot, coverage) that are not in the cache yet, each distinct
+        # content once and in parallel. Each result is recorded in the cache as it comes back, except the failed (or
+        # timed out) runs: their partial measurement goes to this CSV only, and they are measured again next time.
+        shas = [file_sha(path) for path in paths]
+        measured = cache.get_many(shas, target)
+        missing = {}  # content hash -> the first input with that content
+        for sha, path in zip(shas, paths):
+            if sha not in measured and sha not in missing:
+                missing[sha] = path
+        print(f'{len(paths)} inputs: {len(paths) - len(missing)} already measured, measuring {len(missing)} ...')
+        if missing:
+            with multiprocessing.Pool(processes=args.jobs, initializer=_init_runner, initargs=(args.target,)) as pool:
+                failed = 0
+                for sha, (*result, succeeded) in zip(missing, pool.imap(_run_input, missing.values(), chunksize=8)):
+                    if succeeded:
+                        cache.put(sha, target, *result)
+                    else:
+                        failed += 1
+                    measured[sha] = tuple(result)
+            cache.commit()
+            if failed:
+                print(f'{failed} run(s) failed or timed out, their measurements are not cached')
+
+        # build the CSV from the cache (replacing any older one at once).
+        csv_path = f'{args.dir}{expr_info}.csv'
+        with open(f'{csv_path}.tmp', 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file, lineterminator='\n')
+            writer.writerow(header + ['mtime(seconds)', 'size(byte)', 'cost', 'hotspot', 'coverage'])
+            for path, sha, values in zip(paths, shas, name_values):
+                # collect data from the file system stat (timestamp, size-bytes)
+                stat = os.stat(path)
+                writer.writerow(values + [stat.st_mtime, stat.st_size, *measured[sha]])
+        os.replace(f'{csv_path}.tmp', csv_path)
         # FIXME: remove all the expr dirs we just created.
+
+    cache.close()
@@ -29,6 +29,10 @@ class Settings:
         """
         return self.values.get(item)
 
+    def get(self, item: str, default: object = None) -> object:
+        """Like dict.get, for settings that older configuration files might not have."""
+        return self.values.get(item, default)
+
     def __setitem__(self, key: str, value: object):
         self.values[key] = value
 
@@ -0,0 +1,204 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+The executors a search runs its inputs on (see MCTSNode.run and SearchContext). An executor is any object with the
+methods of the Executor protocol (the ones of targetAppConnect.InputHandler): run_input returns the (cost, hnb, hnm,
+hs) of an input, and the connection methods start and end the executions of an experiment. The backends (see
+EXECUTOR_BACKENDS):
+    - 'socket': the patched afl-socket server of an instrumented target (targetAppConnect.InputHandler), one per port.
+    - 'showmax': a pool of afl-showmax processes run on the target directly (ShowmaxPoolExecutor), no server and no
+      port, only AFL installed. The hnb and hnm bookkeeping afl-socket does is done here (FeedbackState).
+The recording and replay executors (see replay) wrap or replace either of them.
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import itertools
+import threading
+from typing import Dict, Optional, Protocol, Tuple, Union
+
+from analysis.run_app import AppRunner
+from targetAppConnect import InputHandler, _MAX_INPUT_SIZE
+
+EXECUTOR_BACKENDS = ['socket', 'showmax']
+"""The executors of the inputs of a search."""
+
+# the AFL count classes of the hits of an edge (see count_class_lookup8 in afl-fuzz.c)
+_COUNT_CLASS_BOUNDS = (1, 2, 3, 4, 8, 16, 32, 128)
+
+
+def count_class(hits: int) -> int:
+    """
+    :param hits: The hits of an edge.
+    :return: The AFL count class of the hits (a bit per class, 0 for no hits).
+    """
+    cls = 0
+    for i, bound in enumerate(_COUNT_CLASS_BOUNDS):
+        if hits >= bound:
+            cls = 1 << i
+    return cls
+
+
+class FeedbackState:
+    """The state afl-socket keeps for an experiment, and the feedback of a run given it: the max hits of each edge
+    (max_counts) and the count classes each edge was hit with (the inverse of the AFL virgin bits).
+    """
+
+    def __init__(self):
+        """Constructor method
+        """
+        self.max_counts: Dict[int, int] = {}
+        self.coverage: Dict[int, int] = {}
+
+    def update(self, perf_map: Dict[int, int], run_type: str = "nml") -> Tuple[int, int, bool, int]:
+        """The feedback of a run, and the state updated with it (unless it is a warmup run).
+
+        :param perf_map: The hits of each edge of the run (e.g., from afl-showmax -a).
+        :param run_type: "wup" (warmup) leaves the state as it is.
+        :return: A tuple of (total-execution-cost: int, hnb: int, hnm: bool, hotspot: int). hnb is 2 if an edge was hit
+            for the first time, 1 if the hits of an edge moved to a new count class, or 0. hnm is True iff an edge was
+            hit more times than ever before. The hotspot is the max hits of an edge.
+        """
+        cost = sum(perf_map.values())
+        if run_type == "wup":
+            return cost, 0, False, 0
+
+        hnb, hnm, hs = 0, False, 0
+        max_counts, coverage = self.max_counts, self.coverage
+        for edge, hits in perf_map.items():
+            if hits > hs:
+                hs = hits
+            if hits > max_counts.get(edge, 0):
+                max_counts[edge] = hits
+                hnm = True
+            cls = count_class(hits)
+            seen = coverage.get(edge)
+            if seen is None:
+                coverage[edge] = cls
+                hnb = 2
+            elif not seen & cls:
+                coverage[edge] = seen | cls
+                hnb = max(hnb, 1)
+        return cost, hnb, hnm, hs
+
+    def reset(self):
+        """Forget the max counts and the coverage (e.g., for a new experiment).
+        """
+        self.max_counts.clear()
+        self.coverage.clear()
+
+
+class Executor(Protocol):
+    """The methods of an executor (InputHandler, ShowmaxPoolExecutor, and the replay executors have them, none of them
+    subclasses this).
+
+    :Note: An executor may have a concurrency attribute, the number of inputs it can run at once (one if it has none).
+        An executor with a concurrency above one can be shared by that many threads (e.g., the executor threads of a
+        random search pipeline, see mcts.pipeline).
+    """
+
+    def run_input(self, test_case: Union[str, bytes], run_type: str = "nml") -> Tuple[int, int, bool, int]:
+        """Run the input on the target.
+
+        :param test_case: The input (a str is encoded as utf-8). It is truncated at its first NUL byte.
+        :param run_type: "wup" (warmup) does not change the max counts or the coverage.
+        :return: A tuple of (total-execution-cost: int, hnb: int, hnm: bool, hotspot: int).
+        """
+        ...
+
+    def is_connected(self) -> bool:
+        ...
+
+    def open_connection(self):
+        """Start the executions of an experiment (with a fresh max counts and coverage).
+        """
+        ...
+
+    def close_connection(self):
+        """End the executions of an experiment.
+        """
+        ...
+
+
+class ShowmaxPoolExecutor:
+    """Run each input as a file under afl-showmax (see analysis.run_app.AppRunner), with up to a number of them at
+    once, and give the feedback afl-socket would give from the returned perf maps.
+
+    :param target: The target binary and its flags (e.g., "dot" or "xmllint --noout"), the input file is given last.
+    :param workers: The number of afl-showmax processes at once (zero or less takes the number of cpus).
+    """
+
+    def __init__(self, target: str, workers: int = 0):
+        """Constructor method
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        if shutil.which('afl-showmax') is None:
+            raise RuntimeError("afl-showmax is not installed (or not in PATH)")
+        self.runner = AppRunner(target)
+        self.concurrency = workers if workers > 0 else os.cpu_count() or 1  # see Executor
+        self.state = FeedbackState()
+        self.executions = 0
+        self._lock = threading.Lock()  # the state (the feedback of the runs is given one at a time)
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._ids = itertools.count()
+        self._work_dir: Optional[str] = None
+        self.open_connection()
+
+    def run_input(self, test_case: Union[str, bytes], run_type: str = "nml") -> Tuple[int, int, bool, int]:
+        if isinstance(test_case, str):
+            test_case = test_case.encode('utf_8')
+        if len(test_case) > _MAX_INPUT_SIZE:
+            raise RuntimeError(f"Got input with size ({len(test_case)}) larger than the allowed limit "
+                               f"({_MAX_INPUT_SIZE})")
+        if self._work_dir is None:
+            raise RuntimeError("The executor is closed")
+        test_case = test_case.split(b'\0', 1)[0]  # as the socket server reads it
+
+        with self._slots:
+            input_file = os.path.join(self._work_dir, f"input-{next(self._ids)}")
+            with open(input_file, 'wb') as file:
+                file.write(test_case)
+            try:
+                perf_map = self.runner.run_showmax_perf_map(input_file)
+            finally:
+                os.remove(input_file)
+        with self._lock:
+            self.executions += 1
+            return self.state.update(perf_map, run_type)
+
+    def is_connected(self) -> bool:
+        return self._work_dir is not None
+
+    def open_connection(self):
+        if self._work_dir is not None:
+            return
+        self._work_dir = tempfile.mkdtemp(prefix="showmax-")
+        self.state.reset()
+
+    def close_connection(self):
+        if self._work_dir is not None:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
+
+
+def make_executor(backend: str, host: str = 'localhost', port: int = 2300, target: str = "",
+                  workers: int = 0) -> Executor:
+    """
+    :param backend: The executor backend (see EXECUTOR_BACKENDS).
+    :param host: The host of the afl-socket server ('socket').
+    :param port: The port of the afl-socket server ('socket').
+    :param target: The target binary and its flags ('showmax').
+    :param workers: The number of afl-showmax processes at once ('showmax', zero takes the number of cpus).
+    :return: The executor (connected).
+    """
+    if backend == 'socket':
+        return InputHandler(host=host, port=port)
+    if backend == 'showmax':
+        if not target:
+            raise ValueError("The showmax executor needs the target binary (showmax_target)")
+        return ShowmaxPoolExecutor(target, workers=workers)
+    raise ValueError(f"Unknown executor backend '{backend}', it must be one of {EXECUTOR_BACKENDS}")
@@ -3,19 +3,19 @@ __email__ = "zalsaeed@cs.uoregon.edu"
 __status__ = "Testing"
 
 import collections
+import csv
+import io
+import fcntl
 import os
-import re
 import sys
 import math
+import shutil
 import datetime
-import subprocess
-from typing import List, Iterable, Callable
+from typing import List, Iterable, Callable, Optional, Tuple
 
-import pandas as pd
-import numpy as np
-
-from pygramm.grammar import RHSItem
 from mcts.mctsnode import MCTSNode
+from mcts.tree_export import TreeExportOptions, write_dot, write_text
+from mcts.corpus import CORPUS_DIR_NAME, input_file_name, is_corpus_dir, export_to_files, read_index
 
 
 def progress_bar(is_time_based: bool, start_time: datetime, iter_counter: int, num_rollouts: int,
@@ -103,9 +103,31 @@ def write_dict_to_csv(data: dict, output_dir: str, file_name: str, comments: str
     with open(project_root, "w") as e_file:
         if comments is not None:
             e_file.write("# " + comments + "\n")
+        import pandas as pd
         pd.DataFrame(data).to_csv(e_file, index=False)
 
 
+def append_experiment_info(report_file: str, report: dict):
+    """Append the report of an experiment as a row of the experiments info CSV file. The header (the report keys) is
+    only written if the file is empty. The file is locked while the row is written, so concurrent experiments (e.g.,
+    the workers of a grid) never interleave their rows or both write a header.
+
+    :param report_file: The experiments info CSV file (created if missing).
+    :param report: The report of the experiment.
+    """
+    with open(report_file, "a", newline='') as e_file:
+        fcntl.flock(e_file, fcntl.LOCK_EX)
+        try:
+            e_file.seek(0, os.SEEK_END)
+            writer = csv.writer(e_file)
+            if e_file.tell() == 0:
+                writer.writerow([*report.keys()])  # header (should only be written once)
+            writer.writerow([*report.values()])
+            e_file.flush()
+        finally:
+            fcntl.flock(e_file, fcntl.LOCK_UN)
+
+
 def get_exploration_rate(current_episode: int, decay_rate: float, max_exploration_rate: float,
                          min_exploration_rate: float) -> float:
     """
@@ -166,10 +188,56 @@ def normalize(val, max_val, min_val):
         return (val - min_val) / (max_val - min_val)
 
 
-def prep_expr_for_showmax(root_path: str, expr_dir: List[str]):
-    """For each expr directory copy all the input using a pattern we defined that would guarantee fixed naming
-    length in both the dir names and the inputs names without losing essential information about the input
-    (e.g. timestamp(mtime), exec, id).
+MANIFEST_FILE_NAME = 'manifest.csv'
+MANIFEST_COLUMNS = ['id', 'exec', 'crtime', 'dur', 'path']
+"""The columns of the manifest of a normalized experiment (the path of each input is relative to the root path)."""
+
+
+def normalized_input_name(input_id: int, input_exec: int, input_crtime: int, input_dur: int) -> str:
+    """
+    :return: The normalized name of an input, i.e., id:{6-digit},exec:{11-digits},crtime:{ms},dur:{10-digits}
+    """
+    return f'id:{input_id:06d},exec:{input_exec:011d},crtime:{input_crtime},dur:{input_dur:010d}'
+
+
+def parse_input_name(file_name: str, technique: str) -> Optional[Tuple[int, int, int, int]]:
+    """Parse the name of an input saved by PerfFuzz, TreeLine, or SlackLine (see prep_expr_for_showmax).
+
+    :param file_name: The input file name.
+    :param technique: The tool that saved the input ('tool:PerfFuzz', 'tool:TreeLine', or 'tool:SlackLine').
+    :return: The (id, exec, crtime, dur) of the input, or None if the input is an orig (i.e., a seed).
+    """
+    # remove postfix (e.g., +max, +cov, or +cost)
+    base_name = remove_suffix(file_name)
+
+    # break by indicators and their values
+    if base_name.endswith(','):
+        base_name = base_name[:-1]
+
+    indicators = base_name.split('-') if technique == 'tool:SlackLine' else base_name.split(',')
+
+    values = {}
+    for indicator in indicators:  # e.g. id:****, exec:****, ... etc
+        broken_indicator = indicator.split(':')
+        if len(broken_indicator) == 2:
+            indicator_id, indicator_val = broken_indicator
+            if indicator_id == 'orig':  # we skip an input if it is an orig
+                return None
+            if indicator_id in ('id', 'exec', 'crtime', 'dur'):
+                values[indicator_id] = int(indicator_val)
+
+    if 'id' not in values:
+        raise RuntimeError(f'Failed passing the id of the input {file_name}')
+    if 'crtime' not in values or 'dur' not in values or 'exec' not in values:
+        raise RuntimeError(f'Accepting new experiments only! {file_name} did not have exec, crtime, or dur')
+    return values['id'], values['exec'], values['crtime'], values['dur']
+
+
+def prep_expr_for_showmax(root_path: str, expr_dir: List[str], link: bool = False):
+    """For each expr directory list all the inputs in a manifest using a pattern we defined that would guarantee
+    fixed naming length in both the dir names and the inputs names without losing essential information about the
+    input (e.g. timestamp(mtime), exec, id). The names are parsed once, and the inputs are not copied: the manifest
+    maps each normalized input to its original file.
 
     :PerfFuzz inputs naming samples:
     .. code-block::
@@ -191,12 +259,17 @@ def prep_expr_for_showmax(root_path: str, expr_dir: List[str]):
 
     Also each dir of each experiment must be named as expt:{4-digit}. This information of the experiment itself that
     used to be saved in the name, should be saved in a file named "expr-info.txt". Users of this method will use
-    that file to retrieve the experiment information.
+    that file to retrieve the experiment information, and the manifest (manifest.csv, see read_manifest) to find the
+    inputs.
+
+    TreeLine experiments saved as a packed corpus (see mcts.corpus) are listed from the corpus index, no names are
+    parsed. As their inputs have no files of their own, they are written to the inputs dir of the expr.
 
     :param root_path: The root path where all the experiments are saved (we can look at mutliple ones)
     :param expr_dir: All the experiment directories that we want to process.
+    :param link: If True, the inputs dir of each expr is also populated with the normalized names as hardlinks to the
+        original files (copies if a hardlink is not possible).
     """
-    # TODO: read name given the new method for names
     if root_path.endswith('/'):  # remove the last backslash
         root_path = root_path[:-1]
     expr_id = 1
@@ -210,85 +283,82 @@ def prep_expr_for_showmax(root_path: str, expr_dir: List[str]):
         elif os.path.exists(root_path + f'/{expr}' + '/list'):
             inputs_dir = 'list'
             technique = 'tool:SlackLine'
+        elif is_corpus_dir(root_path + f'/{expr}/{CORPUS_DIR_NAME}'):
+            inputs_dir = CORPUS_DIR_NAME
+            technique = 'tool:TreeLine'
         else:
-            raise RuntimeError(f"Cannot find queue/buffer/list in {root_path}/{expr}")
-        # inputs_dir = 'queue' if os.path.exists(root_path + f'/{expr}' + '/queue') else 'buffer'
-        # technique = 'tool:PerfFuzz' if inputs_dir == 'queue' else 'tool:TreeLine'
+            raise RuntimeError(f"Cannot find queue/buffer/list/corpus in {root_path}/{expr}")
 
-        # create a dir for this expr and a nested dir for inputs at the same time
-        try:
-            os.makedirs(f"{root_path}/expr:{expr_id:04d}/inputs")
-            print(f"Directory: '{root_path}/expr:{expr_id:04d}/inputs' created")
-        except FileExistsError:
-            print(f"Directory: '{root_path}/expr:{expr_id:04d}/inputs' already exists!")
+        # create a dir for this expr. The expr ids follow the sorted experiments, thus an earlier preparation could
+        # have put the inputs of another experiment in it, hence we start from an empty inputs dir.
+        expr_path = f"{root_path}/expr:{expr_id:04d}"
+        os.makedirs(expr_path, exist_ok=True)
+        if os.path.exists(f"{expr_path}/inputs"):
+            shutil.rmtree(f"{expr_path}/inputs")
+        print(f"Directory: '{expr_path}' prepared for {expr}")
 
         # save expr info to file "expr-info.txt":
-        with open(f"{root_path}/expr:{expr_id:04d}/expr-info.txt", "w") as expr_info:
+        with open(f"{expr_path}/expr-info.txt", "w") as expr_info:
             expr_info.write(f'{technique}-{expr}')
 
-        # get names of all files in queue/buffer
-        inputs = [f.name for f in os.scandir(root_path + f'/{expr}' + f'/{inputs_dir}') if f.is_file()]
-
-        # loop saved inputs to copy each one to the new destination given the same parts of the name we care about
-        for file_name in inputs:
-
-            input_id = None
-            input_exec = None
-            input_crtime = None
-            input_dur = None
-
-            # remove postfix (e.g., +max, +cov, or +cost)
-            base_name = file_name
-            base_name = remove_suffix(base_name)
-
-            # break by indicators and their values
-            if base_name.endswith(','):
-                base_name = base_name[:-1]
-
-            if technique == 'tool:SlackLine':
-                indicators = base_name.split('-')
-            else:
-                indicators = base_name.split(',')
-
-            # checking if we should skip an input because it is an orig
-            skip_this_input = False
-            for indicator in indicators:  # e.g. id:****, exec:****, ... etc
-                broken_indicator = indicator.split(':')
-                if len(broken_indicator) == 2:
-                    indicator_id, indicator_val = broken_indicator
-                    if indicator_id in ['orig']:
-                        skip_this_input = True
-
-            if skip_this_input:
-                continue
-
-            for indicator in indicators:  # e.g. id:****, exec:****, ... etc
-                broken_indicator = indicator.split(':')
-                if len(broken_indicator) == 2:
-                    indicator_id, indicator_val = broken_indicator
-                    if indicator_id == 'id':
-                        input_id = int(indicator_val)
-                    if indicator_id == 'exec':
-                        input_exec = int(indicator_val)
-                    if indicator_id == 'crtime':
-                        input_crtime = int(indicator_val)
-                    if indicator_id == 'dur':
-                        input_dur = int(indicator_val)
-            if input_id is None:
-                raise RuntimeError(f'Failed passing the id of the input{file_name} in '
-                                   f'{root_path}/{expr}/{inputs_dir}')
-
-            if input_crtime is None or input_dur is None or input_exec is None:
-                raise RuntimeError(f'Accepting new experiments only! {file_name} in '
-                                   f'{root_path}/{expr}/{inputs_dir} did not have exec, crtime, or dur')
-
-            # the flag -p is to preserve the file mtime timestamp
-            subprocess.run(['cp', '-p', f'{root_path}/{expr}/{inputs_dir}/{file_name}',
-                            f'{root_path}/expr:{expr_id:04d}/inputs/id:{input_id:06d},exec:{input_exec:011d},'
-                            f'crtime:{input_crtime},dur:{input_dur:010d}'])
+        entries = []  # (normalized name, id, exec, crtime, dur, path relative to the root path)
+        if inputs_dir == CORPUS_DIR_NAME:
+            # a packed corpus has the metadata in its index, thus the inputs are written straight to the target names.
+            export_to_files(f'{root_path}/{expr}/{inputs_dir}', f'{expr_path}/inputs',
+                            file_name=lambda r: normalized_input_name(r['id'], r['exec'], r['crtime'], r['dur']))
+            for record in read_index(f'{root_path}/{expr}/{inputs_dir}'):
+                name = normalized_input_name(record['id'], record['exec'], record['crtime'], record['dur'])
+                entries.append((name, record['id'], record['exec'], record['crtime'], record['dur'],
+                                f'expr:{expr_id:04d}/inputs/{name}'))
+        else:
+            for entry in os.scandir(f'{root_path}/{expr}/{inputs_dir}'):
+                if not entry.is_file():
+                    continue
+                try:
+                    parsed = parse_input_name(entry.name, technique)
+                except RuntimeError as e:
+                    raise RuntimeError(f'{e} in {root_path}/{expr}/{inputs_dir}')
+                if parsed is None:
+                    continue
+                entries.append((normalized_input_name(*parsed), *parsed, f'{expr}/{inputs_dir}/{entry.name}'))
+
+            if link:
+                os.makedirs(f"{expr_path}/inputs")
+                for name, *_, path in entries:
+                    link_or_copy(f'{root_path}/{path}', f'{expr_path}/inputs/{name}')
+
+        entries.sort()
+        with open(f"{expr_path}/{MANIFEST_FILE_NAME}", "w", newline='') as manifest_file:
+            writer = csv.writer(manifest_file, lineterminator='\n')
+            writer.writerow(MANIFEST_COLUMNS)
+            for _, input_id, input_exec, input_crtime, input_dur, path in entries:
+                writer.writerow([f'{input_id:06d}', f'{input_exec:011d}', input_crtime, f'{input_dur:010d}', path])
         expr_id += 1
 
 
+def read_manifest(expr_path: str) -> List[dict]:
+    """Load the manifest of an expr prepared by prep_expr_for_showmax.
+
+    :param expr_path: The expr directory (e.g., <root>/expr:0001).
+    :return: A row per input (in the order of the normalized names) with the MANIFEST_COLUMNS as keys. The id, exec,
+        and dur are zero-padded strings (as in the normalized names) and the path is relative to the root path.
+    """
+    with open(os.path.join(expr_path, MANIFEST_FILE_NAME), 'r', newline='') as manifest_file:
+        return list(csv.DictReader(manifest_file))
+
+
+def link_or_copy(source: str, destination: str):
+    """Hardlink a file, or copy it (preserving its timestamps) if the hardlink is not possible (e.g., another device).
+
+    :param source: The existing file.
+    :param destination: The new file.
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
 def remove_suffix(file_name: str, possible_suffixes=('+max', '+cov', '+cost')) -> str:
     """Helper function to remove the suffixes added to the input files names.
 
@@ -374,144 +444,37 @@ def find_prc_uniq_values(data: List[int]) -> float:
     :return:  The percentage of unique value to the number of element in the list.
     """
     if data:
-        return len(np.unique(data)) / len(data)
+        return len(set(data)) / len(data)
     else:
         return 0.0  # special case
 
 
-def tree_state(node: MCTSNode) -> str:
-    """Tree printing helper method.
+def tree_state(node: MCTSNode, options: TreeExportOptions = None) -> str:
+    """Tree printing helper method (see mcts.tree_export.write_text to write a big tree straight to a file).
 
     :param node: The root node from which we would like to start the printing process.
+    :param options: The pruning options (None prints the whole tree).
+    :return: The tree as text.
     """
-    indent = "    "
-    tree = ''
-    tree += f"{node.level*indent}{node}\n"
-    for child in node.get_children():
-        tree += tree_state(child)
-    return tree
+    stream = io.StringIO()
+    write_text(node, stream, options or TreeExportOptions())
+    return stream.getvalue()
 
 
-def tree_to_dot(node: MCTSNode) -> str:
-    """Generate a tree written in a dot language for post-print rendering. The method works for the target
-    applications we tried. However, there is no guarantee that it would work for all target applications as the
-    depending on the applications' language it can interfere with the dot code.
+def tree_to_dot(node: MCTSNode, options: TreeExportOptions = None) -> str:
+    """Generate a tree written in a dot language for post-print rendering (see mcts.tree_export.write_dot to write a
+    big tree straight to a file).
 
     :param node: The root node from which we would print the tree.
+    :param options: The pruning options (None prints the whole tree).
     :return: The dot file as a string.
     """
-    # open the graph and add high-level attributes
-    dot_rep = "digraph {\n"
-    dot_rep += "\tnode [shape=record, colorscheme=rdylbu11];\n"
-
-    # add graph nodes based on tree (body)
-    dot_rep += node_to_struct(node, True)
-
-    # add the legend and close the whole graph
-    dot_rep += "\tsubgraph cluster_key {\n"
-    dot_rep += "\t\trank=sink;\n"
-    dot_rep += "\t\tstyle = filled;\n"
-    dot_rep += "\t\tcolor=lightgrey;\n"
-    dot_rep += "\t\tlabel=\"Legend\";\n"
-    dot_rep += "\t\tdetails [label=\"{Generated input\\n'' means empty|len(input)= length \\nof generated input|" \
-               "# used tokens = total terminal token \\nused to generated the shown input \\nwhich must never " \
-               "exceed the budget}|" \
-               "SYMBOL\\nunder evaluation|" \
-               "{AB= Allowed Budget|PB= Passed Budget|len(s)= Stack Size}|" \
-               "STACK|" \
-               "{V= Total Costs (sum) based on \\nany descendant of this node|N= No. of Visits|UCB= UCB value to " \
-               "reach \\nthis node from parent}" \
-               "}\"];\n"
-    dot_rep += "\t\tbest_intermediate [label=\"Intermediate Node in Best Path\"; style=filled; fillcolor=8]\n"
-    dot_rep += "\t\tbest_leaf [label=\"Leaf Node in Best Path\"; style=filled; fillcolor=7]\n"
-    dot_rep += "\t\tbest_terminal [label=\"Terminal Node in Best Path\"; style=filled; fontcolor=white; " \
-               "fillcolor=9]\n"
-    dot_rep += "\t\tintermediate [label=\"Intermediate Node\"; style=filled; fillcolor=4]\n"
-    dot_rep += "\t\tleaf [label=\"Leaf Node\"; style=filled; fillcolor=5]\n"
-    dot_rep += "\t\tterminal [label=\"Terminal Node\"; style=filled; fillcolor=3]\n"
-    dot_rep += "\t}\n"
-    dot_rep += "}\n"
-
-    return dot_rep
-
-
-def node_to_struct(node: MCTSNode, is_best: bool) -> str:
-
-    if node.locked:
-        dot_struct = f"\tstruct{id(node)} [style=filled; fontcolor=white; fillcolor=black; label=\""
-    elif is_best:  # blue background
-        if node.is_terminal():
-            dot_struct = f"\tstruct{id(node)} [style=filled; fontcolor=white; fillcolor=9; label=\""
-        elif node.is_leaf():
-            dot_struct = f"\tstruct{id(node)} [style=filled; fillcolor=7; label=\""
-        else:
-            dot_struct = f"\tstruct{id(node)} [style=filled; fillcolor=8; label=\""
-    else:  # gold background
-        if node.is_terminal():
-            dot_struct = f"\tstruct{id(node)} [style=filled; fillcolor=3; label=\""
-        elif node.is_leaf():
-            dot_struct = f"\tstruct{id(node)} [style=filled; fillcolor=5; label=\""
-        else:
-            dot_struct = f"\tstruct{id(node)} [style=filled; fillcolor=4; label=\""
-
-    # input and len of input
-    # escape all characters except the ones specified below, because they could be graphviz chars.
-    dot_struct += "{'" + re.sub("([^a-zA-Z0-9])", r"\\\1", node.text) + "'| "
-    dot_struct += f" len(input): {len(node.text)}|# used tokens: {node.tokens_used}"
-    dot_struct += "}|"
-
-    # symbol in hand
-    if isinstance(node.symbol, RHSItem):
-        # escape all characters except the ones specified below
-        dot_struct += re.sub("([^a-zA-Z0-9])", r"\\\1", node.symbol.__str__()) + "|"
-    else:
-        dot_struct += f"{node.symbol}|"
-
-    # budget and stack information
-    dot_struct += "{"
-    dot_struct += f"AB: {node.allowed_budget}|PB:{node.budget}|len(s):{len(node.stack)}"
-    dot_struct += "}|"
-
-    # stack content
-    reversed_stack = node.stack[::-1]
-    dot_struct += "{"
-    if reversed_stack:
-        for item in reversed_stack:
-            # escape all characters except the ones specified below
-            dot_struct += re.sub("([^a-zA-Z0-9])", r"\\\1", item.__str__()) + "|"
-        dot_struct = dot_struct[:-1]  # removing the last char "|" in the string.
-    else:
-        dot_struct += f"EMPTY\\nSTACK"
-    dot_struct += "}|"
-
-    # MCTS information (V, N, UCB)
-    dot_struct += "{"
-    dot_struct += f"V: {node.get_total_cost()}|N: {node.get_visits()}| UCB1: {node.get_ucb1()}"
-    dot_struct += "}\"];\n"
-
-    if node.get_children() and is_best:  # if it has children, and it is in the best path, then get the max child
-        max_child = max(node.get_children(), key=lambda n: n.get_ucb1())
-        max_ucb = max_child.get_ucb1()  # get the best child ucb1 value for coloring
-    else:
-        max_ucb = -1.0
-
-    for child in node.get_children():
-        if child.get_ucb1() == max_ucb:
-            dot_struct += node_to_struct(child, True)
-        else:
-            dot_struct += node_to_struct(child, False)
-        dot_struct += f"\tstruct{id(node)} -> struct{id(child)} "
-        c = scale_to_range(child.level, 181, 0, 1, 2)
-        if child.get_ucb1() == float("inf") or child.get_ucb1() == float("-inf"):
-            dot_struct += f"[taillabel=\"C={round(c, 2)}, UCB={round(child.get_ucb1(), 4)}, " \
-                          f"level={child.level}\"; penwidth={0.5}];\n"
-        else:
-            dot_struct += f"[taillabel=\"C={round(c, 2)}, UCB={round(child.get_ucb1(), 4)}, " \
-                          f"level={child.level}\"; penwidth={round(child.get_ucb1(), 4)}];\n"
-    return dot_struct
+    stream = io.StringIO()
+    write_dot(node, stream, options or TreeExportOptions())
+    return stream.getvalue()
 
 
-def save_input(generated_input: str, hnb: bool, hnm: bool, hnc: bool, hs: int, ac: int, tokens_used: int,
+def save_input(generated_input: bytes, hnb: bool, hnm: bool, hnc: bool, hs: int, ac: int, tokens_used: int,
                output_dir: str, input_id: int, exec_count: int, cur_ms: int, dur: int):
     """Save input to file with an extensively descriptive name. Name are descriptive as they are used later on
     analysis.
@@ -533,18 +496,12 @@ def save_input(generated_input: str, hnb: bool, hnm: bool, hnc: bool, hs: int, a
     if not os.path.isdir(output_dir):
         raise IOError(f'{output_dir} is not a directory.')
 
-    postfix = ""
-    if hnb:  # not 0 (we don't care either 1 or 2)
-        postfix += "+cov"
-    if hnm:
-        postfix += "+max"
-    if hnc:
-        postfix += "+cost"
     # TODO: change the len tracking to be based on the len given by the user (e.g., char, or byte).
-    with open(f"{output_dir}id:{input_id:06d},cost:{ac:010d},hs:{hs:010d},hnb:{hnb},exec:{exec_count},"
-              f"len:{len(bytes(generated_input, 'utf-8')):03d},tu:{tokens_used:03d},crtime:{cur_ms},"
-              f"dur:{dur}{postfix}", "wb") as cov_file:
-        cov_file.write(generated_input.encode())
+    file_name = input_file_name({'id': input_id, 'cost': ac, 'hs': hs, 'hnb': hnb, 'hnm': hnm, 'hnc': hnc,
+                                 'exec': exec_count, 'len': len(generated_input), 'tu': tokens_used,
+                                 'crtime': cur_ms, 'dur': dur})
+    with open(f"{output_dir}{file_name}", "wb") as cov_file:
+        cov_file.write(generated_input)
 
 
 def beautify_final_report(data: dict) -> str:
@@ -0,0 +1,206 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+Machine-readable snapshots of the bias table, so a later run on the same grammar does not have to learn the choice
+bias from scratch.
+
+The bias weights are keyed by the grammar items (RHSItem objects) of a particular parsed grammar. Thus, a snapshot keys
+each item by a name that is stable across parses of the same grammar: symbols and literals by their text (they are
+interned by pygramm) and any other item by its position within the production that owns it. A snapshot is only valid
+for the grammar it was taken from, which is why it carries the hash of the grammar (with its costs).
+"""
+
+import os
+import json
+import fcntl
+import hashlib
+import logging
+import datetime
+from typing import Dict, Optional
+
+from pygramm.grammar import Grammar, RHSItem, _Symbol, _Literal, _Seq, _Choice, _Kleene
+from pygramm.biased_choice import Bias
+
+log = logging.getLogger("BiasStore")
+
+# The smallest weight a snapshot is loaded with. The penalties shrink a weight geometrically, so a long run leaves some
+# weights close to the smallest float, and the penalties of the next run would round them (and a whole choice) to 0.0.
+MIN_LOADED_WEIGHT = 1e-12
+
+
+def grammar_hash(gram: Grammar) -> str:
+    """A hash of the grammar as it is used in the search (i.e., after transformation and with the computed costs).
+
+    :param gram: The grammar.
+    :return: The hex digest of the grammar.
+    """
+    return hashlib.sha256(gram.dump().encode('utf-8')).hexdigest()
+
+
+def snapshot_file_name(gram: Grammar) -> str:
+    """The file name of the bias snapshot of the given grammar within a snapshots directory.
+
+    :param gram: The grammar.
+    :return: The file name (e.g., bias-<grammar-hash>.json).
+    """
+    return f"bias-{grammar_hash(gram)[:16]}.json"
+
+
+def _index_items(gram: Grammar) -> Dict[str, RHSItem]:
+    """Give each item in the grammar a stable name.
+
+    :param gram: The grammar.
+    :return: A dictionary of the item name to the item itself.
+    """
+    items: Dict[str, RHSItem] = {}
+    seen = set()
+
+    def walk(item: RHSItem, key: str):
+        if isinstance(item, _Symbol) or isinstance(item, _Literal):
+            items.setdefault(str(item), item)
+            return
+        if id(item) in seen:
+            return
+        seen.add(id(item))
+        items.setdefault(key, item)
+        if isinstance(item, _Seq) or isinstance(item, _Choice):
+            for idx, sub_item in enumerate(item.items):
+                walk(sub_item, f"{key}/{idx}")
+        elif isinstance(item, _Kleene):
+            walk(item.child, f"{key}/child")
+            walk(item._recursive_case, f"{key}/rec")
+            walk(item._base_case, f"{key}/base")
+
+    for name, symbol in gram.symbols.items():
+        items.setdefault(str(symbol), symbol)
+        if symbol.expansions is not None:
+            walk(symbol.expansions, f"{name}::=")
+    return items
+
+
+def snapshot_created(file_path: str) -> Optional[str]:
+    """The creation stamp of a snapshot, which tells a later save whether the snapshot changed in the meantime.
+
+    :param file_path: The snapshot file.
+    :return: The stamp, or None if the snapshot does not exist.
+    """
+    if not os.path.isfile(file_path):
+        return None
+    with open(file_path, 'r') as snapshot_file:
+        return json.load(snapshot_file)['created']
+
+
+def _merge(snapshot: dict, other: dict):
+    """Merge another snapshot of the same grammar into the given one, each weight becomes the mean of both (an item
+    missing from a snapshot has the default weight in it).
+
+    :param snapshot: The snapshot to merge into.
+    :param other: The other snapshot.
+    """
+    default = snapshot['default_weight']
+    weights = snapshot['weights']
+    for name in set(weights) | set(other['weights']):
+        weights[name] = (weights.get(name, default) + other['weights'].get(name, default)) / 2
+    bigram_weights = {(prior, name): weight for prior, name, weight in snapshot['bigram_weights']}
+    other_bigram_weights = {(prior, name): weight for prior, name, weight in other['bigram_weights']}
+    snapshot['bigram_weights'] = [[prior, name, (bigram_weights.get((prior, name), default) +
+                                                 other_bigram_weights.get((prior, name), default)) / 2]
+                                  for prior, name in set(bigram_weights) | set(other_bigram_weights)]
+
+
+def save_bias(bias: Bias, gram: Grammar, file_path: str, shared: bool = False, base: Optional[str] = None):
+    """Save the bias table as JSON.
+
+    A shared snapshot (e.g., the one of a grammar in the bias snapshots dir) can be saved by concurrent runs, such as
+    the workers of a grid. Its saves are serialized with a lock file next to it, and if another run saved it since
+    this run loaded it, the two tables are merged (see _merge) instead of the last save silently dropping the other.
+
+    :param bias: The bias (any fork of it, the table is shared).
+    :param gram: The grammar the bias was learned on.
+    :param file_path: Where to write the snapshot.
+    :param shared: Whether other runs may save the same snapshot.
+    :param base: The creation stamp (see snapshot_created) of the shared snapshot this bias started from, None if it
+        started from scratch.
+    """
+    names = {id(item): name for name, item in _index_items(gram).items()}
+    core = bias.core
+
+    weights = {}
+    for item, weight in core.weights.items():
+        if id(item) in names:
+            weights[names[id(item)]] = weight
+    bigram_weights = []
+    for (prior, item), weight in core.bigram_weights.items():
+        if id(item) in names and (prior is None or id(prior) in names):
+            bigram_weights.append([None if prior is None else names[id(prior)], names[id(item)], weight])
+
+    snapshot = {'grammar': gram.gram_name,
+                'grammar_hash': grammar_hash(gram),
+                'created': datetime.datetime.now().isoformat(),
+                'default_weight': core.default_weight,
+                'weights': weights,
+                'bigram_weights': bigram_weights}
+
+    if not shared:
+        _write_snapshot(snapshot, file_path)
+        return
+    with open(f"{file_path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.path.isfile(file_path):
+                with open(file_path, 'r') as snapshot_file:
+                    saved = json.load(snapshot_file)
+                if saved['grammar_hash'] == snapshot['grammar_hash'] and saved['created'] != base:
+                    log.info(f"The bias snapshot {file_path} was saved by another run, merging it.")
+                    _merge(snapshot, saved)
+            _write_snapshot(snapshot, file_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_snapshot(snapshot: dict, file_path: str):
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"  # one per writer, concurrent runs may save the same snapshot
+    with open(tmp_path, 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file, indent=1)
+    os.replace(tmp_path, file_path)  # never leave a half written snapshot behind
+
+
+def load_bias(gram: Grammar, file_path: str, decay: float = 0.0) -> Optional[Bias]:
+    """Load a bias table from a snapshot, optionally decaying each weight toward the default (uniform) weight.
+
+    :param gram: The grammar the loaded bias will be used with.
+    :param file_path: The snapshot file.
+    :param decay: How much of the learned bias to forget, 0.0 keeps the weights as they are (but no smaller than
+        MIN_LOADED_WEIGHT) and 1.0 makes all of them the default weight.
+    :return: A new Bias with the loaded weights, or None if the snapshot does not exist or was taken from a different
+        grammar.
+    """
+    if not 0.0 <= decay <= 1.0:
+        raise ValueError(f"The bias decay must be within [0, 1]. Got {decay}")
+    if not os.path.isfile(file_path):
+        return None
+
+    with open(file_path, 'r') as snapshot_file:
+        snapshot = json.load(snapshot_file)
+    if snapshot['grammar_hash'] != grammar_hash(gram):
+        log.warning(f"The bias snapshot {file_path} was taken from a different grammar ({snapshot['grammar']}), "
+                    f"ignoring it.")
+        return None
+
+    items = _index_items(gram)
+    bias = Bias()
+    core = bias.core
+
+    def decayed(weight: float) -> float:
+        return max(MIN_LOADED_WEIGHT, core.default_weight + (weight - core.default_weight) * (1.0 - decay))
+
+    for name, weight in snapshot['weights'].items():
+        if name in items:
+            core.weights[items[name]] = decayed(weight)
+    for prior_name, name, weight in snapshot['bigram_weights']:
+        if name in items and (prior_name is None or prior_name in items):
+            prior = None if prior_name is None else items[prior_name]
+            core.bigram_weights[(prior, items[name])] = decayed(weight)
+    return bias
@@ -0,0 +1,226 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+A packed corpus of the interesting inputs (+cov, +max, +cost) found during a search. Instead of a file per input (named
+with all its metadata), the inputs are appended to a single data file and described by an index:
+
+    corpus/
+    |-- corpus.dat    # the input bytes, back to back
+    `-- index.jsonl   # one JSON object per saved input
+
+Each index record holds the metadata that used to be in the file name, plus where the bytes are in the data file:
+    {"id": 12, "cost": 7186, "hs": 42, "hnb": 1, "hnm": 0, "hnc": 1, "exec": 150, "len": 17, "tu": 17,
+     "crtime": 1684231302232, "dur": 11, "sha": "9f86d0...", "offset": 2048, "size": 17}
+
+Both files are append-only and written by a background thread, so the search loop only pays for putting a tuple in a
+queue. Inputs are deduplicated by their content hash: an input seen before gets its own index record (e.g., it was
+saved again for a new max) that points at the bytes already in the data file.
+
+The old layout (a file per input) can be produced with export_to_files() for PerfFuzz-compatible tooling:
+    python -m mcts.corpus <corpus-dir> <output-dir>
+"""
+
+import os
+import json
+import queue
+import hashlib
+import argparse
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+CORPUS_FORMATS = ['files', 'packed']
+"""How the interesting inputs are saved: a file per input in buffer/ ('files') or a packed corpus ('packed')."""
+
+CORPUS_DIR_NAME = 'corpus'
+DATA_FILE_NAME = 'corpus.dat'
+INDEX_FILE_NAME = 'index.jsonl'
+
+_FIELDS = ('id', 'cost', 'hs', 'hnb', 'hnm', 'hnc', 'exec', 'len', 'tu', 'crtime', 'dur')
+_CLOSE = object()
+
+
+def input_file_name(record: dict) -> str:
+    """The file name of a saved input in the old (file per input) layout.
+
+    :param record: The index record of the input (only the metadata fields are used).
+    :return: The file name, e.g., id:000001,cost:0000039867,hs:0000001806,hnb:True,...,dur:11+cov+max+cost
+    """
+    postfix = ""
+    if record['hnb']:  # not 0 (we don't care either 1 or 2)
+        postfix += "+cov"
+    if record['hnm']:
+        postfix += "+max"
+    if record['hnc']:
+        postfix += "+cost"
+    return f"id:{record['id']:06d},cost:{record['cost']:010d},hs:{record['hs']:010d},hnb:{bool(record['hnb'])}," \
+           f"exec:{record['exec']},len:{record['len']:03d},tu:{record['tu']:03d},crtime:{record['crtime']}," \
+           f"dur:{record['dur']}{postfix}"
+
+
+def is_corpus_dir(path: str) -> bool:
+    """
+    :param path: A directory.
+    :return: True if the directory holds a packed corpus.
+    """
+    return os.path.isfile(os.path.join(path, INDEX_FILE_NAME)) and os.path.isfile(os.path.join(path, DATA_FILE_NAME))
+
+
+class CorpusWriter:
+    """Append the interesting inputs to a packed corpus in the background.
+
+    :param corpus_dir: The corpus directory (created if missing). An existing corpus is appended to.
+    :param flush_every: The number of records written between two flushes of the files.
+    """
+
+    def __init__(self, corpus_dir: str, flush_every: int = 256):
+        """Constructor method
+        """
+        os.makedirs(corpus_dir, exist_ok=True)
+        self.corpus_dir = corpus_dir
+        self.flush_every = flush_every
+
+        # the content hashes already in the data file (of an existing corpus) and where their bytes are.
+        self._stored: Dict[str, Tuple[int, int]] = {}
+        for record in read_index(corpus_dir) if is_corpus_dir(corpus_dir) else []:
+            self._stored.setdefault(record['sha'], (record['offset'], record['size']))
+
+        self.saved = 0  # index records written
+        self.stored_bytes = 0  # bytes appended to the data file (duplicates are not stored)
+
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = threading.Thread(target=self._write, name="corpus-writer",
+                                                                     daemon=True)
+        self._thread.start()
+
+    def add(self, generated_input: bytes, hnb: bool, hnm: bool, hnc: bool, hs: int, ac: int, tokens_used: int,
+            input_id: int, exec_count: int, cur_ms: int, dur: int):
+        """Queue an input to be saved. The input is hashed and written by the writer thread.
+
+        :param generated_input: The input to be saved.
+        :param hnb: The value of has-new-bits (coverage).
+        :param hnm: The value of has-new-max.
+        :param hnc: The value of has new cost.
+        :param hs: The hotspot exhibited by the given input.
+        :param ac: The cost exhibited by the given input.
+        :param tokens_used: The number of tokens used to find the given input.
+        :param input_id: The input ID.
+        :param exec_count: The execution cont by the time this input was found.
+        :param cur_ms: The current time when the input was found in milliseconds.
+        :param dur: The duration value when the input was found during the run.
+        """
+        self._queue.put((input_id, ac, hs, int(bool(hnb)), int(hnm), int(hnc), exec_count, len(generated_input),
+                         tokens_used, cur_ms, dur, generated_input))
+
+    def _write(self):
+        written = 0
+        data_path = os.path.join(self.corpus_dir, DATA_FILE_NAME)
+        with open(data_path, 'ab') as data_file, \
+                open(os.path.join(self.corpus_dir, INDEX_FILE_NAME), 'a') as index_file:
+            offset = data_file.tell()
+            while True:
+                item = self._queue.get()
+                if item is _CLOSE:
+                    break
+                record = dict(zip(_FIELDS, item[:-1]))
+                data = item[-1]
+                sha = hashlib.sha256(data).hexdigest()
+                stored = self._stored.get(sha)
+                if stored is None:
+                    data_file.write(data)
+                    stored = (offset, len(data))
+                    self._stored[sha] = stored
+                    offset += len(data)
+                    self.stored_bytes += len(data)
+                record['sha'] = sha
+                record['offset'], record['size'] = stored
+                index_file.write(json.dumps(record, separators=(',', ':')))
+                index_file.write('\n')
+                written += 1
+                self.saved = written
+                if written % self.flush_every == 0:
+                    data_file.flush()  # the bytes go first, so an index record never points past the data
+                    index_file.flush()
+
+    def close(self):
+        """Write all the queued inputs and close the files.
+        """
+        if self._thread is not None:
+            self._queue.put(_CLOSE)
+            self._thread.join()
+            self._thread = None
+
+
+def read_index(corpus_dir: str) -> List[dict]:
+    """Load the index of a packed corpus. A partially written last record (e.g., the search was killed) is ignored.
+
+    :param corpus_dir: The corpus directory.
+    :return: The index records in the order the inputs were saved.
+    """
+    records = []
+    with open(os.path.join(corpus_dir, INDEX_FILE_NAME), 'r') as index_file:
+        for line in index_file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+def iter_inputs(corpus_dir: str, records: Optional[List[dict]] = None) -> Iterator[Tuple[dict, bytes]]:
+    """Iterate over the inputs of a packed corpus.
+
+    :param corpus_dir: The corpus directory.
+    :param records: The index records to read (None reads all of them).
+    :return: An iterator of (index record, input bytes).
+    """
+    if records is None:
+        records = read_index(corpus_dir)
+    with open(os.path.join(corpus_dir, DATA_FILE_NAME), 'rb') as data_file:
+        for record in records:
+            data_file.seek(record['offset'])
+            data = data_file.read(record['size'])
+            if len(data) != record['size']:
+                raise RuntimeError(f"The corpus data in {corpus_dir} is truncated at the input {record['id']}")
+            yield record, data
+
+
+def export_to_files(corpus_dir: str, output_dir: str,
+                    file_name: Callable[[dict], str] = input_file_name, skip_duplicates: bool = False) -> int:
+    """Write each input of a packed corpus to its own file (the old buffer/ layout by default). The modification time
+    of each file is set to the creation time of its input, as the file written during the search would have.
+
+    :param corpus_dir: The corpus directory.
+    :param output_dir: Where the files are written (created if missing).
+    :param file_name: Maps an index record to its file name.
+    :param skip_duplicates: If True, only the first record of each content hash is exported.
+    :return: The number of files written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    seen = set()
+    count = 0
+    for record, data in iter_inputs(corpus_dir):
+        if skip_duplicates:
+            if record['sha'] in seen:
+                continue
+            seen.add(record['sha'])
+        path = os.path.join(output_dir, file_name(record))
+        with open(path, 'wb') as input_file:
+            input_file.write(data)
+        crtime_s = record['crtime'] / 1_000
+        os.utime(path, (crtime_s, crtime_s))
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a packed corpus to a file per input (the buffer/ layout).")
+    parser.add_argument("corpus", type=str, help="The corpus directory (with corpus.dat and index.jsonl).")
+    parser.add_argument("output", type=str, help="The directory to write the inputs to.")
+    parser.add_argument("--unique", action="store_true", help="Only export the first input of each content hash.")
+    args = parser.parse_args()
+
+    if not is_corpus_dir(args.corpus):
+        raise RuntimeError(f'The path given in corpus "{args.corpus}" is not a packed corpus')
+    print(f"Exported {export_to_files(args.corpus, args.output, skip_duplicates=args.unique)} inputs to {args.output}")
@@ -0,0 +1,88 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+A compact, machine-readable trace of every execution made during a search, written by a background thread so the search
+loop only pays for putting a tuple in a queue. It replaces the free-text per-execution log line in traces.log.
+
+The trace is a JSON lines file (exec-trace.jsonl) with one object per execution:
+    {"i": 12, "ms": 1530, "cost": 7186, "hs": 42, "hnb": 0, "hnm": 0, "hnc": 1, "hnh": 0, "reward": 0.93, "len": 17,
+     "tu": 17, "anom": 0, "input": "..."}
+The input bytes are stored as a latin-1 decoded string, which maps each byte to one character, thus
+record["input"].encode('latin-1') gives back the exact bytes.
+"""
+
+import json
+import queue
+import threading
+from typing import Optional
+
+EXEC_TRACE_FORMATS = ['none', 'jsonl']
+"""The supported execution trace formats."""
+
+_FIELDS = ('i', 'ms', 'cost', 'hs', 'hnb', 'hnm', 'hnc', 'hnh', 'reward', 'len', 'tu', 'anom', 'input')
+_CLOSE = object()
+
+
+class ExecTraceWriter:
+    """Write the execution trace in the background.
+
+    :param file_path: The trace file.
+    :param flush_every: The number of records written between two flushes of the file.
+    :param append: If True, the records are appended to an existing trace (e.g., of a resumed search).
+    """
+
+    def __init__(self, file_path: str, flush_every: int = 1024, append: bool = False):
+        """Constructor method
+        """
+        self.file_path = file_path
+        self.flush_every = flush_every
+        self.append = append
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = threading.Thread(target=self._write, name="exec-trace",
+                                                                     daemon=True)
+        self._thread.start()
+
+    def record(self, i: int, ms: int, cost: int, hs: int, hnb: int, hnm: bool, hnc: bool, hnh: bool, reward: float,
+               tokens_used: int, is_anomalous: bool, text: bytes):
+        """Queue the record of an execution. The record is serialized by the writer thread.
+
+        :param i: The iteration (execution) number.
+        :param ms: The milliseconds since the search started.
+        :param cost: The execution cost.
+        :param hs: The hotspot.
+        :param hnb: The has-new-bits value (0, 1, or 2).
+        :param hnm: Whether there was a new max for some edge.
+        :param hnc: Whether it is a new max cost.
+        :param hnh: Whether it is a new max hotspot.
+        :param reward: The reward given (None if no reward was computed, e.g., random search or anomalous runs).
+        :param tokens_used: The tokens used to derive the input.
+        :param is_anomalous: Whether the run was anomalous.
+        :param text: The input.
+        """
+        self._queue.put((i, ms, cost, hs, hnb, int(hnm), int(hnc), int(hnh), reward, len(text), tokens_used,
+                         int(is_anomalous), text))
+
+    def _write(self):
+        written = 0
+        with open(self.file_path, 'a' if self.append else 'w') as trace_file:
+            while True:
+                item = self._queue.get()
+                if item is _CLOSE:
+                    break
+                record = dict(zip(_FIELDS, item))
+                record['input'] = record['input'].decode('latin-1')
+                trace_file.write(json.dumps(record, separators=(',', ':')))
+                trace_file.write('\n')
+                written += 1
+                if written % self.flush_every == 0:
+                    trace_file.flush()
+
+    def close(self):
+        """Write all the queued records and close the file.
+        """
+        if self._thread is not None:
+            self._queue.put(_CLOSE)
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,103 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+A cache of the grammars as the search uses them: parsed, transformed (FactorEmpty), and annotated with their costs.
+Parsing a large inferred grammar (e.g., flex-arvada.gram) takes a noticeable part of a second before the first
+execution, and it used to be repeated by every experiment (and every grid worker). A cached grammar is a pickle of the
+grammar with its dump, keyed by the hash of the grammar file content and the parser options:
+
+    <cache dir>/<key>.pickle
+
+The files are written atomically and never modified afterwards, so any number of processes can share them read-only.
+Within a process the pickled bytes are also kept in memory (and inherited by forked workers), each load returns a fresh
+copy of the grammar.
+"""
+
+import os
+import sys
+import json
+import pickle
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+
+from pygramm import config
+from pygramm.llparse import parse
+from pygramm.grammar import Grammar, FactorEmpty
+
+log = logging.getLogger("GrammarCache")
+
+_CACHE_VERSION = 1
+_loaded: Dict[str, bytes] = {}  # the pickled grammars loaded by this process, by key
+
+
+def _pygramm_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("pygramm")
+    except Exception:  # e.g., pygramm is used from the submodule without being installed
+        return ""
+
+
+def cache_key(content: bytes, len_based_size: bool) -> str:
+    """
+    :param content: The content of the grammar file.
+    :param len_based_size: The size option of the parser (see pygramm.llparse.parse).
+    :return: The key of the grammar in the cache.
+    """
+    options = json.dumps({'version': _CACHE_VERSION, 'len_based_size': len_based_size, 'factor_empty': True,
+                          'pygramm': _pygramm_version(), 'python': list(sys.version_info[:2])}, sort_keys=True)
+    return hashlib.sha256(options.encode('utf-8') + b'\0' + content).hexdigest()
+
+
+def _parse(gram_file: str, len_based_size: bool) -> Grammar:
+    with open(gram_file, 'r') as src:
+        gram = parse(src, len_based_size=len_based_size)
+    xform = FactorEmpty(gram)
+    xform.transform_all_rhs(gram)
+    return gram
+
+
+def load_grammar(gram_file: str, cache_dir: Optional[str] = None, len_based_size: bool = True) -> Tuple[Grammar, str]:
+    """Load the grammar of a file as the search uses it, from the cache if it was parsed before.
+
+    :param gram_file: The grammar file.
+    :param cache_dir: The cache directory (created if missing). None parses the file without caching.
+    :param len_based_size: Measure the literals by their length (True) or as a single token each (False).
+    :return: A tuple of (the grammar, its dump with the cost annotations).
+    """
+    if cache_dir is None:
+        gram = _parse(gram_file, len_based_size)
+        return gram, gram.dump()
+
+    with open(gram_file, 'rb') as src:
+        key = cache_key(src.read(), len_based_size)
+    cache_file = os.path.join(cache_dir, f"{key}.pickle")
+
+    data = _loaded.get(key)
+    if data is None and os.path.isfile(cache_file):
+        with open(cache_file, 'rb') as cached:
+            data = cached.read()
+    if data is not None:
+        try:
+            # the sizes not computed yet (and cached) by the literals are computed given the global option
+            config.LEN_BASED_SIZE = len_based_size
+            gram, dump = pickle.loads(data)
+            _loaded[key] = data
+            gram.gram_name = os.path.basename(gram_file)  # files with the same content share the entry
+            return gram, dump
+        except Exception as e:  # e.g., a cache written by an incompatible pygramm, parse it again
+            log.warning(f"Could not load the cached grammar {cache_file} ({e!r}), parsing {gram_file} again")
+
+    gram = _parse(gram_file, len_based_size)
+    dump = gram.dump()
+    data = pickle.dumps((gram, dump), protocol=pickle.HIGHEST_PROTOCOL)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'wb') as cached:
+        cached.write(data)
+    os.replace(tmp_file, cache_file)
+    _loaded[key] = data
+    return gram, dump
@@ -5,22 +5,51 @@ __status__ = "Testing"
 import os
 import gc
 import time
+import bisect
 import random
 import pickle as cpickle
 import datetime
 import collections
-from typing import Tuple
+from typing import Tuple, Iterator, List, Optional, IO
 from itertools import count
 
-import numpy as np
-import psutil
-from tdigest import TDigest
-
 import helpers as helper
 from pygramm.llparse import *
 from pygramm.grammar import Grammar
+from pygramm.biased_choice import Bias
 import mcts.mcts_globals as mg  # MCTS globals
 from mcts.mctsnode import MCTSNode
+from mcts.search_context import SearchContext
+from mcts.pipeline import DerivationPipeline
+from executors import Executor
+from mcts.profiler import PhaseProfiler
+from mcts.metrics import SearchMetrics, Throttle
+from mcts.tree_stats import TreeStats, MemoryTracer, process_rss
+from mcts.exec_trace import ExecTraceWriter, EXEC_TRACE_FORMATS
+from mcts.progress_writer import ProgressWriter
+from mcts.corpus import CorpusWriter, CORPUS_FORMATS, CORPUS_DIR_NAME
+from mcts.tree_export import TreeExportOptions, write_dot, write_text
+from mcts import seeding
+from mcts import bias_store
+
+# the columns of the progress reports
+_TREELINE_PROGRESS_COLUMNS = ['execution_cost', 'iter', 'duration', 'rollouts', 'expansions', 'edges', 'reward', 'hnb',
+                              'hnm', 'hs', 'hot_nodes', 'tokens_used', 'refresh_threshold', 'uniqueness_percentage',
+                              'tail_len', 'len_weight']
+_RANDOM_PROGRESS_COLUMNS = ['execution_cost', 'iter', 'duration', 'rollouts', 'hnb', 'hnm', 'hs', 'tokens_used',
+                            'tail_len', 'len_weight']
+
+# the per-execution log lines (formatted lazily, only if the record is not filtered out)
+_EXEC_LOG_FORMAT = "hnb:%d, hnm:%d, hnc:%d, hnh:%d, hs:%010d, cost:%010d, reward:%02f, len:%d, anomalous:%d, input:%s"
+_RANDOM_EXEC_LOG_FORMAT = "hnb:%d, hnm:%d, hnc:%d, hnh:%d, hs:%010d, cost:%010d, len:%d, anomalous:%d, input:%s"
+
+
+# the attributes saved in a checkpoint of a search (see MonteCarloTreeSearch.save_checkpoint).
+_CHECKPOINT_STATE = ('gram', 'root', 'digest', 'len_weight', 'len_buffer', 'is_raw_len_based_reward',
+                     'decided_to_always_go_with_full_input_len', 'weight_len_increase_skip_counter',
+                     'exec_since_last_reset', 'reset_counter', 'tail_len', 'cost_reward_scaling',
+                     'count_of_anomalous_runs', 'max_observed_cost', 'min_observed_cost', 'max_observed_hotspot',
+                     'surrogate', 'report_dict', 'exec_count', 'input_id', 'search_ms', 'hot_nodes', 'execution_costs')
 
 
 class MonteCarloTreeSearch:
@@ -38,16 +67,55 @@ class MonteCarloTreeSearch:
     :param tail_len: A tail size used to check for tree stabilization (reset or not) and uniqueness
     :param max_threshold: Used to establish an epsilon strategy for tree dropping threshold.
     :param threshold_decay: Used to establish an epsilon strategy for tree dropping threshold.
+    :param surrogate_candidates: The number of candidate rollouts derived for each selected node. Only the most
+        promising candidate (given the surrogate cost model) is executed. A value of 1 disables the surrogate.
+    :param surrogate_exploration: The probability of executing a random candidate instead of the most promising one.
+    :param bias: A bias table to start from (e.g., loaded from a previous run). A fresh one is used if None.
+    :param profile_phases: If True, time each phase of the search iterations (see mcts.profiler).
+    :param profiler_sampler: A heavier profiler to attach to the whole search ('none', 'cprofile', or 'sampling').
+    :param profiler_interval_ms: The interval between stack samples of the 'sampling' profiler.
+    :param metrics_port: The local port serving the live metrics (Prometheus text format). Zero disables it.
+    :param metrics_snapshot_interval_s: The interval between live metrics snapshots (metrics.json in the output dir).
+        Zero disables the snapshots.
+    :param progress_bar_hz: The maximum redraws per second of the console progress bar. Zero hides it.
+    :param trace_memory: If True, trace the allocations with tracemalloc and report them each time a tree is dropped.
+    :param exec_trace: The format of the per-execution trace ('none' or 'jsonl'). If set, the trace replaces the
+        per-execution info line in the log.
+    :param progress_sampling: Which executions are kept in the progress report ('all', 'every_n', or 'events').
+    :param progress_every_n: The sampling rate of 'every_n'.
+    :param progress_chunk_rows: The number of progress rows buffered before they are appended to the report.
+    :param corpus_format: How the interesting inputs are saved: a file per input in buffer/ ('files') or a packed
+        corpus in corpus/ ('packed', see mcts.corpus).
+    :param tree_export_top_k: Export only the k most visited children of each node when a tree is written to file.
+        Zero exports all of them.
+    :param tree_export_max_depth: Export only the nodes up to this many levels below the root. Negative has no limit.
+    :param tree_export_min_visits: Export only the nodes visited at least this many times.
+    :param tree_export_best_path_only: Export only the best (max UCB1) path from the root.
+    :param seed: The seed of the random generator the search draws from (the rollouts, the bias, and the surrogate), so
+        the same search against the same answers (e.g., a replay) makes the same executions. None leaves it unseeded.
+    :param context: The state of this search (C, E, literal encoding, and the connection to the target server). None
+        uses the global defaults (see mcts_globals) and connects to the target server at localhost:2300.
     """
 
     def __init__(self, gram: Grammar, output_dir: str, expr_id: str, budget: int, reward_type: str,
                  use_locking: bool = False, use_bias: bool = False, cost_reward_scaling: int = 1,
-                 tail_len: int = 5000, max_threshold: float = 0.5, threshold_decay: float = 0.0001):
+                 tail_len: int = 5000, max_threshold: float = 0.5, threshold_decay: float = 0.0001,
+                 surrogate_candidates: int = 1, surrogate_exploration: float = 0.2, bias: Bias = None,
+                 profile_phases: bool = True, profiler_sampler: str = 'none', profiler_interval_ms: float = 5.0,
+                 metrics_port: int = 0, metrics_snapshot_interval_s: float = 0.0, progress_bar_hz: float = 4.0,
+                 trace_memory: bool = False, exec_trace: str = 'none', progress_sampling: str = 'all',
+                 progress_every_n: int = 100, progress_chunk_rows: int = 1024, corpus_format: str = 'files',
+                 tree_export_top_k: int = 0, tree_export_max_depth: int = -1, tree_export_min_visits: int = 0,
+                 tree_export_best_path_only: bool = False, seed: Optional[int] = None, context: SearchContext = None):
         """
         The initializer of the TreeLine  and BiasOnly algorithms.
         """
         self.log = logging.getLogger(self.__class__.__name__)
 
+        self.rng_seed = seed
+        if seed is not None:
+            random.seed(seed)
+
         self.output_dir = output_dir
         self.expr_id = expr_id
         self.use_locking = use_locking
@@ -56,12 +124,16 @@ class MonteCarloTreeSearch:
         self.gram = gram
         self.allowed_budget = budget
         self.reward_type = reward_type
-        self.root = MCTSNode(budget=self.allowed_budget, text="", stack=[self.gram.start], tokens=0,
-                             use_locking=use_locking)
-        self.root.start_connection()  # TODO: do we have to establish connection while the MCTSnode does it?
+        context = SearchContext() if context is None else context
+        context.prepare_grammar(gram)  # fails on a literal the encoding can't encode (before the search starts)
+        self.root = MCTSNode(budget=self.allowed_budget, text=b"", stack=[self.gram.start], tokens=0,
+                             use_locking=use_locking, bias=bias, context=context)
+        self.context = self.root.context
+        self.root.start_connection()  # the search opens its connection (not the import of mctsnode)
         self.current = self.root
 
         # reward adjustment variables
+        from tdigest import TDigest
         self.digest = TDigest()
         self.len_weight = 0.1  # the length base weight within a reward.
         self.len_buffer = collections.deque(maxlen=100)  # inputs observed lengths buffer.
@@ -82,19 +154,73 @@ class MonteCarloTreeSearch:
         self.min_observed_cost = 0
         self.max_observed_hotspot = 0
 
+        # non-terminal nodes found interesting while seeding the tree (handed to the hot-nodes of the first tree).
+        self.seeded_hot_nodes: List[MCTSNode] = []
+
+        # the progress of the search, kept across the runs of a resumed search (see save_checkpoint).
+        self.exec_count = 0  # the executions (iterations) done so far
+        self.input_id = 0  # the id of the last saved input
+        self.search_ms = 0  # the duration of the search so far
+        self.hot_nodes: List[MCTSNode] = []  # the hot-nodes of the current tree
+        self.execution_costs: List[int] = []  # the costs observed within the current tree (for the uniqueness check)
+
+        # the surrogate cost model used to pre-screen rollouts (if any).
+        self.surrogate_candidates = surrogate_candidates
+        self.surrogate = None
+        if surrogate_candidates > 1:
+            from mcts.surrogate import CostSurrogate  # numpy is only imported by the searches that use it
+            self.surrogate = CostSurrogate(budget=self.allowed_budget, exploration=surrogate_exploration)
+
+        # the timers of the search phases (and the optional sampler).
+        self.profiler = PhaseProfiler(enabled=profile_phases, sampler=profiler_sampler,
+                                      sample_interval_ms=profiler_interval_ms)
+
+        # the live metrics of the search (and how often we redraw the console progress bar).
+        snapshot_file = f"{self.output_dir}metrics.json" if metrics_snapshot_interval_s > 0 else None
+        self.metrics = SearchMetrics(search_id=expr_id, port=metrics_port, snapshot_file=snapshot_file,
+                                     snapshot_interval_s=metrics_snapshot_interval_s)
+        self.progress_bar_hz = progress_bar_hz
+
+        # the size and shape of the current tree, and the (optional) tracer of the allocations.
+        self.tree_stats = TreeStats(self.root)
+        self.memory_tracer = MemoryTracer(enabled=trace_memory)
+
+        if exec_trace not in EXEC_TRACE_FORMATS:
+            raise ValueError(f"Unknown execution trace format '{exec_trace}', it must be one of {EXEC_TRACE_FORMATS}")
+        self.exec_trace = exec_trace
+
+        # how the progress report (if extensive data tracking is on) is sampled and streamed to disk.
+        self.progress_sampling = progress_sampling
+        self.progress_every_n = progress_every_n
+        self.progress_chunk_rows = progress_chunk_rows
+
+        if corpus_format not in CORPUS_FORMATS:
+            raise ValueError(f"Unknown corpus format '{corpus_format}', it must be one of {CORPUS_FORMATS}")
+        self.corpus_format = corpus_format
+
+        # how much of a tree is written when it is exported (to dot or text).
+        self.tree_export_options = TreeExportOptions(top_k=tree_export_top_k, max_depth=tree_export_max_depth,
+                                                     min_visits=tree_export_min_visits,
+                                                     best_path_only=tree_export_best_path_only)
+
         # collect initial information for the final report.
         self.report_dict = collections.defaultdict(str)
-        self.report_dict['Globals: E (# of visits before expansion)'] = str(mg.E)
-        self.report_dict['Globals: C (exploration variable)'] = str(mg.C)
+        self.report_dict['Globals: E (# of visits before expansion)'] = str(self.context.e)
+        self.report_dict['Globals: C (exploration variable)'] = str(self.context.c)
         self.report_dict['Globals: Extensive Data Tracking?'] = str(mg.extensive_data_tracking)
         self.report_dict['Config: Cost Reward Scaling Value'] = str(self.cost_reward_scaling)
         self.report_dict['Config: Budget'] = str(self.allowed_budget)
         self.report_dict['Config: Uniqueness tail size'] = str(self.tail_len)
         self.report_dict['Config: Lock Fully Observed Nodes?'] = str(self.use_locking)
         self.report_dict['Config: Use Bias?'] = str(self.use_bias)
+        self.report_dict['Config: Seed'] = str(self.rng_seed)
+        self.report_dict['Config: Started From a Bias Snapshot?'] = str(bias is not None)
         self.report_dict['Config: Tree-Dropping Max Threshold'] = str(max_threshold)
         self.report_dict['Config: Tree-Dropping Decay Rate'] = str(threshold_decay)
         self.report_dict['Config: Grammar name'] = str(gram.gram_name)
+        self.report_dict['Config: Surrogate candidates per rollout'] = str(self.surrogate_candidates)
+        self.report_dict['Config: Profile Phases?'] = str(profile_phases)
+        self.report_dict['Config: Corpus Format'] = corpus_format
         self.report_dict['Stats: # total rollouts'] = str(0)
         self.report_dict['Stats: # total expansions'] = str(0)
         self.report_dict['Stats: # total edges'] = str(0)
@@ -110,10 +236,101 @@ class MonteCarloTreeSearch:
         self.min_observed_cost = ac
 
         # anything below 80% of the min cost is an anomalous run
-        mg.TARGET_APP_MIN_POSSIBLE_COST = self.min_observed_cost
+        self.context.min_possible_cost = self.min_observed_cost
 
         return True
 
+    def seed(self, seed_paths: List[str], max_derivation_steps: int = 100_000) -> int:
+        """Bootstrap the search statistics from a corpus of existing inputs before the main loop starts. For each seed
+        we look for its derivation given the grammar and the budget, then replay it in the tree (only the nodes of its
+        path are created, see seeding.replay_derivation). The derived seeds are executed as one batch and their costs
+        are fed to the digest (reward), the bias, the back-propagated tree statistics, and the hot-nodes of the first
+        tree.
+
+        :Note: The seed executions are not iterations, they come on top of the iterations (or time) of the search that
+            follows, and are reported on their own ('Stats: Seeds - # of executions').
+
+        :param seed_paths: Files or directories of seed inputs.
+        :param max_derivation_steps: The maximum search steps allowed to find the derivation of a single seed.
+        :return: The number of seeds that were derived and executed.
+        """
+        seed_files = seeding.collect_seed_files(seed_paths)
+        print(f"Seeding the tree from {len(seed_files)} seed file(s) ...")
+
+        # find the derivation of each seed and replay it in the tree
+        terminals = []
+        edges = 0
+        for seed_file in seed_files:
+            with open(seed_file, 'rb') as file_:
+                text = file_.read()
+
+            path = seeding.find_derivation(self.root, text, max_steps=max_derivation_steps)
+            if path is None and text != text.rstrip():
+                # most corpora end their files with a newline the grammar might not generate
+                path = seeding.find_derivation(self.root, text.rstrip(), max_steps=max_derivation_steps)
+            if path is None:
+                self.log.info(f"Could not derive the seed {seed_file} given the grammar and budget")
+                continue
+
+            choices = seeding.derivation_choices(self.root, path)
+            terminal, new_edges = seeding.replay_derivation(self.root, path)
+            edges += new_edges
+            terminals.append((terminal, choices))
+        self.tree_stats = TreeStats.from_tree(self.root)
+
+        # execute the derived seeds as one batch, then learn from each run as if it was generated by the search
+        results = self._run_batch([terminal for terminal, _ in terminals])
+        for (terminal, choices), (_, ac, hnb, hnm, hs, is_anomalous) in zip(terminals, results):
+            if is_anomalous:
+                self.count_of_anomalous_runs += 1
+                continue
+
+            if self.use_bias:
+                seed_bias = self.root.bias.fork()
+                seed_bias.history = choices
+                if ac > self.max_observed_cost or hnb or hnm:
+                    seed_bias.reward()
+                else:
+                    seed_bias.penalize()
+            if self.surrogate is not None:
+                self.surrogate.observe(terminal, ac)
+
+            if hnb:
+                terminal.set_hnb(hnb)
+            if hnm:
+                terminal.set_hnm(hnm)
+            if self.has_new_hotspot(hs):
+                terminal.set_hotspot(hs)
+            hnc = self.has_new_cost(ac)
+
+            # the deepest non-terminal of the derivation is the node we would have rolled out from
+            if (hnb or hnm or hnc) and terminal.parent not in self.seeded_hot_nodes:
+                self.seeded_hot_nodes.append(terminal.parent)
+
+            self.exec_since_last_reset += 1
+            self.current = terminal
+            self._backpropagate(self._get_reward(cost=ac, input_len=terminal.tokens_used))
+            if self.use_locking:
+                terminal.locked = True
+        self.current = self.root
+
+        self.report_dict['Stats: Seeds - # of seed files'] = str(len(seed_files))
+        self.report_dict['Stats: Seeds - # of derived seeds'] = str(len(terminals))
+        self.report_dict['Stats: Seeds - # of edges created'] = str(edges)
+        self.report_dict['Stats: Seeds - # of executions'] = str(len(results))
+        self.report_dict['Stats: Seeds - # of hot-nodes'] = str(len(self.seeded_hot_nodes))
+        self.report_dict['Stats: Seeds - Max Seed Cost'] = "{:,}".format(max((r[1] for r in results), default=0))
+        print(f"Seeded the tree with {len(terminals)} of {len(seed_files)} seed(s)")
+        return len(terminals)
+
+    def _run_batch(self, terminals: List[MCTSNode]) -> List[Tuple[bytes, int, int, bool, int, bool]]:
+        """Execute a batch of terminal nodes.
+
+        :param terminals: The terminal nodes to run.
+        :return: The run information of each node in the same order (see MCTSNode.run).
+        """
+        return [terminal.run() for terminal in terminals]
+
     def treeline(self, is_time_based: bool, time_cap_h=1, num_iter=100):
         """
         The main method to run (train) the algorithm. An iteration is a derivation that starts from the root node. Any
@@ -126,36 +343,52 @@ class MonteCarloTreeSearch:
         """
 
         buffer_dir = f"{self.output_dir}buffer/"  # dir to track cov and max inputs
-        os.makedirs(buffer_dir)
+        corpus = self._open_corpus()
+        if corpus is None:
+            os.makedirs(buffer_dir, exist_ok=self.is_resumed())
 
-        # tracking variables
+        # tracking variables (the tree operations are counted from the start of this run)
         rollouts = 0
         expansions = 0
         edges = 0
-        input_id = 0
-        execution_costs = []
+        input_id = self.input_id
+        execution_costs = self.execution_costs
 
         """
-        The progress_report is dictionary to track as much numerical information as possible with each step. This will
-        only be used if the global variable for data tracking (extensive_data_tracking) is set to True. The information
-        stored in the dictionary will be written to disc at the end of the run. The flag extensive_data_tracking should
+        The progress_report tracks as much numerical information as possible with each step. This will only be used if
+        the global variable for data tracking (extensive_data_tracking) is set to True. The information is streamed to
+        disc in chunks as the search progresses (see mcts.progress_writer). The flag extensive_data_tracking should
         only be set to True if you're interested in extensively analysing how the algorithm is progressing during the
         search process at each step. Otherwise, it should be disabled for performance.
         """
-        progress_report = collections.defaultdict(list)
+        progress_report = self._open_progress_report("progress-report", _TREELINE_PROGRESS_COLUMNS, num_iter)
 
         # TreeLine related variables
-        hot_nodes: List[MCTSNode] = []  # hot_nodes of all hnb, hnm, or hnc non-terminal nodes.
-        top_n_hot_nodes: List[MCTSNode] = []  # top n nodes from hot_nodes given their UCT value at some point
+        # hot_nodes of all hnb, hnm, or hnc non-terminal nodes (starting with the ones found by seeding if any).
+        if not self.is_resumed():
+            self.hot_nodes = list(self.seeded_hot_nodes)
+        hot_nodes: List[MCTSNode] = self.hot_nodes
+        # top n nodes from hot_nodes given their UCT value at some point
+        top_n_hot_nodes: List[MCTSNode] = list(helper.top_n(hot_nodes, n=10, key=lambda n: n.get_ucb1()))
         hot_node_prop_threshold = 0.5  # the probability of selecting a node from the hot_nodes vs. using the root node
 
         print()  # make a space for the progress bar (info).
         expr_max_time = datetime.timedelta(hours=time_cap_h)  # maximum possible time in case of time-based runs
-        start = time.time_ns() // 1_000_000  # get time in milliseconds from epoch to label inputs.
-        expr_start_time = datetime.datetime.now()  # expr start time in case of time-based run.
+        # get time in milliseconds from epoch to label inputs (a resumed search continues from its duration so far).
+        start = time.time_ns() // 1_000_000 - self.search_ms
+        # expr start time in case of time-based run.
+        expr_start_time = datetime.datetime.now() - datetime.timedelta(milliseconds=self.search_ms)
+        profiler = self.profiler
+        profiler.start()
+        metrics = self.metrics
+        metrics.start(algorithm='treeline')
+        progress_throttle = Throttle(self.progress_bar_hz)
+        trace = self._open_exec_trace()
+        log_debug = self.log.isEnabledFor(logging.DEBUG)  # the level is fixed for the whole search
+        log_info = self.log.isEnabledFor(logging.INFO) and trace is None
 
         # ready to search for expensive input
-        for i in count(1):  # this will loop forever. We check for break condition at the end based on duration base.
+        for i in count(self.exec_count + 1):  # loop forever. We check for break condition at the end based on duration.
 
             self.current = self.root  # let make sure we have a node to do a search
 
@@ -177,31 +410,40 @@ class MonteCarloTreeSearch:
                                                                 1-self.max_threshold)
 
             # progress bar (info) prints (different for time vs. iter based).
-            helper.progress_bar(is_time_based=is_time_based, start_time=expr_start_time, iter_counter=i,
-                                num_rollouts=rollouts, num_expansions=expansions, num_edges=edges,
-                                num_hot_nodes=len(hot_nodes), max_reward=self.cost_reward_scaling,
-                                refresh_threshold=refresh_threshold, uniqueness_per=uniqueness_percentage,
-                                tail_len=self.tail_len, len_reward_weight=self.len_weight, total_allowed_iter=num_iter)
-
-            self.log.debug(f"Iter: {i}")
+            if progress_throttle.ready():
+                with profiler.phase('progress_bar'):
+                    helper.progress_bar(is_time_based=is_time_based, start_time=expr_start_time, iter_counter=i,
+                                        num_rollouts=rollouts, num_expansions=expansions, num_edges=edges,
+                                        num_hot_nodes=len(hot_nodes), max_reward=self.cost_reward_scaling,
+                                        refresh_threshold=refresh_threshold, uniqueness_per=uniqueness_percentage,
+                                        tail_len=self.tail_len, len_reward_weight=self.len_weight,
+                                        total_allowed_iter=num_iter)
+
+            if log_debug:
+                self.log.debug("Iter: %d", i)
 
             # OK, now we have some node and would like to travers the tree based on the UCB1 value.
-            while not self.current.is_leaf():  # a leaf node is either a terminal node or a non-expanded node yet.
-                best_child = self._select()
-                self.current = best_child
+            with profiler.phase('select'):
+                while not self.current.is_leaf():  # a leaf node is either a terminal node or a non-expanded node yet.
+                    best_child = self._select()
+                    self.current = best_child
 
             # if all nodes are expanded, and we reach a terminal node, ask for app execution to get the cost
             if self.current.is_terminal():
-                final_input, ac, hnb, hnm, hs, is_anomalous = self.current.run()
+                with profiler.phase('run'):
+                    final_input, ac, hnb, hnm, hs, is_anomalous = self.current.run()
                 tokens_used = self.current.tokens_used
+                if self.surrogate is not None and not is_anomalous:
+                    self.surrogate.observe(self.current, ac)
 
                 # update the bias if we are using it.
                 # TODO: The terminal node is a special case, but can we update the bias only in one place?
                 if self.use_bias:
-                    if ac > self.max_observed_cost or hnb or hnm:
-                        self.current.bias.reward()
-                    else:
-                        self.current.bias.penalize()
+                    with profiler.phase('reward'):
+                        if ac > self.max_observed_cost or hnb or hnm:
+                            self.current.bias.reward()
+                        else:
+                            self.current.bias.penalize()
 
                 # we never want to visit this node again if possible
                 if self.use_locking and not is_anomalous:
@@ -213,7 +455,8 @@ class MonteCarloTreeSearch:
                 rollouts += 1
 
             else:  # the node is not terminal and not new, expand it then do a rollout from one of its children.
-                edges += self.expand()
+                with profiler.phase('expand'):
+                    edges += self.expand()
                 expansions += 1
                 self.current = self.current.get_children()[0]  # set first child as current as all of them are new
                 final_input, ac, hnb, hnm, hs, is_anomalous, tokens_used = self.rollout()
@@ -229,6 +472,8 @@ class MonteCarloTreeSearch:
             if hnh:
                 self.current.set_hotspot(hs)
             hnc = self.has_new_cost(ac)  # calling it updates the known max cost in treeline side
+            metrics.record_execution(profiler.last_ns('run'), is_anomalous, self.max_observed_cost,
+                                     self.max_observed_hotspot)
 
             # shall we add the current node to hot_nodes?
             if not self.current.is_terminal():  # no value of adding terminals to hot-nodes
@@ -241,17 +486,21 @@ class MonteCarloTreeSearch:
             else:
                 self.exec_since_last_reset += 1
                 # first back-propagate from current node given the reward.
-                reward = self._get_reward(cost=ac, input_len=tokens_used)
-                self._backpropagate(reward)
+                with profiler.phase('reward'):
+                    reward = self._get_reward(cost=ac, input_len=tokens_used)
+                with profiler.phase('backprop'):
+                    self._backpropagate(reward)
 
                 # log the run info for debugging with high priority to hnc as we want to always see it
-                log_message = f"hnb:{hnb}, hnm:{int(hnm)}, hnc:{int(hnc)}, hnh:{int(hnh)}, hs:{hs:010d}, "\
-                              f"cost:{ac:010d}, reward:{reward:02f}, len:{len(bytes(final_input, 'utf-8'))}," \
-                              f" anomalous:{int(is_anomalous)}, input:{final_input.encode()}"
-                if hnc:
-                    self.log.warning(log_message)  # not actually a warning, but this will make it standout
-                else:
-                    self.log.info(log_message)
+                with profiler.phase('logging'):
+                    if trace is not None:
+                        trace.record(i=i, ms=time.time_ns() // 1_000_000 - start, cost=ac, hs=hs, hnb=hnb, hnm=hnm,
+                                     hnc=hnc, hnh=hnh, reward=reward, tokens_used=tokens_used,
+                                     is_anomalous=is_anomalous, text=final_input)
+                    if hnc or log_info:
+                        # not actually a warning, but this will make it standout
+                        self.log.log(logging.WARNING if hnc else logging.INFO, _EXEC_LOG_FORMAT, hnb, hnm, hnc, hnh,
+                                     hs, ac, reward, len(final_input), is_anomalous, final_input)
 
                 end = time.time_ns() // 1_000_000  # get time in milliseconds from epoch. Tracking input generation time
                 elapsed_time = end - start
@@ -259,27 +508,26 @@ class MonteCarloTreeSearch:
                 # append the cost for uniqueness check
                 execution_costs.append(ac)
 
-                # track the run info in dict for detailed analysis if desired.
-                if mg.extensive_data_tracking:
-                    # collect this iter information
-                    temp_progress_data = {'execution_cost': ac, 'iter': i, 'duration': elapsed_time,
-                                          'rollouts': rollouts, 'expansions': expansions, 'edges': edges,
-                                          'reward': reward, 'hnb': hnb, 'hnm': int(hnm), 'hs': hs,
-                                          'hot_nodes': len(hot_nodes), 'tokens_used': tokens_used,
-                                          'refresh_threshold': refresh_threshold,
-                                          'uniqueness_percentage': uniqueness_percentage, 'tail_len': self.tail_len,
-                                          'len_weight': self.len_weight}
-                    # append it to each corresponding key in the progress report
-                    for key, value in temp_progress_data.items():
-                        progress_report[key].append(value)
+                # track the run info for detailed analysis if desired (the order of _TREELINE_PROGRESS_COLUMNS).
+                if progress_report is not None:
+                    progress_report.add((ac, i, elapsed_time, rollouts, expansions, edges, reward, hnb, int(hnm), hs,
+                                         len(hot_nodes), tokens_used, refresh_threshold, uniqueness_percentage,
+                                         self.tail_len, self.len_weight), is_event=bool(hnb or hnm or hnc))
 
             # main tracker: save inputs if interesting (we don't save all inputs).
             if hnb or hnm or hnc:
                 cur_ms = time.time_ns() // 1_000_000
                 input_id += 1
-                helper.save_input(generated_input=final_input, hnb=bool(hnb), hnm=hnm, hnc=hnc, hs=hs, ac=ac,
-                                  tokens_used=tokens_used, output_dir=buffer_dir, input_id=input_id, exec_count=i,
-                                  cur_ms=cur_ms, dur=cur_ms-start)
+                metrics.saved_inputs += 1
+                with profiler.phase('save_input'):
+                    if corpus is not None:
+                        corpus.add(generated_input=final_input, hnb=bool(hnb), hnm=hnm, hnc=hnc, hs=hs, ac=ac,
+                                   tokens_used=tokens_used, input_id=input_id, exec_count=i, cur_ms=cur_ms,
+                                   dur=cur_ms-start)
+                    else:
+                        helper.save_input(generated_input=final_input, hnb=bool(hnb), hnm=hnm, hnc=hnc, hs=hs, ac=ac,
+                                          tokens_used=tokens_used, output_dir=buffer_dir, input_id=input_id,
+                                          exec_count=i, cur_ms=cur_ms, dur=cur_ms-start)
 
             # Tree-Dropping-Case-1: evaluate if the current tree should be dropped based on stabilization
             if self.exec_since_last_reset >= self.tail_len:  # did we give it enough runs according to the tail?
@@ -310,6 +558,10 @@ class MonteCarloTreeSearch:
                 execution_costs = []
                 self._reset()  # now we can drop the tree and start a new one.
 
+            metrics.update_tree(tree_nodes=self.tree_stats.nodes, hot_nodes=len(hot_nodes),
+                                resets=self.reset_counter - 1)
+            metrics.maybe_snapshot()
+
             # checking if we should break the loop based on duration base configuration
             if is_time_based:
                 if datetime.datetime.now() - expr_start_time > expr_max_time:
@@ -322,10 +574,18 @@ class MonteCarloTreeSearch:
 
         # make sure we reset the root to the gram original root at the end of the search.
         self.current = self.root
+        profiler.stop(self.output_dir)
+        metrics.stop()
+        if trace is not None:
+            trace.close()
+        if corpus is not None:
+            corpus.close()
 
         end = time.time_ns() // 1_000_000  # get time in milliseconds from epoch.
         elapsed_time = end - start
         print(f"Elapsed time: {elapsed_time / 60_000} minutes")
+        self.exec_count, self.input_id, self.search_ms = i, input_id, elapsed_time
+        self.execution_costs = execution_costs
 
         # final addition to the general report
         self.report_dict['Period: Run duration(ms)'] = str(elapsed_time)
@@ -339,50 +599,74 @@ class MonteCarloTreeSearch:
         self.report_dict['Results: Max Observed Hotspot'] = "{:,}".format(self.max_observed_hotspot)
         self.report_dict['Dynamics: final Uniqueness Tail Len'] = str(self.tail_len)
         self.report_dict['Dynamics: final Cost Reward Scaling Value'] = str(self.cost_reward_scaling)
-        self.report_dict['Dynamics: Target App Min Possible Cost'] = str(mg.TARGET_APP_MIN_POSSIBLE_COST)
+        self.report_dict['Dynamics: Target App Min Possible Cost'] = str(self.context.min_possible_cost)
         self.save_tree_info_to_report(rollouts=rollouts, expansions=expansions, edges=edges,
                                       num_hot_nodes=len(hot_nodes), reset_counter=self.reset_counter,
                                       number_of_executions=self.exec_since_last_reset)
+        self.memory_tracer.stop()
 
         # save the bias table for reference (regardless if it is used or not)
         with open(f"{self.output_dir}bias.txt", "w") as bias_file:
             bias_file.write(self.root.bias.__str__())
+        self.save_bias(f"{self.output_dir}bias.json")
 
         # write the last known tree to file TODO: should we write all trees (before dropping them)?
         if mg.extensive_data_tracking:
             self.write_tree_to_file_as_dot()
 
-        # if we collected the progress data, write it to file with full experiment information for reference.
-        if mg.extensive_data_tracking:
-            helper.write_dict_to_csv(data=progress_report, output_dir=self.output_dir,
-                                     file_name=f"progress-report",
-                                     comments=f"grammar: {self.gram.gram_name}, budget: {self.allowed_budget}, "
-                                              f"total-iter: {num_iter}, c: {mg.C}, e: {mg.E}, "
-                                              f"duration(ms): {elapsed_time}, "
-                                              f"total rollouts: {int(self.report_dict['Stats: # total rollouts'])}, "
-                                              f"total expansions: "
-                                              f"{int(self.report_dict['Stats: # total expansions'])}, "
-                                              f"total edges: {int(self.report_dict['Stats: # total edges'])}, "
-                                              f"total anomalous runs: {self.count_of_anomalous_runs}, "
-                                              f"Starting node threshold: {hot_node_prop_threshold}")
-
-    def random_search(self, is_time_based: bool, time_cap_h=1, num_iter=100):
+        # if we collected the progress data, close it with the end of the run information for reference.
+        if progress_report is not None:
+            progress_report.close(comments=f"duration(ms): {elapsed_time}, "
+                                           f"total rollouts: {int(self.report_dict['Stats: # total rollouts'])}, "
+                                           f"total expansions: {int(self.report_dict['Stats: # total expansions'])}, "
+                                           f"total edges: {int(self.report_dict['Stats: # total edges'])}, "
+                                           f"total anomalous runs: {self.count_of_anomalous_runs}, "
+                                           f"Starting node threshold: {hot_node_prop_threshold}")
+
+    def random_search(self, is_time_based: bool, time_cap_h=1, num_iter=100, num_generators: int = 0,
+                      extra_handlers: List[Executor] = ()):
         """
         The main method to run (train) the algorithm. An iteration is a derivation that starts from the root node. Any
         derivation would end at a terminal. However, the reach of the terminal could be based on the tree observed UCB1
         values or random (rollout).
 
+        With num_generators > 0 the derivations are generated by worker processes and executed by a pipeline over the
+        current connection and any additional executors given. This is only possible without the bias and the
+        surrogate, as both of them need the feedback of a run before deriving the next input.
+
         :param is_time_based: A boolean to make the run based on either time cap (True) or num of iteration (False).
         :param num_iter: The number of derivations we would like to do from root to terminal.
         :param time_cap_h: The maximum time allowed for a run in hours.
+        :param num_generators: The number of processes deriving inputs. Zero derives them one at a time in this process.
+        :param extra_handlers: The connected executors of additional targets (e.g., target servers) the pipeline
+            executes inputs on. The search closes them.
         """
         # dir to track cov and max inputs:
         buffer_dir = f"{self.output_dir}buffer/"
-        os.makedirs(buffer_dir)
-
-        # tracking variables
+        corpus = self._open_corpus()
+        if corpus is None:
+            os.makedirs(buffer_dir, exist_ok=self.is_resumed())
+
+        # where the runs come from: either one rollout at a time or a generate/execute pipeline.
+        pipeline = None
+        extra_handlers = list(extra_handlers)
+        if num_generators > 0 and (self.use_bias or self.surrogate is not None):
+            self.log.warning("The generators pipeline can't be used with the bias or the surrogate, "
+                             "deriving one input at a time instead.")
+        elif num_generators > 0:
+            # an executor that runs several inputs at once (e.g., a pool of afl-showmax) is shared by as many threads
+            handlers = [handler for handler in [self.context.input_handler] + extra_handlers
+                        for _ in range(getattr(handler, 'concurrency', 1))]
+            pipeline = DerivationPipeline(gram=self.gram, budget=self.allowed_budget, handlers=handlers,
+                                          num_generators=num_generators, context=self.context)
+            pipeline.start()
+        runs = self._sequential_rollouts() if pipeline is None else pipeline.results()
+        self.report_dict['Config: # of Generator Processes'] = str(0 if pipeline is None else num_generators)
+        self.report_dict['Config: # of Executors'] = str(1 if pipeline is None else len(pipeline.handlers))
+
+        # tracking variables (the rollouts are counted from the start of this run)
         rollouts = 0
-        input_id = 0
+        input_id = self.input_id
 
         """
          The progress_report is dictionary to track as much numerical information as possible with each step. This will
@@ -391,66 +675,87 @@ class MonteCarloTreeSearch:
          only be set to True if you're interested in extensively analysing how the algorithm is progressing during the
          search process at each step. Otherwise, it should be disabled for performance.
          """
-        progress_report = collections.defaultdict(list)
+        progress_report = self._open_progress_report(f"progress-report-{self.expr_id}", _RANDOM_PROGRESS_COLUMNS,
+                                                     num_iter)
 
         print()  # make a space for the progress bar (info).
         expr_max_time = datetime.timedelta(hours=time_cap_h)  # maximum possible time in case of time-based runs
-        start = time.time_ns() // 1_000_000  # get time in milliseconds from epoch to label inputs.
-        expr_start_time = datetime.datetime.now()  # expr start time in case of time-based run.
+        # get time in milliseconds from epoch to label inputs (a resumed search continues from its duration so far).
+        start = time.time_ns() // 1_000_000 - self.search_ms
+        # expr start time in case of time-based run.
+        expr_start_time = datetime.datetime.now() - datetime.timedelta(milliseconds=self.search_ms)
+        profiler = self.profiler
+        profiler.start()
+        metrics = self.metrics
+        metrics.start(algorithm='random')
+        progress_throttle = Throttle(self.progress_bar_hz)
+        trace = self._open_exec_trace()
+        log_debug = self.log.isEnabledFor(logging.DEBUG)  # the level is fixed for the whole search
+        log_info = self.log.isEnabledFor(logging.INFO) and trace is None
 
         # ready to search for expensive input
-        for i in count(1):  # this will loop forever. We check for break condition at the end based on duration base.
+        for i in count(self.exec_count + 1):  # loop forever. We check for break condition at the end based on duration.
 
             self.current = self.root  # always start from the root
 
             # progress bar (info) prints (different for time vs. iter based). Should be in its own function!
-            helper.progress_bar(is_time_based=is_time_based, start_time=expr_start_time, iter_counter=i,
-                                num_rollouts=rollouts, max_reward=self.cost_reward_scaling,
-                                len_reward_weight=self.len_weight, total_allowed_iter=num_iter)
+            if progress_throttle.ready():
+                with profiler.phase('progress_bar'):
+                    helper.progress_bar(is_time_based=is_time_based, start_time=expr_start_time, iter_counter=i,
+                                        num_rollouts=rollouts, max_reward=self.cost_reward_scaling,
+                                        len_reward_weight=self.len_weight, total_allowed_iter=num_iter)
 
-            self.log.debug(f"Iter: {i}")
+            if log_debug:
+                self.log.debug("Iter: %d", i)
 
             # The current node = the root node, we do random search (no UCT eval just random rollout).
-            final_input, ac, hnb, hnm, hs, is_anomalous, tokens_used = self.rollout()  # do a rollout from current
+            final_input, ac, hnb, hnm, hs, is_anomalous, tokens_used, run_ns = next(runs)
             rollouts += 1
+            if pipeline is not None:  # the run was timed by an executor thread, not by the 'run' phase
+                profiler.add('run', run_ns)
 
             # Did we encounter a new hotspot or cost?
             hnh = self.has_new_hotspot(hs)  # calling it updates the known max hs
             hnc = self.has_new_cost(ac)  # calling has_new_cost(x) updates the known max cost
+            metrics.record_execution(run_ns, is_anomalous, self.max_observed_cost, self.max_observed_hotspot)
 
             self.exec_since_last_reset += 1
 
             # log the run info for debugging with high priority to hnc as we want to always see it
-            log_message = f"hnb:{hnb}, hnm:{int(hnm)}, hnc:{int(hnc)}, hnh:{int(hnh)}, hs:{hs:010d}, cost:{ac:010d}, " \
-                          f"len:{len(bytes(final_input, 'utf-8'))}, anomalous:{int(is_anomalous)}, " \
-                          f"input:{final_input.encode()}"
-
-            if hnc:
-                self.log.warning(log_message)  # not actually a warning, but this will make it standout
-            else:
-                self.log.info(log_message)
+            with profiler.phase('logging'):
+                if trace is not None:
+                    trace.record(i=i, ms=time.time_ns() // 1_000_000 - start, cost=ac, hs=hs, hnb=hnb, hnm=hnm,
+                                 hnc=hnc, hnh=hnh, reward=None, tokens_used=tokens_used, is_anomalous=is_anomalous,
+                                 text=final_input)
+                if hnc or log_info:
+                    # not actually a warning, but this will make it standout
+                    self.log.log(logging.WARNING if hnc else logging.INFO, _RANDOM_EXEC_LOG_FORMAT, hnb, hnm, hnc,
+                                 hnh, hs, ac, len(final_input), is_anomalous, final_input)
 
             end = time.time_ns() // 1_000_000  # get time in milliseconds from epoch. Tracking input generation time
             elapsed_time = end - start
 
-            # track the run info in dict for detailed analysis if desired.
-            if mg.extensive_data_tracking:
-                # collect this iter information
-                temp_progress_data = {'execution_cost': ac, 'iter': i, 'duration': elapsed_time,
-                                      'rollouts': rollouts, 'hnb': hnb, 'hnm': int(hnm), 'hs': hs,
-                                      'tokens_used': tokens_used, 'tail_len': self.tail_len,
-                                      'len_weight': self.len_weight}
-                # append it to each corresponding key in the progress report
-                for key, value in temp_progress_data.items():
-                    progress_report[key].append(value)
+            # track the run info for detailed analysis if desired (the order of _RANDOM_PROGRESS_COLUMNS).
+            if progress_report is not None:
+                progress_report.add((ac, i, elapsed_time, rollouts, hnb, int(hnm), hs, tokens_used, self.tail_len,
+                                     self.len_weight), is_event=bool(hnb or hnm or hnc))
 
             # main tracker: save inputs if interesting (we don't save all inputs).
             if hnb or hnm or hnc:
                 cur_ms = time.time_ns() // 1_000_000
                 input_id += 1
-                helper.save_input(generated_input=final_input, hnb=bool(hnb), hnm=hnm, hnc=hnc, hs=hs, ac=ac,
-                                  tokens_used=tokens_used, output_dir=buffer_dir, input_id=input_id, exec_count=i,
-                                  cur_ms=cur_ms, dur=cur_ms-start)
+                metrics.saved_inputs += 1
+                with profiler.phase('save_input'):
+                    if corpus is not None:
+                        corpus.add(generated_input=final_input, hnb=bool(hnb), hnm=hnm, hnc=hnc, hs=hs, ac=ac,
+                                   tokens_used=tokens_used, input_id=input_id, exec_count=i, cur_ms=cur_ms,
+                                   dur=cur_ms-start)
+                    else:
+                        helper.save_input(generated_input=final_input, hnb=bool(hnb), hnm=hnm, hnc=hnc, hs=hs, ac=ac,
+                                          tokens_used=tokens_used, output_dir=buffer_dir, input_id=input_id,
+                                          exec_count=i, cur_ms=cur_ms, dur=cur_ms-start)
+
+            metrics.maybe_snapshot()
 
             # checking if we should break the loop based on duration base configuration
             if is_time_based:
@@ -464,10 +769,21 @@ class MonteCarloTreeSearch:
 
         # make sure we reset the root to the gram original root at the end of the search.
         self.current = self.root
+        profiler.stop(self.output_dir)
+        metrics.stop()
+        if trace is not None:
+            trace.close()
+        if corpus is not None:
+            corpus.close()
+        if pipeline is not None:
+            pipeline.stop()
+        for handler in extra_handlers:
+            handler.close_connection()
 
         end = time.time_ns() // 1_000_000  # get time in milliseconds from epoch.
         elapsed_time = end - start
         print(f"Elapsed time: {elapsed_time / 60_000} minutes")
+        self.exec_count, self.input_id, self.search_ms = i, input_id, elapsed_time
 
         # track reportable values before exiting
         self.report_dict['Period: duration(ms)'] = str(elapsed_time)
@@ -483,26 +799,72 @@ class MonteCarloTreeSearch:
         self.report_dict['Dynamics: final Cost Reward Scaling Value'] = str(self.cost_reward_scaling)
         self.save_tree_info_to_report(rollouts=rollouts, expansions=0, edges=0, num_hot_nodes=0,
                                       reset_counter=self.reset_counter, number_of_executions=self.exec_since_last_reset)
+        self.memory_tracer.stop()
 
         # save the bias table for reference (regardless if it is used or not)
         with open(f"{self.output_dir}bias.txt", "w") as bias_file:
             bias_file.write(self.root.bias.__str__())
+        self.save_bias(f"{self.output_dir}bias.json")
 
         # Write the last known tree to file
         if mg.extensive_data_tracking:
             self.write_tree_to_file_as_dot()
 
-        # if we collected the progress data, write it to file with full experiment information for reference.
-        if mg.extensive_data_tracking:
-            helper.write_dict_to_csv(progress_report, self.output_dir, f"progress-report-{self.expr_id}",
-                                     comments=f"grammar: {self.gram.gram_name}, budget: {self.allowed_budget}, "
-                                              f"total-iter: {num_iter}, c: {mg.C}, e: {mg.E}, "
-                                              f"duration(ms): {elapsed_time}, "
-                                              f"total rollouts: {int(self.report_dict['Stats: # total rollouts'])}, "
-                                              f"total expansions: "
-                                              f"{int(self.report_dict['Stats: # total expansions'])}, "
-                                              f"total edges: {int(self.report_dict['Stats: # total edges'])}, "
-                                              f"total anomalous runs: {self.count_of_anomalous_runs}")
+        # if we collected the progress data, close it with the end of the run information for reference.
+        if progress_report is not None:
+            progress_report.close(comments=f"duration(ms): {elapsed_time}, "
+                                           f"total rollouts: {int(self.report_dict['Stats: # total rollouts'])}, "
+                                           f"total expansions: {int(self.report_dict['Stats: # total expansions'])}, "
+                                           f"total edges: {int(self.report_dict['Stats: # total edges'])}, "
+                                           f"total anomalous runs: {self.count_of_anomalous_runs}")
+
+    def _open_progress_report(self, file_name: str, columns: List[str], num_iter: int) -> Optional[ProgressWriter]:
+        """
+        Open the streaming writer of the progress report in the output dir (if extensive data tracking is on).
+
+        :param file_name: The report file name (without the .csv extension).
+        :param columns: The columns of the report.
+        :param num_iter: The number of iterations allowed (for the report header).
+        :return: The writer, or None if we are not tracking the progress data.
+        """
+        if not mg.extensive_data_tracking:
+            return None
+        return ProgressWriter(f"{self.output_dir}{file_name}.csv", columns=columns, sampling=self.progress_sampling,
+                              every_n=self.progress_every_n, chunk_rows=self.progress_chunk_rows,
+                              comments=f"grammar: {self.gram.gram_name}, budget: {self.allowed_budget}, "
+                                       f"total-iter: {num_iter}, c: {self.context.c}, e: {self.context.e}, "
+                                       f"sampling: {self.progress_sampling}", append=self.is_resumed())
+
+    def _open_corpus(self) -> Optional[CorpusWriter]:
+        """
+        Open the writer of the packed corpus in the output dir (if the inputs are not saved as a file per input).
+
+        :return: The writer, or None if the inputs are saved as files in buffer/.
+        """
+        if self.corpus_format == 'packed':
+            return CorpusWriter(f"{self.output_dir}{CORPUS_DIR_NAME}/")
+        return None
+
+    def _open_exec_trace(self) -> Optional[ExecTraceWriter]:
+        """
+        Open the writer of the execution trace in the output dir (if the trace is enabled).
+
+        :return: The writer, or None if the trace is disabled.
+        """
+        if self.exec_trace == 'jsonl':
+            return ExecTraceWriter(f"{self.output_dir}exec-trace.jsonl", append=self.is_resumed())
+        return None
+
+    def _sequential_rollouts(self) -> Iterator[Tuple[bytes, int, int, bool, int, bool, int, int]]:
+        """
+        Rollout from the root one at a time.
+
+        :return: An iterator of run information (text, ac, hnb, hnm, hs, is_anomalous, tokens_used, run_ns), where
+            run_ns is the round-trip to the target as timed by the 'run' phase (zero if the profiler is disabled).
+        """
+        while True:
+            self.current = self.root
+            yield (*self.rollout(), self.profiler.last_ns('run'))
 
     def _reset(self):
         """
@@ -511,7 +873,7 @@ class MonteCarloTreeSearch:
         print(f"\nResetting the env (#{self.reset_counter}) ...")
         # ask how much memory used
         if mg.extensive_data_tracking:
-            self.log.warning(f"Resetting tree | memory used: {psutil.virtual_memory().percent}% ...")
+            self.log.warning(f"Resetting tree | process rss: {process_rss() / 1_048_576:.1f}MB ...")
 
         # LOG: export the tree we have to dot before dropping it.
         if mg.extensive_data_tracking:
@@ -523,17 +885,18 @@ class MonteCarloTreeSearch:
         # delete all traces of the tree
         del self.root
         del self.current
-        self.log.warning(f"Deleted all tree nodes | memory used: {psutil.virtual_memory().percent}% ...")
+        self.log.warning(f"Deleted all tree nodes | process rss: {process_rss() / 1_048_576:.1f}MB ...")
 
         # garbage collect as a safety check
         gc.collect()
-        self.log.warning(f"Did explicit gc | memory used: {psutil.virtual_memory().percent}% ...")
+        self.log.warning(f"Did explicit gc | process rss: {process_rss() / 1_048_576:.1f}MB ...")
 
         # finally re-populate the tree root given the grammar.
-        self.root = MCTSNode(budget=self.allowed_budget, text="", stack=[self.gram.start], tokens=0,
-                             use_locking=self.use_locking, bias=bias_temp)
+        self.root = MCTSNode(budget=self.allowed_budget, text=b"", stack=[self.gram.start], tokens=0,
+                             use_locking=self.use_locking, bias=bias_temp, context=self.context)
         self.original_root = self.root  # necessary for the root pruning only
         self.current = self.root
+        self.tree_stats = TreeStats(self.root)
         if mg.extensive_data_tracking:
             self.log.warning("Done resetting!")
 
@@ -564,7 +927,7 @@ class MonteCarloTreeSearch:
         the max/min is adjusted.
         """
         new_range = self.max_observed_cost - self.min_observed_cost
-        idx = np.digitize(new_range, bins=mg.buckets)
+        idx = bisect.bisect_right(mg.buckets, new_range)  # the bucket of the range (as numpy.digitize)
         self.tail_len = mg.tails[idx]
 
     def has_new_cost(self, cost: int) -> bool:
@@ -616,23 +979,57 @@ class MonteCarloTreeSearch:
 
         return max(self.current.get_children(), key=lambda node: node.get_ucb1())
 
-    def rollout(self, warmup=False) -> Tuple[str, int, int, bool, int, bool, int]:
+    def rollout(self, warmup=False) -> Tuple[bytes, int, int, bool, int, bool, int]:
         """
-        Expand the tree from the current node until you reach terminal node either randomly or using the bias.
+        Expand the tree from the current node until you reach terminal node either randomly or using the bias. If the
+        surrogate cost model is in use, several candidates are derived and only the most promising one is executed.
 
         :return: Run information of the generated input (text, ac, hnb, hnm, hs, is_anomalous, tokens_used).
         """
-        s_i = self.current
+        with self.profiler.phase('rollout'):
+            if self.surrogate is not None and not warmup:
+                candidates = [self._derive_terminal(self.current) for _ in range(self.surrogate_candidates)]
+                s_i = self.surrogate.pick(candidates)
+            else:
+                s_i = self._derive_terminal(self.current)
+
+        with self.profiler.phase('run'):
+            text, ac, hnb, hnm, hs, is_anomalous = s_i.run(warmup=warmup)
+
+        # update the bias if we are using it
+        if self.use_bias:
+            with self.profiler.phase('reward'):
+                if ac > self.max_observed_cost or hnb or hnm:
+                    s_i.bias.reward()
+                else:
+                    s_i.bias.penalize()
+
+        # train the surrogate on what we just observed
+        if self.surrogate is not None and not is_anomalous:
+            self.surrogate.observe(s_i, ac)
+
+        return text, ac, hnb, hnm, hs, is_anomalous, s_i.tokens_used
+
+    def _derive_terminal(self, node: MCTSNode) -> MCTSNode:
+        """
+        Derive from the given node until we reach a terminal node either randomly or using the bias. None of the
+        derived nodes are added to the tree.
+
+        :param node: The node to start the derivation from.
+        :return: The terminal node reached.
+        """
+        s_i = node
+        log_debug = mg.extensive_data_tracking and self.log.isEnabledFor(logging.DEBUG)
         while not s_i.is_terminal():
-            if mg.extensive_data_tracking:
-                self.log.debug(f"Node: {s_i}")
+            if log_debug:
+                self.log.debug("Node: %s", s_i)
             s_j = s_i.select_random_child(using_bias=self.use_bias)
             s_i = s_j
-            if mg.extensive_data_tracking:
-                self.log.debug(f"Token-Count: {s_i.tokens_used}")
+            if log_debug:
+                self.log.debug("Token-Count: %d", s_i.tokens_used)
                 self.log.debug("-----------------------------------------------------------")
-        if mg.extensive_data_tracking:
-            self.log.debug(f"Final (s_i): {s_i}")
+        if log_debug:
+            self.log.debug("Final (s_i): %s", s_i)
             self.log.debug("===========================================================")
 
         if (self.allowed_budget - s_i.tokens_used) != s_i.budget:
@@ -641,16 +1038,7 @@ class MonteCarloTreeSearch:
             raise RuntimeError(f"Wrong budget use! Allowed-Budget={self.allowed_budget}, Tokens-Used={s_i.tokens_used},"
                                f"Terminal-State-Remaining-Budget={s_i.budget}. Node: {s_i}")
 
-        text, ac, hnb, hnm, hs, is_anomalous = s_i.run(warmup=warmup)
-
-        # update the bias if we are using it
-        if self.use_bias:
-            if ac > self.max_observed_cost or hnb or hnm:
-                s_i.bias.reward()
-            else:
-                s_i.bias.penalize()
-
-        return text, ac, hnb, hnm, hs, is_anomalous, s_i.tokens_used
+        return s_i
 
     def expand(self) -> int:
         """
@@ -660,6 +1048,7 @@ class MonteCarloTreeSearch:
         """
         if not self.current.is_terminal():
             self.current.populate_children()
+            self.tree_stats.on_expand(self.current)
         else:
             raise RuntimeError(f"This is an un-expandable node {self.current}")
 
@@ -748,6 +1137,58 @@ class MonteCarloTreeSearch:
             self.root = cpickle.load(input_file)
         self.root = self.original_root
 
+    def is_resumed(self) -> bool:
+        """
+        :return: True if the search already ran (e.g., it was loaded from a checkpoint), thus a run continues it.
+        """
+        return self.exec_count > 0
+
+    def save_checkpoint(self, file_path: str):
+        """Save the state of the search (the tree, the bias, the reward and tail dynamics, the counters, and the
+        report), so that a later run can continue it after load_checkpoint(). The connection, the profiler, and the
+        metrics are not part of the state. The file is replaced atomically.
+
+        :param file_path: The checkpoint file.
+        """
+        state = {name: getattr(self, name) for name in _CHECKPOINT_STATE}
+        tmp_file = f"{file_path}.tmp"
+        with open(tmp_file, "wb") as checkpoint_file:
+            cpickle.dump(state, checkpoint_file, protocol=cpickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, file_path)
+
+    def load_checkpoint(self, file_path: str):
+        """Restore the state of a search saved by save_checkpoint(). The next run (treeline or random_search) continues
+        the search: its time cap or number of iterations counts the earlier runs too, the saved inputs continue their
+        ids and durations, and the progress report and execution trace are appended to.
+
+        :param file_path: The checkpoint file.
+        """
+        if not os.path.isfile(file_path):
+            raise RuntimeError(f"The string given {file_path} is not a file!")
+        with open(file_path, "rb") as checkpoint_file:
+            state = cpickle.load(checkpoint_file)
+        for name in _CHECKPOINT_STATE:
+            setattr(self, name, state[name])
+
+        # the nodes of the loaded tree share its own context, give it the connection (and parameters) of this search.
+        loaded_context = self.root.context
+        loaded_context.c, loaded_context.e = self.context.c, self.context.e
+        loaded_context.input_handler = self.context.input_handler
+        self.context = loaded_context
+        self.original_root = self.root
+        self.current = self.root
+        self.tree_stats = TreeStats.from_tree(self.root)
+
+    def save_bias(self, file_path: str, shared: bool = False, base: Optional[str] = None):
+        """
+        Save a machine-readable snapshot of the bias table that can be loaded by later runs on the same grammar.
+
+        :param file_path: Where to write the snapshot.
+        :param shared: Whether other runs may save the same snapshot (see bias_store.save_bias).
+        :param base: The creation stamp of the shared snapshot the bias started from (None if it started from scratch).
+        """
+        bias_store.save_bias(self.root.bias, self.gram, file_path, shared=shared, base=base)
+
     def write_tree_to_file_as_dot(self):
         """
         Write tree to file in dot language for post-search visualization.
@@ -756,20 +1197,27 @@ class MonteCarloTreeSearch:
         if not os.path.exists(tree_dir):
             os.makedirs(tree_dir)
         with open(f"{tree_dir}{self.reset_counter:02d}-TreeVis.dot", "w") as tree_file:
-            tree_file.write(helper.tree_to_dot(self.root))
+            write_dot(self.root, tree_file, self.tree_export_options)
+
+    def write_tree_as_text(self, stream: IO[str]):
+        """
+        From the root node, write the tree found thus far as text.
+        :param stream: A text stream (e.g., an open file).
+        """
+        write_text(self.root, stream, self.tree_export_options)
 
     def print_tree(self):
         """
         From the root node, print the tree found thus far.
         """
-        print(helper.tree_state(self.root))
+        print(helper.tree_state(self.root, self.tree_export_options))
 
     def get_tree(self) -> str:
         """
         From the root node, return the tree found thus far.
         :return: A tree as a string.
         """
-        return helper.tree_state(self.root)
+        return helper.tree_state(self.root, self.tree_export_options)
 
     def simulate(self):
         """
@@ -815,7 +1263,7 @@ class MonteCarloTreeSearch:
 
         print(f'maximum depth reached: {deepness}')
         print(f'reached terminal? {reached_terminal}')
-        print(f'the final input found: {final_input.encode()}')
+        print(f'the final input found: {final_input}')
         print(f'the input length: {len(final_input)}')
         print(f'input cost: {ac}')
         print(f'reward {self._get_reward(ac, tokens_used)}')
@@ -836,7 +1284,13 @@ class MonteCarloTreeSearch:
         self.report_dict['Stats: # total edges'] = str(int(self.report_dict['Stats: # total edges']) + edges)
         self.report_dict[f'Stats: Tree #{reset_counter}'] = f"rollouts={rollouts}, expansions={expansions}, " \
                                                             f"edges={edges}, hot_nodes_size={num_hot_nodes}, " \
-                                                            f"#-of-iter={number_of_executions}"
+                                                            f"#-of-iter={number_of_executions}, " \
+                                                            f"{self.tree_stats.summary()}, " \
+                                                            f"process_rss_mb={process_rss() / 1_048_576:.1f}"
+        if self.memory_tracer.enabled:
+            self.report_dict[f'Memory: Tree #{reset_counter}'] = self.memory_tracer.summary()
+        if self.profiler.enabled:
+            self.report_dict[f'Profile: Tree #{reset_counter}'] = self.profiler.tree_summary()
 
     def get_report(self) -> dict:
         """
@@ -846,6 +1300,12 @@ class MonteCarloTreeSearch:
         # make sure we get the latest info about anomalous runs before returning the report.
         self.report_dict['Stats: Anomalous - Observed Anomalous Value?'] = str(self.count_of_anomalous_runs > 0)
         self.report_dict['Stats: Anomalous - # of Anomalous Value'] = str(self.count_of_anomalous_runs)
+        if self.surrogate is not None:
+            self.report_dict['Stats: Surrogate - # of observations'] = str(self.surrogate.observations)
+            self.report_dict['Stats: Surrogate - # of candidates derived'] = str(self.surrogate.candidates_derived)
+            self.report_dict['Stats: Surrogate - # of screened picks'] = str(self.surrogate.screened_picks)
+            self.report_dict['Stats: Surrogate - # of random picks'] = str(self.surrogate.random_picks)
+        self.report_dict.update(self.profiler.summary())
 
         return self.report_dict
 
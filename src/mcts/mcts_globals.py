@@ -1,5 +1,7 @@
 
-"""Global variables for Treeline"""
+"""Global variables for Treeline. C, E, TARGET_APP_MIN_POSSIBLE_COST, and LITERAL_ENCODING are only the defaults of a
+search, each search keeps its own values in its context (see mcts.search_context).
+"""
 
 C = 2
 """The value of C within UCB formula that determines the exploration probability (higher C == more exploration).
@@ -17,6 +19,12 @@ never see anything valid below 50.
 """
 
 
+LITERAL_ENCODING = 'utf-8'
+"""The encoding used to turn the grammar literals into the bytes of the generated inputs. Use 'latin-1' for grammars of
+binary inputs, as it maps the escaped characters "\\x00" to "\\xff" one to one to bytes.
+"""
+
+
 extensive_data_tracking = True
 """A global variable to turn on/off the data tracking for the non-essential pieces of progress monitoring. For
 reportable runs we want to track minimal data.
@@ -4,17 +4,23 @@ __status__ = "Testing"
 
 import math
 import random
-from typing import Tuple
+from typing import Dict, List, Tuple, Optional
 
 import mcts.mcts_globals as mg  # MCTS globals
 from pygramm.llparse import *
 from pygramm.grammar import _Symbol, _Choice, _Seq, _Literal
 from pygramm.biased_choice import Bias
-from targetAppConnect import InputHandler
+from mcts.search_context import SearchContext
 
-input_handler = InputHandler()
-if not input_handler.is_connected():
-    logging.warning(f"No connection to input handler")
+
+def printable(text: bytes, encoding: Optional[str] = None) -> str:
+    """A printable form of the generated bytes, for logs and tree dumps.
+
+    :param text: The generated bytes.
+    :param encoding: The literal encoding of the search (None takes mg.LITERAL_ENCODING).
+    :return: The text decoded with the literal encoding where any undecodable byte is escaped.
+    """
+    return text.decode(mg.LITERAL_ENCODING if encoding is None else encoding, errors='backslashreplace')
 
 
 class MCTSNode:
@@ -34,20 +40,28 @@ class MCTSNode:
             to create MCTSNode for them as it is a waste of resources (both in terms of space and time).
 
     :param budget: The budget allowed based on the defined input length (e.g., num of char, tokens or bytes).
-    :param text: The literals generated to the so far (i.e., to the left of the current “cursor”).
+    :param text: The bytes of the literals generated so far (i.e., to the left of the current “cursor”).
     :param stack: Tokens need to be resolved as given by the choice from the parent node.
     :param tokens: The number of tokens used as of parent node.
     :param parent: This node's parent.
     :param use_locking: If True: any node that is exhausted will be locked from future visits
         (i.e., as if it doesn't exist anymore).
     :param bias: A reference to the bias object regardless if we use bias or not.
+    :param context: The state of the search this tree belongs to (only given to the root, the other nodes share the
+        context of their parent). None uses the default globals, and connects on start_connection.
     """
 
-    def __init__(self, budget, text: str, stack: List[RHSItem], tokens, parent: "MCTSNode" = None,
-                 use_locking: bool = False, bias: Bias = None):
+    def __init__(self, budget, text: bytes, stack: List[RHSItem], tokens, parent: "MCTSNode" = None,
+                 use_locking: bool = False, bias: Bias = None, context: SearchContext = None):
         """Constructor method
         """
         self.log = logging.getLogger(self.__class__.__name__)
+        if parent is not None:
+            self.context = parent.context
+        elif context is not None:
+            self.context = context
+        else:
+            self.context = SearchContext()
 
         self._v = 0.0  # total costs
         self._n = 0  # num of visits
@@ -58,6 +72,7 @@ class MCTSNode:
         self._hs = 0  # what was the max known hit to some edge from this node?
 
         self._children: List[MCTSNode] = []
+        self._seeded_children: Optional[Dict[int, MCTSNode]] = None  # derived by seeding, adopted when expanded
 
         self.budget = budget  # the allowed budget from this given node
         self.tokens_used = tokens  # track used tokens to validate budget use per node (token is not # of chars)
@@ -69,7 +84,7 @@ class MCTSNode:
             while isinstance(symbol, _Literal) or isinstance(symbol, _Seq):
                 if isinstance(symbol, _Literal):
                     self.tokens_used += symbol.min_tokens()
-                    text += symbol.text
+                    text += self.context.encode_literal(symbol)
                     if stack:
                         symbol = stack.pop()
                     else:
@@ -87,7 +102,7 @@ class MCTSNode:
         if parent is None:  # special case of root node
             self.parent = None
             self.level = 0
-            self.text = ""
+            self.text = b""
             self.budget = self.budget - self.symbol.min_tokens()
             if bias is None:
                 self.bias = Bias()
@@ -128,8 +143,31 @@ class MCTSNode:
         assert not self.is_terminal()
         gram_children = self._get_gram_valid_children()  # get all options (empty=None, otherwise list of choices)
 
-        for child in gram_children:
-            self._children.append(self._populate_child_node(child))
+        seeded = self._seeded_children
+        if seeded is None:
+            for child in gram_children:
+                self._children.append(self._populate_child_node(child))
+        else:  # keep the children seeding derived (and their statistics)
+            for idx, child in enumerate(gram_children):
+                self._children.append(seeded[idx] if idx in seeded else self._populate_child_node(child))
+            self._seeded_children = None
+
+    def seed_child(self, idx: int) -> Tuple["MCTSNode", bool]:
+        """The child of the given valid choice without expanding this node (e.g., the derivation of a seed input). The
+        child is kept aside and becomes one of the children of this node once it is expanded (see populate_children).
+
+        :param idx: The index of the choice in the valid choices of this node.
+        :return: A tuple of the child and whether it was created by this call.
+        """
+        if self._children:
+            return self._children[idx], False
+        if self._seeded_children is None:
+            self._seeded_children = {}
+        child = self._seeded_children.get(idx)
+        if child is not None:
+            return child, False
+        child = self._seeded_children[idx] = self._populate_child_node(self._get_gram_valid_children()[idx])
+        return child, True
 
     def _get_gram_valid_children(self) -> List[RHSItem]:
         """Provides a list of Valid choices from this node given the allows budget.
@@ -167,7 +205,7 @@ class MCTSNode:
             spent = child.min_tokens() - self.symbol.min_tokens()
             new_budget = self.budget - spent
             # new_budget = self.budget  # no change on budget
-            new_text = self.text + child.text  # update the text
+            new_text = self.text + self.context.encode_literal(child)  # update the text
             new_tokens_used = self.tokens_used + child.min_tokens()  # update used tokens
         elif isinstance(child, _Symbol) and child.name == "EMPTY":
             new_stack = self.stack.copy()  # no change on stack
@@ -195,6 +233,23 @@ class MCTSNode:
         return MCTSNode(budget=new_budget, text=new_text, stack=new_stack, tokens=new_tokens_used, parent=self,
                         use_locking=self.use_locking)
 
+    def get_valid_choices(self) -> List[RHSItem]:
+        """The valid grammar choices from this node given the allowed budget. The order of the choices is the same
+        order in which the children are populated.
+
+        :return: List[RHSItem] of valid choices.
+        """
+        return self._get_gram_valid_children()
+
+    def derive(self, choice: RHSItem) -> "MCTSNode":
+        """Create the MCTSNode that results from taking the given choice from this node without adding it to the
+        children of this node.
+
+        :param choice: One of the valid choices of this node.
+        :return: A new MCTSNode.
+        """
+        return self._populate_child_node(choice)
+
     def select_random_child(self, using_bias=False) -> "MCTSNode":
         """From the valid children of this node, select one randomly and return it as an MCTSNode.
 
@@ -232,9 +287,9 @@ class MCTSNode:
             """
 
             # as found in https://en.wikipedia.org/wiki/Monte_Carlo_tree_search
-            return self._v / self._n + mg.C * math.sqrt(math.log(self.parent._n) / self._n)
+            return self._v / self._n + self.context.c * math.sqrt(math.log(self.parent._n) / self._n)
 
-    def run(self, warmup: bool = False) -> Tuple[str, int, int, bool, int, bool]:
+    def run(self, warmup: bool = False) -> Tuple[bytes, int, int, bool, int, bool]:
         """A method to run the app given the input from this node. This must only be called on terminal nodes. It
         returns all the possible information it can collect from a run. It is up to the method that call this one to
         decide on what information to pass to the requester of a run.
@@ -242,7 +297,7 @@ class MCTSNode:
         :param warmup: what should be the run type. A warmup run, which is the less often one should always send the
             signal 'wup' to avoid missing the max_count on AFL side. Any three characters '***' would lead to a run that
             update max_count (if there was one) on AFL side.
-        :return: A tuple of (input:str, total-execution-cost:int, hnb:int, hnm:bool, hs:int, anomalous_run:bool).
+        :return: A tuple of (input:bytes, total-execution-cost:int, hnb:int, hnm:bool, hs:int, anomalous_run:bool).
             hnb (coverage) is either 0 (no change), 1 (an edge has new change in hit count), or 2 (an edge got hit for
             the first time). hnm is True iff there was an increase on the hit for some edge given the past observations.
             And hs is the number of edge hit for the edge that got hit the most.
@@ -251,17 +306,17 @@ class MCTSNode:
         if warmup:
             run_type = 'wup'
         if self.is_terminal():
-            if input_handler.is_connected():
+            if self.context.input_handler is not None and self.context.input_handler.is_connected():
                 """
                 Based on our experience, AFL could sometimes return a zero cost run. Such run is considered a glitch
                 for us. Therefore, as long as the cost is abnormal, we will keep running the app given the input here.  
                 """
                 anomalous_run = False
-                actual_cost, hnb, hnm, hs = input_handler.run_input(self.text, run_type=run_type)
+                actual_cost, hnb, hnm, hs = self.context.input_handler.run_input(self.text, run_type=run_type)
 
-                if actual_cost < mg.TARGET_APP_MIN_POSSIBLE_COST:
+                if actual_cost < self.context.min_possible_cost:
                     anomalous_run = True
-                    self.log.warning(f"Run with warmup={warmup}, execution-cost={actual_cost}, input={self.text} "
+                    self.log.warning(f"Run with warmup={warmup}, execution-cost={actual_cost}, input={self.text!r} "
                                      f"is abnormal!")
 
                 return self.text, actual_cost, hnb, hnm, hs, anomalous_run
@@ -270,7 +325,7 @@ class MCTSNode:
         else:
             raise RuntimeError(f"Called on a non-terminal node {self}!")
 
-    def dummy_run(self) -> Tuple[str, int, int, bool, int, bool]:
+    def dummy_run(self) -> Tuple[bytes, int, int, bool, int, bool]:
         """
         A none official app runner that can only be used on the root node. This dummy runner is only useful in
         establishing some basics about the application possible call graph cost.
@@ -282,11 +337,11 @@ class MCTSNode:
             raise RuntimeError("This is only accessible from the root node")
         else:
             anomalous_run = False
-            actual_cost, hnb, hnm, hs = input_handler.run_input(self.text, run_type=run_type)
+            actual_cost, hnb, hnm, hs = self.context.input_handler.run_input(self.text, run_type=run_type)
 
-            if actual_cost < mg.TARGET_APP_MIN_POSSIBLE_COST:
+            if actual_cost < self.context.min_possible_cost:
                 anomalous_run = True
-                self.log.warning(f"Run with warmup={run_type}, execution-cost={actual_cost}, input={self.text} "
+                self.log.warning(f"Run with warmup={run_type}, execution-cost={actual_cost}, input={self.text!r} "
                                  f"is abnormal!")
 
             return self.text, actual_cost, hnb, hnm, hs, anomalous_run
@@ -331,7 +386,7 @@ class MCTSNode:
         # left most element is the one to be evaluated next (preserve consistency with derivations intuition)
         reversed_stack = self.stack[::-1]
 
-        return f"'{self.text.encode('utf-8')}'-({self.symbol} | {self.allowed_budget}/" \
+        return f"'{self.text}'-({self.symbol} | {self.allowed_budget}/" \
                f"{self.budget})-{reversed_stack} [V: {self._v}, N: {self._n}, UCB1: {self.get_ucb1()}]"
 
     def get_signature(self) -> str:
@@ -344,7 +399,7 @@ class MCTSNode:
         simplified_stack = ""
         for node in reversed_stack:
             simplified_stack += str(node)
-        return f"{self.text.encode('utf_8')}-{self.symbol}-[{simplified_stack}]"
+        return f"{self.text}-{self.symbol}-[{simplified_stack}]"
 
     def get_children(self) -> List["MCTSNode"]:
         """
@@ -366,7 +421,7 @@ class MCTSNode:
         A node is new if it was visited less than then the expansion threshold (E).
         :return: bool of whether it is new or not.
         """
-        return self._n < mg.E
+        return self._n < self.context.e
 
     def is_terminal(self) -> bool:
         """
@@ -450,7 +505,7 @@ class MCTSNode:
         return self.parent is not None
 
     def start_connection(self):
-        input_handler.open_connection()
+        self.context.connect()
 
     def close_connection(self):
-        input_handler.close_connection()
+        self.context.close()
@@ -0,0 +1,249 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+Live metrics of a running search. The search loop updates the metrics in place, and they can be watched while the search
+is running in two ways (either or both):
+    - A local HTTP endpoint serving the Prometheus text format (http://localhost:<port>/metrics).
+    - A snapshot file (JSON) in the output dir that is atomically replaced every few seconds.
+
+Each metric is labeled with the search (experiment) identifier, so many searches can be scraped into the same dashboard.
+"""
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from typing import Optional, List, Tuple
+
+ROUND_TRIP_BUCKETS_S = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+"""The upper bounds (in seconds) of the executor round-trip histogram buckets."""
+
+
+class Throttle:
+    """A rate limiter for the periodic work of the search loop (e.g., redrawing the progress bar).
+
+    :param per_second: How many times per second the work is allowed. Zero (or less) never allows it.
+    """
+
+    __slots__ = ('_interval_ns', '_next_ns')
+
+    def __init__(self, per_second: float):
+        self._interval_ns = int(1_000_000_000 / per_second) if per_second > 0 else -1
+        self._next_ns = 0
+
+    def ready(self) -> bool:
+        """
+        :return: True if enough time passed since the last time it was ready.
+        """
+        if self._interval_ns < 0:
+            return False
+        now = time.monotonic_ns()
+        if now < self._next_ns:
+            return False
+        self._next_ns = now + self._interval_ns
+        return True
+
+
+class SearchMetrics:
+    """The live metrics of a single search.
+
+    :param search_id: The search (experiment) identifier used as the metrics label.
+    :param port: The port of the Prometheus endpoint. Zero disables the endpoint.
+    :param snapshot_file: The file the snapshots are written to. None disables the snapshots.
+    :param snapshot_interval_s: The minimum time between two snapshots.
+    """
+
+    def __init__(self, search_id: str, port: int = 0, snapshot_file: Optional[str] = None,
+                 snapshot_interval_s: float = 10.0):
+        """Constructor method
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        self.search_id = search_id
+        self.algorithm = ""
+        self.port = port
+        self.snapshot_file = snapshot_file
+        self._snapshot_throttle = Throttle(1 / snapshot_interval_s if snapshot_interval_s > 0 else 0)
+
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+
+        # counters
+        self.executions = 0
+        self.anomalous_executions = 0
+        self.resets = 0
+        self.saved_inputs = 0
+        self._round_trip_counts = [0] * (len(ROUND_TRIP_BUCKETS_S) + 1)  # last one is +Inf
+        self._round_trip_sum_s = 0.0
+
+        # gauges
+        self.tree_nodes = 0
+        self.hot_nodes = 0
+        self.max_cost = 0
+        self.max_hotspot = 0
+        self.max_cost_history: List[Tuple[float, int]] = []  # (seconds since start, new max cost)
+
+        self._server = None  # the ThreadingHTTPServer of the endpoint (if served)
+        self._server_thread: Optional[threading.Thread] = None
+
+    def start(self, algorithm: str):
+        """Start serving the Prometheus endpoint (if a port is given).
+
+        :param algorithm: The search algorithm (e.g., treeline or random) used as a metrics label.
+        """
+        self.algorithm = algorithm
+        self._start = time.monotonic()
+        if self.port <= 0:
+            return
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # only the served searches need it
+        metrics = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # keep the scrapes out of the console
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(('localhost', self.port), _Handler)
+        except OSError as e:
+            self.log.warning(f"Could not serve the metrics on port {self.port}: {e}")
+            return
+        self._server.daemon_threads = True
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True)
+        self._server_thread.start()
+        print(f"Serving live metrics at http://localhost:{self.port}/metrics")
+
+    def stop(self):
+        """Write the final snapshot (if enabled) and stop the endpoint.
+        """
+        if self.snapshot_file is not None:
+            self.write_snapshot()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def record_execution(self, round_trip_ns: int, is_anomalous: bool, max_cost: int, max_hotspot: int):
+        """Record a target app execution.
+
+        :param round_trip_ns: The time of the round-trip to the target app. Zero if it was not measured.
+        :param is_anomalous: Whether the run was anomalous.
+        :param max_cost: The max cost known after this execution.
+        :param max_hotspot: The max hotspot known after this execution.
+        """
+        with self._lock:
+            self.executions += 1
+            if is_anomalous:
+                self.anomalous_executions += 1
+            if round_trip_ns > 0:
+                round_trip_s = round_trip_ns / 1_000_000_000
+                self._round_trip_counts[bisect.bisect_left(ROUND_TRIP_BUCKETS_S, round_trip_s)] += 1
+                self._round_trip_sum_s += round_trip_s
+            if max_cost > self.max_cost:
+                self.max_cost_history.append((round(time.monotonic() - self._start, 3), max_cost))
+                self.max_cost = max_cost
+            self.max_hotspot = max_hotspot
+
+    def update_tree(self, tree_nodes: int, hot_nodes: int, resets: int):
+        """Update the gauges of the current tree.
+
+        :param tree_nodes: The number of nodes in the current tree.
+        :param hot_nodes: The number of hot-nodes of the current tree.
+        :param resets: How many times the tree was dropped so far.
+        """
+        self.tree_nodes = tree_nodes
+        self.hot_nodes = hot_nodes
+        self.resets = resets
+
+    def maybe_snapshot(self):
+        """Write a snapshot if snapshots are enabled and the snapshot interval passed since the last one.
+        """
+        if self.snapshot_file is not None and self._snapshot_throttle.ready():
+            self.write_snapshot()
+
+    def snapshot(self) -> dict:
+        """
+        :return: The current metrics as a dictionary.
+        """
+        with self._lock:
+            elapsed = max(time.monotonic() - self._start, 1e-9)
+            return {'search': self.search_id,
+                    'algorithm': self.algorithm,
+                    'time': time.time(),
+                    'elapsed_s': round(elapsed, 3),
+                    'executions': self.executions,
+                    'execs_per_second': round(self.executions / elapsed, 3),
+                    'anomalous_executions': self.anomalous_executions,
+                    'saved_inputs': self.saved_inputs,
+                    'tree_nodes': self.tree_nodes,
+                    'hot_nodes': self.hot_nodes,
+                    'resets': self.resets,
+                    'max_cost': self.max_cost,
+                    'max_hotspot': self.max_hotspot,
+                    'round_trip_buckets_s': ROUND_TRIP_BUCKETS_S + ['+Inf'],
+                    'round_trip_counts': list(self._round_trip_counts),
+                    'round_trip_sum_s': self._round_trip_sum_s,
+                    'max_cost_history': list(self.max_cost_history)}
+
+    def write_snapshot(self):
+        """Atomically replace the snapshot file with the current metrics.
+        """
+        tmp_file = f"{self.snapshot_file}.tmp"
+        with open(tmp_file, 'w') as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(tmp_file, self.snapshot_file)
+
+    def render(self) -> str:
+        """
+        :return: The current metrics in the Prometheus text exposition format.
+        """
+        s = self.snapshot()
+        label = f'search="{_escape(self.search_id)}",algorithm="{_escape(self.algorithm)}"'
+        lines = []
+
+        def metric(name: str, kind: str, doc: str, value):
+            lines.append(f"# HELP treeline_{name} {doc}")
+            lines.append(f"# TYPE treeline_{name} {kind}")
+            lines.append(f"treeline_{name}{{{label}}} {value}")
+
+        metric('executions_total', 'counter', 'Target app executions.', s['executions'])
+        metric('anomalous_executions_total', 'counter', 'Anomalous target app executions.', s['anomalous_executions'])
+        metric('saved_inputs_total', 'counter', 'Inputs saved for increasing coverage, max, or cost.',
+               s['saved_inputs'])
+        metric('tree_resets_total', 'counter', 'Times the tree was dropped.', s['resets'])
+        metric('execs_per_second', 'gauge', 'Average executions per second since the search started.',
+               s['execs_per_second'])
+        metric('tree_nodes', 'gauge', 'Nodes in the current tree.', s['tree_nodes'])
+        metric('hot_nodes', 'gauge', 'Hot-nodes of the current tree.', s['hot_nodes'])
+        metric('max_cost', 'gauge', 'Max execution cost observed.', s['max_cost'])
+        metric('max_hotspot', 'gauge', 'Max hotspot observed.', s['max_hotspot'])
+        metric('elapsed_seconds', 'gauge', 'Seconds since the search started.', s['elapsed_s'])
+
+        lines.append("# HELP treeline_round_trip_seconds The round-trip of an execution on the target app.")
+        lines.append("# TYPE treeline_round_trip_seconds histogram")
+        cumulative = 0
+        for bound, count in zip(s['round_trip_buckets_s'], s['round_trip_counts']):
+            cumulative += count
+            lines.append(f'treeline_round_trip_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f"treeline_round_trip_seconds_sum{{{label}}} {s['round_trip_sum_s']}")
+        lines.append(f"treeline_round_trip_seconds_count{{{label}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,188 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+A streaming generate/execute pipeline for random search. Random search has no tree state to share between
+iterations, thus deriving the inputs can be spread over worker processes while the executions are spread over the
+connected target servers:
+
+    generator processes --(bounded queue of derivations)--> executor threads --(results queue)--> recorder
+
+The recorder is the caller of DerivationPipeline.results() (i.e., the search loop), so the bookkeeping of new costs,
+hotspots and saved inputs stays single threaded.
+"""
+
+import time
+import queue
+import random
+import logging
+import threading
+import multiprocessing
+from typing import List, Iterator, Tuple
+
+from pygramm.grammar import Grammar
+from mcts.mctsnode import MCTSNode
+from mcts.search_context import SearchContext
+from executors import Executor
+
+
+def _generate_derivations(gram: Grammar, budget: int, out_queue: multiprocessing.Queue,
+                          stop_event: multiprocessing.Event, chunk_size: int, seed: int, literal_encoding: str):
+    """The body of a generator process. Derive random inputs from the grammar root and put them in the queue in
+    chunks until we are asked to stop.
+
+    :param gram: The grammar to derive from.
+    :param budget: The allowed budget of an input.
+    :param out_queue: The bounded queue of derivations shared with the executors.
+    :param stop_event: Set by the pipeline when the search is done.
+    :param chunk_size: The number of derivations put in the queue at once.
+    :param seed: The seed of this process random generator (so workers do not derive the same inputs).
+    :param literal_encoding: The encoding of the grammar literals (the context is not shared with spawned processes).
+    """
+    random.seed(seed)
+    out_queue.cancel_join_thread()  # do not hang on exit flushing derivations nobody will execute
+    root = MCTSNode(budget=budget, text=b"", stack=[gram.start], tokens=0,
+                    context=SearchContext(literal_encoding=literal_encoding))
+    chunk = []
+    while not stop_event.is_set():
+        s_i = root
+        while not s_i.is_terminal():
+            s_i = s_i.select_random_child()
+        if (budget - s_i.tokens_used) != s_i.budget:
+            raise RuntimeError(f"Wrong budget use! Allowed-Budget={budget}, Tokens-Used={s_i.tokens_used},"
+                               f"Terminal-State-Remaining-Budget={s_i.budget}. Node: {s_i}")
+        chunk.append((s_i.text, s_i.tokens_used))
+        if len(chunk) >= chunk_size:
+            while not stop_event.is_set():
+                try:
+                    out_queue.put(chunk, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            chunk = []
+
+
+class DerivationPipeline:
+    """Derive inputs in worker processes and execute them over one or more target servers.
+
+    :Note: Each target server keeps its own coverage (virgin bits) and max counts. Thus, when using more than one
+        server, hnb and hnm are relative to the server that ran the input. A handler given more than once (e.g., an
+        executor with a concurrency above one, see executors) is shared by that many threads.
+
+    :param gram: The grammar to derive from.
+    :param budget: The allowed budget of an input.
+    :param handlers: The connected input handlers (one executor thread per handler).
+    :param num_generators: The number of generator processes.
+    :param queue_size: The maximum number of derivation chunks waiting to be executed.
+    :param chunk_size: The number of derivations passed between the stages at once.
+    :param context: The state of the search the pipeline runs for (its literal encoding and min possible cost). None
+        uses the global defaults.
+    """
+
+    _DONE = object()  # marks a failed executor in the results queue
+
+    def __init__(self, gram: Grammar, budget: int, handlers: List[Executor], num_generators: int = 1,
+                 queue_size: int = 64, chunk_size: int = 16, context: SearchContext = None):
+        """Constructor method
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        if not handlers:
+            raise ValueError("The pipeline needs at least one connected input handler")
+
+        self.gram = gram
+        self.budget = budget
+        self.handlers = handlers
+        self.num_generators = max(num_generators, 1)
+        self.chunk_size = chunk_size
+        self.context = SearchContext() if context is None else context
+
+        self._derivations = multiprocessing.Queue(maxsize=queue_size)
+        self._results = queue.Queue(maxsize=queue_size * chunk_size)
+        self._stop_generators = multiprocessing.Event()
+        self._stop_executors = threading.Event()
+        self._generators: List[multiprocessing.Process] = []
+        self._executors: List[threading.Thread] = []
+        self._errors = []
+
+    def start(self):
+        """Start the generator processes and the executor threads.
+        """
+        for worker_id in range(self.num_generators):
+            p = multiprocessing.Process(target=_generate_derivations, name=f"generator-{worker_id}", daemon=True,
+                                        args=(self.gram, self.budget, self._derivations, self._stop_generators,
+                                              self.chunk_size, random.randrange(2 ** 32),
+                                              self.context.literal_encoding))
+            p.start()
+            self._generators.append(p)
+        for handler in self.handlers:
+            t = threading.Thread(target=self._execute, args=(handler,), daemon=True)
+            t.start()
+            self._executors.append(t)
+
+    def _execute(self, handler: Executor):
+        """The body of an executor thread. Drain the derivations queue and run each input on the target server of the
+        given handler.
+
+        :param handler: The handler this thread owns.
+        """
+        try:
+            while not self._stop_executors.is_set():
+                try:
+                    chunk = self._derivations.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                for text, tokens_used in chunk:
+                    run_start = time.perf_counter_ns()
+                    ac, hnb, hnm, hs = handler.run_input(text, run_type='nml')
+                    run_ns = time.perf_counter_ns() - run_start
+                    is_anomalous = ac < self.context.min_possible_cost
+                    if is_anomalous:
+                        self.log.warning(f"Run with execution-cost={ac}, input={text!r} is abnormal!")
+                    self._put_result((text, ac, hnb, hnm, hs, is_anomalous, tokens_used, run_ns))
+        except Exception as e:  # let the recorder know, otherwise it would wait forever
+            self._errors.append(e)
+            self._put_result(DerivationPipeline._DONE)
+
+    def _put_result(self, result):
+        while not self._stop_executors.is_set():
+            try:
+                self._results.put(result, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def results(self) -> Iterator[Tuple[bytes, int, int, bool, int, bool, int, int]]:
+        """Stream the run results as they finish. This is meant to be consumed by a single recorder.
+
+        :return: An iterator of run information (text, ac, hnb, hnm, hs, is_anomalous, tokens_used, run_ns), where
+            run_ns is the round-trip to the target as timed by the executor thread.
+        :Note: The generators only exit when the pipeline is stopped, thus once all of them are dead (e.g., on a wrong
+            budget use) no result is coming, and this raises instead of waiting forever.
+        """
+        while True:
+            try:
+                result = self._results.get(timeout=0.5)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self._generators):
+                    exit_codes = [p.exitcode for p in self._generators]
+                    raise RuntimeError(f"All the generators of the pipeline died (exit codes {exit_codes}), see their "
+                                       f"traceback above")
+                continue
+            if result is DerivationPipeline._DONE:
+                raise RuntimeError(f"An executor of the pipeline failed: {self._errors[0]!r}") from self._errors[0]
+            yield result
+
+    def stop(self):
+        """Stop all the stages. Any derivations or results still in flight are dropped.
+        """
+        self._stop_generators.set()
+        self._stop_executors.set()
+        for t in self._executors:
+            t.join()
+        for p in self._generators:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+        self._derivations.cancel_join_thread()
+        self._derivations.close()
@@ -0,0 +1,257 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+A low-overhead, per-phase profiler for the search loop. Each phase of an iteration (select, expand, rollout, the target
+round-trip, etc.) is timed with a monotonic nanoseconds counter, and a fixed size reservoir of samples is kept per phase
+for the percentiles. The time of the 'run' phase is the round-trip to the target app, everything else is our (Python)
+overhead.
+
+On top of the phase timers, a heavier profiler can be attached to the whole search:
+    - 'cprofile': deterministic profiling with cProfile, dumped as a .pstats file.
+    - 'sampling': a statistical stack sampler driven by a profiling timer signal, dumped as folded stacks (the input
+      format of flamegraph.pl and speedscope).
+"""
+
+import os
+import time
+import random
+import signal
+import logging
+import cProfile
+import collections
+from typing import Dict, List, Optional
+
+PHASES = ['select', 'expand', 'rollout', 'run', 'backprop', 'reward', 'logging', 'progress_bar', 'save_input']
+"""The phases of an iteration in the order they are reported."""
+
+SAMPLERS = ['none', 'cprofile', 'sampling']
+"""The heavier profilers that can be attached to the search."""
+
+
+class _PhaseTimer:
+    """The timing context of a single phase. Instances are reused across iterations to avoid allocating per call.
+
+    :param stats: The stats of the phase to add the measured time to.
+    """
+
+    __slots__ = ('_stats', '_start')
+
+    def __init__(self, stats: "_PhaseStats"):
+        self._stats = stats
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stats.add(time.perf_counter_ns() - self._start)
+        return False
+
+
+class _NullTimer:
+    """The timing context used when the profiler is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _PhaseStats:
+    """The accumulated time of a phase with a reservoir of samples (Algorithm R) for the percentiles.
+
+    :param reservoir_size: The maximum number of samples kept.
+    :param rng: The random generator of the reservoir (not the module one the search draws from, thus profiling does
+        not change the search).
+    """
+
+    __slots__ = ('count', 'total_ns', 'max_ns', 'last_ns', 'reservoir', '_reservoir_size', '_rng')
+
+    def __init__(self, reservoir_size: int, rng: random.Random):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.last_ns = 0
+        self.reservoir: List[int] = []
+        self._reservoir_size = reservoir_size
+        self._rng = rng
+
+    def add(self, elapsed_ns: int):
+        self.count += 1
+        self.last_ns = elapsed_ns
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        if len(self.reservoir) < self._reservoir_size:
+            self.reservoir.append(elapsed_ns)
+        else:
+            idx = self._rng.randrange(self.count)
+            if idx < self._reservoir_size:
+                self.reservoir[idx] = elapsed_ns
+
+    def percentiles_us(self, qs=(50, 95, 99)) -> List[float]:
+        if not self.reservoir:
+            return [0.0 for _ in qs]
+        import numpy as np
+        return [float(p) / 1_000 for p in np.percentile(self.reservoir, qs)]
+
+
+class PhaseProfiler:
+    """Time the phases of the search loop and (optionally) run a heavier profiler over the whole search.
+
+    :Usage example:
+    .. code-block:: python
+
+        profiler = PhaseProfiler()
+        with profiler.phase('select'):
+            ...
+        profiler.tree_summary()  # per-tree deltas, e.g., before dropping a tree
+        profiler.summary()  # totals of the whole search
+
+    :param enabled: If False, phase() is a no-op and nothing is collected.
+    :param sampler: One of SAMPLERS.
+    :param sample_interval_ms: The interval between stack samples of the 'sampling' profiler.
+    :param reservoir_size: The number of samples kept per phase for the percentiles.
+    """
+
+    def __init__(self, enabled: bool = True, sampler: str = 'none', sample_interval_ms: float = 5.0,
+                 reservoir_size: int = 2048):
+        """Constructor method
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        if sampler not in SAMPLERS:
+            raise ValueError(f"Unknown profiler sampler '{sampler}', it must be one of {SAMPLERS}")
+
+        self.enabled = enabled
+        self.sampler = sampler
+        self.sample_interval_ms = sample_interval_ms
+
+        rng = random.Random()  # its own, the search draws from the module one
+        self._stats: Dict[str, _PhaseStats] = {name: _PhaseStats(reservoir_size, rng) for name in PHASES}
+        self._timers: Dict[str, _PhaseTimer] = {name: _PhaseTimer(stats) for name, stats in self._stats.items()}
+        self._tree_marks: Dict[str, int] = {name: 0 for name in PHASES}  # phases totals at the start of the tree
+
+        self._search_start_ns = 0
+        self._search_ns = 0
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._stack_samples: Optional[collections.Counter] = None
+        self._previous_handler = None
+
+    def phase(self, name: str):
+        """The timing context of the given phase.
+
+        :param name: One of PHASES.
+        :return: A context manager that adds its elapsed time to the phase.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timers[name]
+
+    def add(self, name: str, elapsed_ns: int):
+        """Add a time measured elsewhere to a phase (e.g., the runs of the executor threads of a pipeline).
+
+        :param name: One of PHASES.
+        :param elapsed_ns: The measured time.
+        """
+        if self.enabled:
+            self._stats[name].add(elapsed_ns)
+
+    def last_ns(self, name: str) -> int:
+        """
+        :param name: One of PHASES.
+        :return: The time of the last measurement of the given phase (zero if it was never measured).
+        """
+        return self._stats[name].last_ns
+
+    def start(self):
+        """Mark the start of the search and attach the sampler (if any).
+        """
+        self._search_start_ns = time.perf_counter_ns()
+        if self.sampler == 'cprofile':
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif self.sampler == 'sampling':
+            if not hasattr(signal, 'setitimer'):
+                self.log.warning("The sampling profiler needs signal.setitimer, which this platform lacks.")
+                return
+            self._stack_samples = collections.Counter()
+            self._previous_handler = signal.signal(signal.SIGPROF, self._sample_stack)
+            interval = self.sample_interval_ms / 1_000
+            signal.setitimer(signal.ITIMER_PROF, interval, interval)
+
+    def stop(self, output_dir: str = None):
+        """Mark the end of the search, detach the sampler, and dump its output (if any) to the given directory.
+
+        :param output_dir: Where to write profile.pstats (cprofile) or profile.folded (sampling).
+        """
+        self._search_ns += time.perf_counter_ns() - self._search_start_ns
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            if output_dir is not None:
+                self._cprofile.dump_stats(os.path.join(output_dir, "profile.pstats"))
+            self._cprofile = None
+        if self._stack_samples is not None:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+            if output_dir is not None:
+                with open(os.path.join(output_dir, "profile.folded"), "w") as folded_file:
+                    for stack, samples in self._stack_samples.most_common():
+                        folded_file.write(f"{stack} {samples}\n")
+            self._stack_samples = None
+
+    def _sample_stack(self, signum, frame):
+        """The SIGPROF handler. Record the interrupted stack (root first) as a folded stack.
+        """
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        self._stack_samples[";".join(reversed(stack))] += 1
+
+    def tree_summary(self) -> str:
+        """The time spent in each phase since the last call (i.e., within the current tree), and mark the start of
+        the next tree.
+
+        :return: A one line summary (e.g., "select=12ms, expand=3ms, ...").
+        """
+        parts = []
+        for name, stats in self._stats.items():
+            parts.append(f"{name}={(stats.total_ns - self._tree_marks[name]) / 1_000_000:.0f}ms")
+            self._tree_marks[name] = stats.total_ns
+        return ", ".join(parts)
+
+    def summary(self) -> Dict[str, str]:
+        """The totals and percentiles of each phase, and the split of the search time between the target app and us.
+        With concurrent executors (e.g., a random search pipeline) the target time is summed over them, thus it can be
+        more than the search time.
+
+        :return: A dictionary of report keys to values.
+        """
+        report = {}
+        if not self.enabled:
+            return report
+        for name, stats in self._stats.items():
+            p50, p95, p99 = stats.percentiles_us()
+            report[f'Profile: {name}'] = f"total={stats.total_ns / 1_000_000:.1f}ms, count={stats.count}, " \
+                                         f"p50={p50:.1f}us, p95={p95:.1f}us, p99={p99:.1f}us, " \
+                                         f"max={stats.max_ns / 1_000:.1f}us"
+        search_ns = max(self._search_ns, 1)
+        target_ns = self._stats['run'].total_ns
+        report['Profile: Search time(ms)'] = f"{search_ns / 1_000_000:.1f}"
+        report['Profile: Target time(ms)'] = f"{target_ns / 1_000_000:.1f}"
+        report['Profile: Python time(ms)'] = f"{max(search_ns - target_ns, 0) / 1_000_000:.1f}"
+        report['Profile: Target share of search time'] = f"{target_ns / search_ns:.3f}"
+        if self.sampler != 'none':
+            report['Profile: Sampler'] = self.sampler
+        return report
@@ -0,0 +1,124 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+A streaming writer of the progress report (the per-execution numbers tracked when mg.extensive_data_tracking is on).
+Rows are buffered in columns and appended to the CSV file in chunks during the search, so the memory used is bounded by
+the chunk size and a crash only loses the last chunk.
+
+The file keeps the layout of the old progress report: a '#' comment line with the experiment information, the header,
+and the rows. A second comment line with the end-of-run numbers is appended when the search finishes.
+"""
+
+import os
+import csv
+from typing import List, Sequence, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+PROGRESS_SAMPLING = ['all', 'every_n', 'events']
+"""The sampling strategies of the progress rows:
+    - 'all': every execution.
+    - 'every_n': every n-th execution, plus the events (i.e., executions with new coverage, max, or cost).
+    - 'events': only the events.
+"""
+
+
+class ProgressWriter:
+    """Append the progress rows to a CSV file in chunks.
+
+    :param file_path: The CSV file.
+    :param columns: The column names, in the order of the values passed to add().
+    :param sampling: One of PROGRESS_SAMPLING.
+    :param every_n: The sampling rate of 'every_n'.
+    :param chunk_rows: The number of rows buffered before they are written.
+    :param comments: A comment written at the top of the file (e.g., the experiment information).
+    :param append: If True and the file exists (e.g., the report of a resumed search), the rows are appended to it
+        without a new header.
+    """
+
+    def __init__(self, file_path: str, columns: List[str], sampling: str = 'all', every_n: int = 100,
+                 chunk_rows: int = 1024, comments: Optional[str] = None, append: bool = False):
+        """Constructor method
+        """
+        if sampling not in PROGRESS_SAMPLING:
+            raise ValueError(f"Unknown progress sampling '{sampling}', it must be one of {PROGRESS_SAMPLING}")
+        if every_n < 1:
+            raise ValueError(f"The progress sampling rate must be at least 1. Got {every_n}")
+
+        self.file_path = file_path
+        self.columns = columns
+        self.sampling = sampling
+        self.every_n = every_n
+        self.chunk_rows = max(chunk_rows, 1)
+
+        self._buffer: List[list] = [[] for _ in columns]
+        self._buffered = 0
+        self._seen = 0
+        self.rows_written = 0
+
+        if append and os.path.isfile(file_path):
+            self._file = open(file_path, 'a', newline='')
+            self._writer = csv.writer(self._file)
+            return
+        self._file = open(file_path, 'w', newline='')
+        if comments is not None:
+            self._file.write("# " + comments + "\n")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+        self._file.flush()
+
+    def add(self, values: Sequence, is_event: bool = False):
+        """Add the row of an execution (if the sampling keeps it).
+
+        :param values: The values of the row, in the order of the columns.
+        :param is_event: Whether the execution found new coverage, max, or cost.
+        """
+        self._seen += 1
+        if self.sampling == 'events':
+            if not is_event:
+                return
+        elif self.sampling == 'every_n':
+            if not is_event and self._seen % self.every_n != 0:
+                return
+        for column, value in zip(self._buffer, values):
+            column.append(value)
+        self._buffered += 1
+        if self._buffered >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered rows to the file.
+        """
+        if self._buffered:
+            self._writer.writerows(zip(*self._buffer))
+            self.rows_written += self._buffered
+            for column in self._buffer:
+                column.clear()
+            self._buffered = 0
+        self._file.flush()
+
+    def close(self, comments: Optional[str] = None):
+        """Write the remaining rows, append a closing comment (if any), and close the file.
+
+        :param comments: A comment written at the end of the file (e.g., the run duration and totals).
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        if comments is not None:
+            self._file.write("# " + comments + "\n")
+        self._file.close()
+
+
+def read_progress_report(file_path: str, columns: Optional[List[str]] = None) -> "pd.DataFrame":
+    """Load a progress report (written by ProgressWriter or the older all-at-once writer).
+
+    :param file_path: The CSV file.
+    :param columns: Only load these columns (None loads all of them).
+    :return: A data frame with a row per recorded execution.
+    """
+    import pandas as pd
+    return pd.read_csv(file_path, comment='#', usecols=columns, engine='c')
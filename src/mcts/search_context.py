@@ -0,0 +1,120 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+The per-search state that used to be module globals (see mcts_globals): the UCB1 exploration constant (C), the visits
+before expansion (E), the min possible cost of the target (learned in the warmup), the literal encoding, and the
+connection to the target server. Every node of a tree holds a reference to the context of its search, thus two searches
+(e.g., of a grid) can coexist in one process, each against its own target server. The connection is opened by the
+search (see connect), never on import.
+"""
+
+from typing import Dict, List, Optional
+
+import mcts.mcts_globals as mg  # MCTS globals (the defaults of a context)
+from pygramm import config as pygramm_config
+from pygramm.grammar import Grammar, RHSItem, _Literal
+from executors import Executor
+from targetAppConnect import InputHandler
+
+
+class SearchContext:
+    """The state shared by the nodes of a single search.
+
+    :param c: The value of C within UCB formula (None takes mg.C).
+    :param e: The minimum visits to a node before it can be expanded (None takes mg.E).
+    :param literal_encoding: The encoding of the grammar literals into input bytes (None takes mg.LITERAL_ENCODING).
+    :param input_handler: The connection to the target server the inputs of this search run on (e.g., taken from a pool
+        of servers). None leaves it to the search to connect (see connect).
+    :param min_possible_cost: The cost below which a run is anomalous (None takes mg.TARGET_APP_MIN_POSSIBLE_COST).
+    """
+
+    __slots__ = ('c', 'e', 'literal_encoding', 'input_handler', 'min_possible_cost', '_encoded_literals')
+
+    def __init__(self, c: Optional[float] = None, e: Optional[int] = None, literal_encoding: Optional[str] = None,
+                 input_handler: Optional[Executor] = None, min_possible_cost: Optional[int] = None):
+        """Constructor method
+        """
+        self.c = mg.C if c is None else c
+        self.e = mg.E if e is None else e
+        self.literal_encoding = mg.LITERAL_ENCODING if literal_encoding is None else literal_encoding
+        self.input_handler = input_handler
+        self.min_possible_cost = mg.TARGET_APP_MIN_POSSIBLE_COST if min_possible_cost is None else min_possible_cost
+        self._encoded_literals: Dict[_Literal, bytes] = {}  # literals are interned by pygramm, encode each only once
+
+    def connect(self, host: str = 'localhost', port: int = 2300) -> Executor:
+        """Open the connection of this search to the target server, or reopen the given one if it was closed.
+
+        :param host: The host of the target server (only used if no connection was given).
+        :param port: The port of the target server (only used if no connection was given).
+        :return: The connection.
+        """
+        if self.input_handler is None:
+            self.input_handler = InputHandler(host=host, port=port)
+        elif not self.input_handler.is_connected():
+            self.input_handler.open_connection()
+        return self.input_handler
+
+    def close(self):
+        """Close the connection of this search to the target server (if open).
+        """
+        if self.input_handler is not None and self.input_handler.is_connected():
+            self.input_handler.close_connection()
+
+    def prepare_grammar(self, gram: Grammar):
+        """Encode every literal of the grammar once, and make the tokens of each literal the bytes of its encoding
+        (pygramm counts the bytes of its utf-8 encoding), thus the budget is in bytes of the inputs given the literal
+        encoding (e.g., "\xff" is one byte in latin-1, not two).
+
+        :param gram: The grammar of the search (its literal lengths and min tokens are updated in place).
+        :raises ValueError: If a literal can't be encoded (e.g., a literal above U+00FF given latin-1).
+        """
+        changed = False
+        for literal in gram.literals.values():
+            try:
+                encoded = literal.text.encode(self.literal_encoding)
+            except UnicodeEncodeError as e:
+                raise ValueError(f"The grammar literal {literal} can't be encoded as {self.literal_encoding} "
+                                 f"({e.reason}), change the literal_encoding") from e
+            self._encoded_literals[literal] = encoded
+            if pygramm_config.LEN_BASED_SIZE and literal.min_tokens() != len(encoded):
+                literal._len_cache = len(encoded)
+                changed = True
+        if not changed:
+            return
+
+        # the cached lengths of the character ranges and the min (and potential) tokens of the symbols are stale
+        stack: List[RHSItem] = [symbol.expansions for symbol in gram.symbols.values()]
+        seen = set()
+        while stack:
+            item = stack.pop()
+            if item is None or id(item) in seen:
+                continue
+            seen.add(id(item))
+            if getattr(item, '_min_len_cache', None) is not None:
+                item._min_len_cache = item._pot_len_cache = None
+            stack.extend(getattr(item, 'items', ()))
+            stack.append(getattr(item, 'child', None))
+        gram._calc_min_tokens()
+        gram._calc_pot_tokens()
+
+    def encode_literal(self, literal: _Literal) -> bytes:
+        """The bytes of a grammar literal given the literal encoding of this search.
+
+        :param literal: The grammar literal.
+        :return: The encoded text of the literal.
+        """
+        encoded = self._encoded_literals.get(literal)
+        if encoded is None:
+            encoded = literal.text.encode(self.literal_encoding)
+            self._encoded_literals[literal] = encoded
+        return encoded
+
+    def __getstate__(self):
+        # a saved tree keeps the search parameters, not the connection (or the literals cache)
+        return {'c': self.c, 'e': self.e, 'literal_encoding': self.literal_encoding,
+                'min_possible_cost': self.min_possible_cost}
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
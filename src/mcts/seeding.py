@@ -0,0 +1,122 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+Helpers to bootstrap a search from an existing corpus of inputs (e.g., target_apps/*/inputs or perffuzz-seeds).
+
+The grammar parser in pygramm parses grammars, not inputs. Thus, to find the derivation of a seed we search the same
+derivation space the tree is built from (the valid choices of each MCTSNode given its budget) for a path whose
+terminal text is exactly the seed. The path is a list of choice indices, which can be replayed in the tree because
+populating the children of a node follows the same order of valid choices. Only the nodes of the path are created (the
+siblings are not), and each is adopted by its parent once the search expands it (see MCTSNode.seed_child).
+"""
+
+import os
+import logging
+from typing import List, Optional, Tuple
+
+from mcts.mctsnode import MCTSNode
+
+log = logging.getLogger("Seeding")
+
+
+def collect_seed_files(paths: List[str]) -> List[str]:
+    """Collect all the seed files from the given paths. A path can be either a file or a directory, in which case all
+    the files under it (recursively) are collected. Hidden files and READMEs are skipped.
+
+    :param paths: Files or directories of seed inputs.
+    :return: A sorted list of seed files.
+    """
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+        elif os.path.isdir(path):
+            for dir_path, _, file_names in os.walk(path):
+                for file_name in file_names:
+                    if file_name.startswith('.') or file_name.lower().startswith('readme'):
+                        continue
+                    files.append(os.path.join(dir_path, file_name))
+        else:
+            log.warning(f"The seed path {path} does not exist, skipping it.")
+    return sorted(files)
+
+
+def find_derivation(root: MCTSNode, target: bytes, max_steps: int = 100_000) -> Optional[List[int]]:
+    """Search for a derivation from the given root that generates exactly the target text. The search is a depth-first
+    search over the valid choices of each node. It prunes any node which text is not a prefix of the target, any node
+    that must generate more tokens than the target has bytes, and any state (text length, budget, symbol, and stack)
+    that was already visited.
+
+    :param root: The node to start the derivation from (usually the tree root).
+    :param target: The bytes we are looking for.
+    :param max_steps: The maximum number of nodes to visit before we give up.
+    :return: A list of choice indices that lead from the root to a terminal node with the target text, or None if we
+        could not find one.
+    """
+    # at any node, the budget is what remains from the root budget after the tokens used and the minimum tokens the
+    # pending symbols need. Thus, the difference is the minimum length of any input derived from that node.
+    max_len = len(target)
+    total_budget = root.get_allowed_budget()
+    visited = set()
+    frontier = [(root, [])]
+    steps = 0
+    while frontier:
+        node, path = frontier.pop()
+        steps += 1
+        if steps > max_steps:
+            log.info(f"Gave up finding a derivation after {max_steps} steps for {target}")
+            return None
+
+        if node.is_terminal():
+            if node.text == target:
+                return path
+            continue
+
+        state = (len(node.text), node.budget, id(node.symbol), tuple(id(item) for item in node.stack))
+        if state in visited:
+            continue
+        visited.add(state)
+
+        choices = node.get_valid_choices()
+        # push in reverse to explore the choices in the grammar order
+        for idx in reversed(range(len(choices))):
+            child = node.derive(choices[idx])
+            if total_budget - child.budget <= max_len and target.startswith(child.text):
+                frontier.append((child, path + [idx]))
+    return None
+
+
+def replay_derivation(root: MCTSNode, path: List[int]) -> Tuple[MCTSNode, int]:
+    """Replay a derivation in the tree. Only the child given by the path is derived at each step (the derivations of
+    seeds sharing a prefix share its nodes), the nodes on the path are not expanded.
+
+    :param root: The tree root the path was found from.
+    :param path: The choice indices as returned by find_derivation.
+    :return: A tuple of the terminal node reached and the number of nodes created.
+    """
+    node = root
+    edges = 0
+    for idx in path:
+        node, created = node.seed_child(idx)
+        edges += created
+    if not node.is_terminal():
+        raise RuntimeError(f"The replayed derivation did not reach a terminal node {node}")
+    return node, edges
+
+
+def derivation_choices(root: MCTSNode, path: List[int]) -> list:
+    """The grammar choices taken along a derivation path (e.g., to feed them to the bias history).
+
+    :param root: The tree root the path was found from.
+    :param path: The choice indices as returned by find_derivation.
+    :return: The list of RHSItem choices.
+    """
+    choices = []
+    node = root
+    for idx in path:
+        choice = node.get_valid_choices()[idx]
+        choices.append(choice)
+        node = node.get_children()[idx] if node.get_children() else node.derive(choice)
+    return choices
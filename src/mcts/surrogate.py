@@ -0,0 +1,128 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+import math
+import zlib
+import random
+import logging
+from typing import List
+
+import numpy as np
+
+from mcts.mctsnode import MCTSNode
+
+
+class CostSurrogate:
+    """An online model of the target application cost used to pre-screen rollouts before executing them. Executing an
+    input on a slow target (e.g., lunasvg or graphviz) takes tens of milliseconds while deriving one takes microseconds.
+    Thus, we derive several candidates from the same node and only send the most promising one to the target.
+
+    The model is a ridge regression over a small vector of derivation features: the input length, the tokens used,
+    and the counts of the grammar symbols used along the derivation (hashed into a fixed number of buckets). It predicts
+    log(1 + cost) and is trained on every (input, cost) pair we observe.
+
+    :param budget: The allowed budget of the search (used to scale the length features).
+    :param num_buckets: The number of buckets the symbol counts are hashed into.
+    :param exploration: The probability of picking a random candidate instead of the one with the best prediction.
+    :param min_observations: The number of observations needed before we trust the model predictions.
+    :param ridge: The L2 regularization of the regression.
+    :param refit_every: How many observations to accumulate before solving for new weights.
+    """
+
+    def __init__(self, budget: int, num_buckets: int = 64, exploration: float = 0.2, min_observations: int = 50,
+                 ridge: float = 1.0, refit_every: int = 25):
+        """Constructor method
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+
+        if not 0.0 <= exploration <= 1.0:
+            raise ValueError(f"The surrogate exploration must be within [0, 1]. Got {exploration}")
+
+        self.budget = max(budget, 1)
+        self.num_buckets = num_buckets
+        self.exploration = exploration
+        self.min_observations = min_observations
+        self.refit_every = refit_every
+
+        # three fixed features (intercept, len, tokens) followed by the hashed symbol counts
+        self._dim = 3 + num_buckets
+        self._xtx = np.eye(self._dim) * ridge
+        self._xty = np.zeros(self._dim)
+        self._weights = np.zeros(self._dim)
+        self._buckets = {}  # grammar symbol -> bucket index (symbols are interned, so we key them by identity)
+
+        # stats for the report
+        self.observations = 0
+        self.screened_picks = 0
+        self.random_picks = 0
+        self.candidates_derived = 0
+
+    def features(self, node: MCTSNode) -> np.ndarray:
+        """Extract the feature vector of a terminal node. The symbol counts are collected by walking the node ancestors
+        since every node in a derivation holds the symbol it resolved.
+
+        :param node: A terminal node (the end of a derivation).
+        :return: The feature vector of the derivation.
+        """
+        x = np.zeros(self._dim)
+        x[0] = 1.0
+        x[1] = len(node.text) / self.budget
+        x[2] = node.tokens_used / self.budget
+        s = node
+        while s is not None:
+            if s.symbol is not None:
+                bucket = self._buckets.get(s.symbol)
+                if bucket is None:
+                    # a stable hash (unlike hash() of a str), so a seeded search ranks the candidates the same way
+                    bucket = 3 + zlib.crc32(str(s.symbol).encode('utf-8')) % self.num_buckets
+                    self._buckets[s.symbol] = bucket
+                x[bucket] += 1.0
+            s = s.parent
+        x[3:] /= self.budget
+        return x
+
+    def predict(self, node: MCTSNode) -> float:
+        """Predict log(1 + cost) of the input a terminal node represents.
+
+        :param node: A terminal node.
+        :return: The predicted (log) cost.
+        """
+        return float(self.features(node) @ self._weights)
+
+    def is_ready(self) -> bool:
+        """Whether the model observed enough runs to be trusted.
+
+        :return: True if the model can be used to rank candidates.
+        """
+        return self.observations >= self.min_observations
+
+    def pick(self, candidates: List[MCTSNode]) -> MCTSNode:
+        """Pick one of the candidates to be executed. With the exploration probability (or if the model is not ready
+        yet) the pick is random. Otherwise, it is the candidate with the highest predicted cost.
+
+        :param candidates: The terminal nodes derived from the same node.
+        :return: The candidate to execute.
+        """
+        self.candidates_derived += len(candidates)
+        if len(candidates) == 1 or not self.is_ready() or random.random() < self.exploration:
+            self.random_picks += 1
+            return random.choice(candidates)
+        self.screened_picks += 1
+        return max(candidates, key=self.predict)
+
+    def observe(self, node: MCTSNode, cost: int):
+        """Train the model on an observed run.
+
+        :param node: The terminal node that was executed.
+        :param cost: The execution cost of its input.
+        """
+        x = self.features(node)
+        self._xtx += np.outer(x, x)
+        self._xty += x * math.log1p(cost)
+        self.observations += 1
+        if self.observations % self.refit_every == 0:
+            try:
+                self._weights = np.linalg.solve(self._xtx, self._xty)
+            except np.linalg.LinAlgError:
+                self.log.warning("Could not refit the surrogate weights, keeping the old ones.")
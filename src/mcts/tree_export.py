@@ -0,0 +1,226 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+Streaming exporters of the search tree (dot language for rendering, or an indented text dump). The tree is walked
+iteratively (no recursion limit on deep budgets) and each node is written to the stream as soon as it is visited, so
+nothing bigger than a node line is built in memory. The UCB1 value of each child is computed once per export.
+
+Big trees can be pruned while exporting:
+    - top_k: only the k most visited children of each node.
+    - max_depth: only the nodes up to k levels below the exported root.
+    - min_visits: only the children visited at least k times.
+    - best_path_only: only the path that follows the max UCB1 child from the root.
+The number of children pruned at a node is noted in the output.
+"""
+
+import re
+from typing import IO, List, Tuple
+
+from pygramm.grammar import RHSItem
+from mcts.mctsnode import MCTSNode, printable
+
+_DOT_ESCAPE = re.compile("([^a-zA-Z0-9])")
+
+_DOT_HEADER = "digraph {\n\tnode [shape=record, colorscheme=rdylbu11];\n"
+
+_DOT_LEGEND = "\tsubgraph cluster_key {\n" \
+              "\t\trank=sink;\n" \
+              "\t\tstyle = filled;\n" \
+              "\t\tcolor=lightgrey;\n" \
+              "\t\tlabel=\"Legend\";\n" \
+              "\t\tdetails [label=\"{Generated input\\n'' means empty|len(input)= length \\nof generated input|" \
+              "# used tokens = total terminal token \\nused to generated the shown input \\nwhich must never " \
+              "exceed the budget}|" \
+              "SYMBOL\\nunder evaluation|" \
+              "{AB= Allowed Budget|PB= Passed Budget|len(s)= Stack Size}|" \
+              "STACK|" \
+              "{V= Total Costs (sum) based on \\nany descendant of this node|N= No. of Visits|UCB= UCB value to " \
+              "reach \\nthis node from parent}" \
+              "}\"];\n" \
+              "\t\tbest_intermediate [label=\"Intermediate Node in Best Path\"; style=filled; fillcolor=8]\n" \
+              "\t\tbest_leaf [label=\"Leaf Node in Best Path\"; style=filled; fillcolor=7]\n" \
+              "\t\tbest_terminal [label=\"Terminal Node in Best Path\"; style=filled; fontcolor=white; " \
+              "fillcolor=9]\n" \
+              "\t\tintermediate [label=\"Intermediate Node\"; style=filled; fillcolor=4]\n" \
+              "\t\tleaf [label=\"Leaf Node\"; style=filled; fillcolor=5]\n" \
+              "\t\tterminal [label=\"Terminal Node\"; style=filled; fillcolor=3]\n" \
+              "\t}\n" \
+              "}\n"
+
+
+class TreeExportOptions:
+    """The pruning options of an export. The defaults export the whole tree.
+
+    :param top_k: Keep only the k most visited children of each node. Zero keeps all of them.
+    :param max_depth: Keep only the nodes up to this many levels below the exported root. A negative value has no limit.
+    :param min_visits: Keep only the children visited at least this many times.
+    :param best_path_only: Keep only the path that follows the max UCB1 child from the root.
+    """
+
+    __slots__ = ('top_k', 'max_depth', 'min_visits', 'best_path_only')
+
+    def __init__(self, top_k: int = 0, max_depth: int = -1, min_visits: int = 0, best_path_only: bool = False):
+        self.top_k = top_k
+        self.max_depth = max_depth
+        self.min_visits = min_visits
+        self.best_path_only = best_path_only
+
+    def is_pruning(self) -> bool:
+        """
+        :return: True if any of the options prunes the tree.
+        """
+        return self.top_k > 0 or self.max_depth >= 0 or self.min_visits > 0 or self.best_path_only
+
+
+_NO_PRUNING = TreeExportOptions()
+
+
+def _kept_children(node: MCTSNode, depth: int, is_best: bool,
+                   options: TreeExportOptions) -> Tuple[List[Tuple[MCTSNode, float, bool]], int]:
+    """The children of a node that are exported, each with its UCB1 value (computed once) and whether it is on the best
+    path.
+
+    :param node: The node.
+    :param depth: The depth of the node below the exported root.
+    :param is_best: Whether the node is on the best path.
+    :param options: The pruning options.
+    :return: The kept (child, ucb1, is_best) in the tree order, and the number of pruned children.
+    """
+    children = node.get_children()
+    if not children:
+        return [], 0
+    if 0 <= options.max_depth <= depth:
+        return [], len(children)
+
+    ucbs = [child.get_ucb1() for child in children]
+    max_ucb = max(ucbs) if is_best else None
+    kept = [(child, ucb, ucb == max_ucb) for child, ucb in zip(children, ucbs)]
+
+    if options.best_path_only:
+        kept = [next(item for item in kept if item[2])] if is_best else []
+    if options.min_visits > 0:
+        kept = [item for item in kept if item[0].get_visits() >= options.min_visits]
+    if 0 < options.top_k < len(kept):
+        most_visited = sorted(range(len(kept)), key=lambda i: kept[i][0].get_visits(), reverse=True)[:options.top_k]
+        kept = [kept[i] for i in sorted(most_visited)]
+    return kept, len(children) - len(kept)
+
+
+def _dot_escape(value: str) -> str:
+    # escape all characters except the ones specified, because they could be graphviz chars.
+    return _DOT_ESCAPE.sub(r"\\\1", value)
+
+
+def _dot_node(node: MCTSNode, ucb: float, is_best: bool, escaped_symbols: dict) -> str:
+    """The dot struct of a single node.
+
+    :param node: The node.
+    :param ucb: The UCB1 value of the node.
+    :param is_best: Whether the node is on the best path.
+    :param escaped_symbols: A cache of the escaped grammar symbols (shared across the nodes of an export).
+    :return: The struct line.
+    """
+    if node.locked:
+        style = "style=filled; fontcolor=white; fillcolor=black"
+    elif is_best:  # blue background
+        if node.is_terminal():
+            style = "style=filled; fontcolor=white; fillcolor=9"
+        elif node.is_leaf():
+            style = "style=filled; fillcolor=7"
+        else:
+            style = "style=filled; fillcolor=8"
+    else:  # gold background
+        if node.is_terminal():
+            style = "style=filled; fillcolor=3"
+        elif node.is_leaf():
+            style = "style=filled; fillcolor=5"
+        else:
+            style = "style=filled; fillcolor=4"
+
+    def escaped(symbol) -> str:
+        key = str(symbol)
+        value = escaped_symbols.get(key)
+        if value is None:
+            value = escaped_symbols[key] = _dot_escape(key)
+        return value
+
+    # symbol in hand
+    if isinstance(node.symbol, RHSItem):
+        symbol = escaped(node.symbol)
+    else:
+        symbol = f"{node.symbol}"
+
+    # stack content (top first)
+    if node.stack:
+        stack = "|".join(escaped(item) for item in reversed(node.stack))
+    else:
+        stack = "EMPTY\\nSTACK"
+
+    text = _dot_escape(printable(node.text, node.context.literal_encoding))
+    return f"\tstruct{id(node)} [{style}; label=\"" \
+           f"{{'{text}'|  len(input): {len(node.text)}|# used tokens: {node.tokens_used}}}|" \
+           f"{symbol}|" \
+           f"{{AB: {node.allowed_budget}|PB:{node.budget}|len(s):{len(node.stack)}}}|" \
+           f"{{{stack}}}|" \
+           f"{{V: {node.get_total_cost()}|N: {node.get_visits()}| UCB1: {ucb}}}\"];\n"
+
+
+def _dot_edge(parent: MCTSNode, child: MCTSNode, ucb: float) -> str:
+    c = 1 + child.level / 181  # the level scaled from [0, 181] to [1, 2]
+    pen_width = 0.5 if ucb in (float("inf"), float("-inf")) else round(ucb, 4)
+    return f"\tstruct{id(parent)} -> struct{id(child)} " \
+           f"[taillabel=\"C={round(c, 2)}, UCB={round(ucb, 4)}, level={child.level}\"; penwidth={pen_width}];\n"
+
+
+def write_dot(root: MCTSNode, stream: IO[str], options: TreeExportOptions = _NO_PRUNING) -> int:
+    """Write the tree in the dot language for post-search rendering. The method works for the target applications we
+    tried. However, there is no guarantee that it would work for all target applications as the depending on the
+    applications' language it can interfere with the dot code.
+
+    :param root: The node from which we would write the tree.
+    :param stream: A text stream (e.g., an open file).
+    :param options: The pruning options.
+    :return: The number of nodes written.
+    """
+    stream.write(_DOT_HEADER)
+    escaped_symbols = {}
+    written = 0
+    frontier = [(root, root.get_ucb1(), True, 0)]
+    while frontier:
+        node, ucb, is_best, depth = frontier.pop()
+        stream.write(_dot_node(node, ucb, is_best, escaped_symbols))
+        written += 1
+        kept, pruned = _kept_children(node, depth, is_best, options)
+        for child, child_ucb, child_is_best in kept:
+            stream.write(_dot_edge(node, child, child_ucb))
+        if pruned:
+            stream.write(f"\t// struct{id(node)}: {pruned} children pruned\n")
+        frontier.extend((child, child_ucb, child_is_best, depth + 1) for child, child_ucb, child_is_best
+                        in reversed(kept))
+    stream.write(_DOT_LEGEND)
+    return written
+
+
+def write_text(root: MCTSNode, stream: IO[str], options: TreeExportOptions = _NO_PRUNING) -> int:
+    """Write the tree as text, a node per line indented by its level (see MCTSNode.__str__ for the line format).
+
+    :param root: The node from which we would write the tree.
+    :param stream: A text stream (e.g., an open file).
+    :param options: The pruning options.
+    :return: The number of nodes written.
+    """
+    indent = "    "
+    written = 0
+    frontier = [(root, True, 0)]
+    while frontier:
+        node, is_best, depth = frontier.pop()
+        stream.write(f"{node.level * indent}{node}\n")
+        written += 1
+        kept, pruned = _kept_children(node, depth, is_best, options) if options.is_pruning() else \
+            ([(child, 0.0, False) for child in node.get_children()], 0)
+        if pruned:
+            stream.write(f"{(node.level + 1) * indent}... {pruned} children pruned\n")
+        frontier.extend((child, child_is_best, depth + 1) for child, _, child_is_best in reversed(kept))
+    return written
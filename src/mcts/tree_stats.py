@@ -0,0 +1,134 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+Incrementally maintained statistics of the search tree (size, shape, and approximate memory), plus the memory of the
+search process. These are the numbers needed to size E, the budget, and how many searches fit in a host.
+"""
+
+import os
+import sys
+import logging
+import tracemalloc
+from typing import List, Optional
+
+from mcts.mctsnode import MCTSNode
+
+
+def approx_node_bytes(node: MCTSNode) -> int:
+    """An approximation of the memory a node holds on its own: the object, its attributes, the text, the stack, the
+    children list, and its fork of the bias (the bias table itself is shared, thus not counted).
+
+    :param node: The node.
+    :return: The approximate size in bytes.
+    """
+    return sys.getsizeof(node) + sys.getsizeof(node.__dict__) + sys.getsizeof(node.text) + \
+        sys.getsizeof(node.stack) + sys.getsizeof(node.get_children()) + sys.getsizeof(node.bias) + \
+        sys.getsizeof(node.bias.history)
+
+
+def process_rss() -> int:
+    """
+    :return: The resident set size (in bytes) of this process.
+    """
+    import psutil
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+class TreeStats:
+    """The statistics of a single tree, updated each time a node is expanded rather than by walking the tree.
+
+    :param root: The root of the tree.
+    """
+
+    def __init__(self, root: MCTSNode):
+        """Constructor method
+        """
+        self.nodes = 1
+        self.leaves = 1
+        self.terminals = 1 if root.is_terminal() else 0
+        self.max_depth = 0
+        self.approx_bytes = approx_node_bytes(root)
+
+    @classmethod
+    def from_tree(cls, root: MCTSNode) -> "TreeStats":
+        """Build the statistics of an existing tree by walking it once (e.g., after a tree was pre-expanded by seeding).
+
+        :param root: The root of the tree.
+        :return: The statistics of the tree.
+        """
+        stats = cls(root)
+        frontier: List[MCTSNode] = [root]
+        while frontier:
+            node = frontier.pop()
+            if not node.is_leaf():
+                stats.on_expand(node)
+                frontier.extend(node.get_children())
+        return stats
+
+    def on_expand(self, node: MCTSNode):
+        """Account for the children of a node that was just expanded.
+
+        :param node: The expanded node (its children are populated).
+        """
+        children = node.get_children()
+        self.nodes += len(children)
+        self.leaves += len(children) - 1  # the expanded node is not a leaf anymore
+        for child in children:
+            if child.is_terminal():
+                self.terminals += 1
+            self.approx_bytes += approx_node_bytes(child)
+        if children and children[0].level > self.max_depth:
+            self.max_depth = children[0].level
+
+    def summary(self) -> str:
+        """
+        :return: A one line summary of the tree statistics.
+        """
+        return f"nodes={self.nodes}, leaves={self.leaves}, terminals={self.terminals}, max_depth={self.max_depth}, " \
+               f"approx_tree_mb={self.approx_bytes / 1_048_576:.2f}"
+
+
+class MemoryTracer:
+    """An optional tracemalloc based tracer of the search allocations, snapshotted each time a tree is dropped.
+
+    :param enabled: If False, nothing is traced.
+    :param top_n: The number of top allocation sites to report per snapshot.
+    """
+
+    def __init__(self, enabled: bool = False, top_n: int = 5):
+        """Constructor method
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.enabled = enabled
+        self.top_n = top_n
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def summary(self) -> str:
+        """Snapshot the traced allocations and summarize the current and peak traced memory, and the top allocation
+        sites that grew the most since the last snapshot.
+
+        :return: A one line summary (empty if the tracer is disabled).
+        """
+        if not self.enabled:
+            return ""
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        if self._snapshot is None:
+            top = snapshot.statistics('lineno')[:self.top_n]
+        else:
+            top = snapshot.compare_to(self._snapshot, 'lineno')[:self.top_n]
+        self._snapshot = snapshot
+        sites = "; ".join(f"{stat.traceback[0].filename.split(os.sep)[-1]}:{stat.traceback[0].lineno}="
+                          f"{stat.size / 1_048_576:.2f}mb" for stat in top)
+        tracemalloc.reset_peak()
+        return f"traced_mb={current / 1_048_576:.2f}, traced_peak_mb={peak / 1_048_576:.2f}, top=[{sites}]"
+
+    def stop(self):
+        """Stop tracing (if we are tracing).
+        """
+        if self.enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
@@ -0,0 +1,214 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+Record the answers of the target server during a real run, and replay them later without the target. Both executors
+have the methods of executors.Executor (run_input, is_connected, open_connection, and close_connection), so they can be
+given to a search (see SearchContext) instead of a connection.
+
+The recording is a JSON lines file (executions.jsonl) with one object per execution, in the order they were made:
+    {"run_type": "nml", "cost": 7186, "hnb": 0, "hnm": 0, "hs": 42, "input": "..."}
+The input bytes are stored as a latin-1 decoded string (as in the execution trace, see mcts.exec_trace).
+
+A replay answers each input with its recorded answers in order (thus, a search that makes the same executions, e.g.,
+given the same seed, gets the exact same answers). An input executed more times than recorded gets its last answer
+with no new coverage. The cost of an input that was never recorded is given by the replay model:
+    - 'nearest': the cost (and hotspot) of the recorded input with the nearest length.
+    - 'length': a least squares fit of the cost given the input length (the hotspot of the nearest length).
+    - 'strict': an error (e.g., to check that a replayed search did not diverge from the recorded one).
+"""
+
+import os
+import copy
+import json
+import bisect
+import threading
+import hashlib
+from typing import Dict, List, Optional, Tuple, Union
+
+from executors import Executor
+from targetAppConnect import _MAX_INPUT_SIZE
+
+REPLAY_MODELS = ['nearest', 'length', 'strict']
+"""The models of the cost of the inputs that were not recorded."""
+
+RECORDING_FILE_NAME = "executions.jsonl"
+"""The recording of a search within its output directory."""
+
+
+class RecordingExecutor:
+    """Run the inputs on the target server and record every answer. The recorder can be shared by several threads (it
+    has the concurrency of its executor), and several executors can be recorded into the same file (see share).
+
+    :param executor: The executor of the inputs (e.g., an InputHandler, see executors).
+    :param file_path: The recording file.
+    :param append: If True, the answers are appended to an existing recording (e.g., of a resumed search).
+    """
+
+    def __init__(self, executor: Executor, file_path: str, append: bool = False):
+        """Constructor method
+        """
+        self.executor = executor
+        self.file_path = file_path
+        self.concurrency = getattr(executor, 'concurrency', 1)  # see Executor
+        self.recorded = 0
+        self._file = open(file_path, 'a' if append else 'w')
+        self._lock = threading.Lock()  # one answer (line) at a time
+        self._owns_file = True
+
+    def share(self, executor: Executor) -> 'RecordingExecutor':
+        """Record another executor (e.g., an additional target server of a pipeline) into the same recording.
+
+        :param executor: The other executor.
+        :return: Its recorder, which leaves the recording open when it is closed.
+        """
+        shared = copy.copy(self)
+        shared.executor = executor
+        shared.concurrency = getattr(executor, 'concurrency', 1)
+        shared.recorded = 0
+        shared._owns_file = False
+        return shared
+
+    def run_input(self, test_case: Union[str, bytes], run_type: str = "nml") -> Tuple[int, int, bool, int]:
+        """Run the input on the target server (see InputHandler.run_input) and record the answer.
+        """
+        if isinstance(test_case, str):
+            test_case = test_case.encode('utf_8')
+        cost, hnb, hnm, hs = self.executor.run_input(test_case, run_type=run_type)
+        record = json.dumps({'run_type': run_type, 'cost': cost, 'hnb': hnb, 'hnm': int(hnm), 'hs': hs,
+                             'input': test_case.decode('latin-1')}, separators=(',', ':'))
+        with self._lock:
+            self._file.write(record)
+            self._file.write('\n')
+            self.recorded += 1
+        return cost, hnb, hnm, hs
+
+    def is_connected(self) -> bool:
+        return self.executor.is_connected()
+
+    def open_connection(self):
+        self.executor.open_connection()
+
+    def close_connection(self):
+        self.close()
+        self.executor.close_connection()
+
+    def close(self):
+        """Close the recording file (the connection stays open), unless it is shared from another recorder.
+        """
+        if self._owns_file and not self._file.closed:
+            self._file.close()
+
+
+class ReplayExecutor:
+    """Answer the inputs from a recording instead of the target server.
+
+    :param file_path: The recording file (see RecordingExecutor).
+    :param model: The model of the cost of the inputs that were not recorded (see REPLAY_MODELS).
+    """
+
+    def __init__(self, file_path: str, model: str = 'nearest'):
+        """Constructor method
+        """
+        if model not in REPLAY_MODELS:
+            raise ValueError(f"Unknown replay model '{model}', it must be one of {REPLAY_MODELS}")
+        self.file_path = file_path
+        self.model = model
+
+        self._answers: Dict[bytes, List[Tuple[int, int, bool, int]]] = {}
+        self._served: Dict[bytes, int] = {}  # the answers served so far by input
+        lengths_costs: List[Tuple[int, int, int]] = []  # (len, cost, hs) of the normal runs
+        with open(file_path) as recording:
+            for line in recording:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                text = record['input'].encode('latin-1')
+                self._answers.setdefault(text, []).append((record['cost'], record['hnb'], bool(record['hnm']),
+                                                           record['hs']))
+                if record['run_type'] != 'wup':
+                    lengths_costs.append((len(text), record['cost'], record['hs']))
+        if not self._answers:
+            raise RuntimeError(f"No executions recorded in {file_path}")
+
+        # the unseen inputs models
+        lengths_costs.sort()
+        self._lengths = [length for length, _, _ in lengths_costs]
+        self._nearest = [(cost, hs) for _, cost, hs in lengths_costs]
+        n = len(lengths_costs)
+        mean_len = sum(self._lengths) / n if n else 0.0
+        mean_cost = sum(cost for cost, _ in self._nearest) / n if n else 0.0
+        var_len = sum((length - mean_len) ** 2 for length in self._lengths)
+        self._slope = sum((length - mean_len) * (cost - mean_cost) for length, (cost, _) in
+                          zip(self._lengths, self._nearest)) / var_len if var_len > 0 else 0.0
+        self._intercept = mean_cost - self._slope * mean_len
+
+        # stats
+        self.replayed = 0  # the inputs answered from the recording
+        self.repeated = 0  # the inputs executed more times than recorded
+        self.unseen = 0  # the inputs that were not recorded (answered by the model)
+        self._fingerprint = hashlib.sha256()
+
+    def run_input(self, test_case: Union[str, bytes], run_type: str = "nml") -> Tuple[int, int, bool, int]:
+        """Answer the input as the target server did in the recording (see InputHandler.run_input).
+        """
+        if isinstance(test_case, str):
+            test_case = test_case.encode('utf_8')
+        if len(test_case) > _MAX_INPUT_SIZE:
+            raise RuntimeError(f"Got input with size ({len(test_case)}) larger than the allowed limit "
+                               f"({_MAX_INPUT_SIZE})")
+        self._fingerprint.update(len(test_case).to_bytes(4, 'little'))
+        self._fingerprint.update(test_case)
+
+        answers = self._answers.get(test_case)
+        if answers is not None:
+            served = self._served.get(test_case, 0)
+            self._served[test_case] = served + 1
+            if served < len(answers):
+                self.replayed += 1
+                return answers[served]
+            self.repeated += 1
+            cost, _, _, hs = answers[-1]
+            return cost, 0, False, hs
+
+        self.unseen += 1
+        if self.model == 'strict' or not self._lengths:
+            raise RuntimeError(f"The input {test_case!r} was not recorded in {self.file_path}")
+        length = len(test_case)
+        i = bisect.bisect_left(self._lengths, length)
+        if i == len(self._lengths) or (i > 0 and length - self._lengths[i - 1] < self._lengths[i] - length):
+            i -= 1
+        cost, hs = self._nearest[i]
+        if self.model == 'length':
+            cost = max(int(round(self._intercept + self._slope * length)), 0)
+        return cost, 0, False, hs
+
+    def fingerprint(self) -> str:
+        """
+        :return: A digest of the inputs executed so far (in order). Two runs of a search made the same executions iff
+            their fingerprints are equal.
+        """
+        return self._fingerprint.hexdigest()
+
+    def is_connected(self) -> bool:
+        return True
+
+    def open_connection(self):
+        pass
+
+    def close_connection(self):
+        pass
+
+
+def open_replay(file_path: str, model: str = 'nearest') -> Optional[ReplayExecutor]:
+    """
+    :param file_path: A recording file, or the output directory of a recorded experiment.
+    :param model: The model of the cost of the inputs that were not recorded.
+    :return: The replay executor, or None if no file is given.
+    """
+    if not file_path:
+        return None
+    if os.path.isdir(file_path):
+        file_path = os.path.join(file_path, RECORDING_FILE_NAME)
+    return ReplayExecutor(file_path, model=model)
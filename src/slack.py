@@ -2,14 +2,21 @@ __author__ = "Ziyad Alsaeed"
 __email__ = "zalsaeed@cs.uoregon.edu"
 __status__ = "Testing"
 
-import requests
+import os
 import json
+import time
+import queue
 import logging
+import functools
+import threading
 import configparser
+from typing import Any, Callable, List, Optional, Tuple
 
 logger = logging.getLogger("SlackMessages")
 
 HOST = "HostName"  # the name of the server from which these messages are sent.
+API_URL = "https://slack.com/api/chat.postMessage"
+TIMEOUT_S = 10.0  # the timeout of a post, so a slow (or unreachable) slack API can't hang a run
 
 """
 USING WEBHOOK
@@ -36,16 +43,253 @@ When in doubt try it externally using curl
 >>> curl -F content="Hello" -F channels=CHANNEL -F filename=test.txt -F token=YOUR-TOKEN 
     https://slack.com/api/files.upload
 """
-config = configparser.ConfigParser()
-try:
-    with open("credentials.ini") as configs:
-        config.read_file(configs)
-except IOError as e:
-    logger.warning(f"No configuration file: {e}")
-else:
-    webhook_url = config['DEFAULT']['WEBHOOK']
-    slack_token = config['DEFAULT']['TOKEN']
-    slack_channel = config['DEFAULT']['CHANNEL']
+
+
+@functools.lru_cache(maxsize=None)
+def _credentials() -> configparser.SectionProxy:
+    """The credentials of the slack app, read from credentials.ini on the first post (not on import, so the search can
+    be imported and run without them).
+
+    :return: The DEFAULT section (WEBHOOK, TOKEN, and CHANNEL).
+    """
+    config = configparser.ConfigParser()
+    try:
+        with open("credentials.ini") as configs:
+            config.read_file(configs)
+    except IOError as e:
+        logger.warning(f"No configuration file: {e}")
+    return config['DEFAULT']
+
+
+class WebApiBackend:
+    """Post messages with a token and a channel (chat.postMessage). The app must be added to the channel.
+
+    :param url: The endpoint of the API (e.g., a local stand-in for testing).
+    :param timeout_s: The timeout of a post (connect and read).
+    """
+
+    def __init__(self, url: str = API_URL, timeout_s: float = TIMEOUT_S):
+        self.url = url
+        self.timeout_s = timeout_s
+
+    def post(self, text: str):
+        """
+        :param text: The message to be posted.
+        :raise RuntimeError: If the message was not posted.
+        """
+        import requests
+
+        credentials = _credentials()
+        response = requests.post(self.url,
+                                 {'token': credentials.get('TOKEN', ''),
+                                  'channel': f"#{credentials.get('CHANNEL', '')}",
+                                  'text': f"*{HOST}:* {text}",
+                                  }, timeout=self.timeout_s).json()
+        if not bool(response.get('ok')):
+            raise RuntimeError(f"Request to slack returned an error. {response}")
+
+
+class WebhookBackend:
+    """Post messages to an incoming webhook.
+
+    :param url: The webhook URL. None takes the WEBHOOK of credentials.ini.
+    :param timeout_s: The timeout of a post (connect and read).
+    """
+
+    def __init__(self, url: Optional[str] = None, timeout_s: float = TIMEOUT_S):
+        self.url = url
+        self.timeout_s = timeout_s
+
+    def post(self, text: str):
+        """
+        :param text: The message to be posted.
+        :raise RuntimeError: If the message was not posted.
+        """
+        import requests
+
+        slack_data = {'text': f"*{HOST}:* {text}"}
+        response = requests.post(self.url or _credentials()['WEBHOOK'], data=json.dumps(slack_data),
+                                 headers={'Content-Type': 'application/json'}, timeout=self.timeout_s)
+        if response.status_code != 200:
+            raise RuntimeError(f"Request to slack returned an error {response.status_code}, the response is:\n"
+                               f"{response.text}")
+
+
+BACKENDS = {'api': WebApiBackend, 'webhook': WebhookBackend}
+"""The posting backends by name (a backend is any object with a post(text) method that raises on failure)."""
+
+
+def make_backend(name: str = 'api', url: str = "", timeout_s: float = TIMEOUT_S):
+    """
+    :param name: The backend name (see BACKENDS).
+    :param url: The endpoint to post to instead of the default one (e.g., a local stand-in). Empty keeps the default.
+    :param timeout_s: The timeout of a post.
+    :return: The backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown slack backend '{name}', it must be one of {list(BACKENDS)}")
+    if url:
+        return BACKENDS[name](url=url, timeout_s=timeout_s)
+    return BACKENDS[name](timeout_s=timeout_s)
+
+
+def format_digest(title: str, values: dict) -> str:
+    """A compact one-message digest of some numbers (e.g., the live metrics of a search).
+
+    :param title: The first line of the digest.
+    :param values: The numbers by name, the nested values (e.g., lists) are skipped.
+    :return: The digest message.
+    """
+    lines = [f"{title}:", "```"]
+    for name, value in values.items():
+        if isinstance(value, (bool, str)):
+            lines.append(f"{name}: {value}")
+        elif isinstance(value, int):
+            lines.append(f"{name}: {value:,}")
+        elif isinstance(value, float):
+            lines.append(f"{name}: {value:,.2f}")
+    lines.append("```")
+    return "\n".join(lines)
+
+
+class Notifier:
+    """A non-blocking dispatcher of slack messages. Messages are put in a bounded queue and posted by a background
+    thread, so a slow (or unreachable) slack API never stalls the caller, e.g., an experiment between two searches. The
+    messages sent within coalesce_s of the first pending one are joined and posted as a single message. Optionally, a
+    digest of some live numbers (e.g., SearchMetrics.snapshot) is posted every digest interval.
+
+    A failed post is logged and dropped (it is not retried), and so is a message sent while the queue is full.
+
+    :Usage example:
+    .. code-block:: python
+
+        notifier = Notifier(make_backend('api'), coalesce_s=2.0)
+        notifier.send("New Experiment")
+        notifier.start_digest(search.metrics.snapshot, interval_s=600, title="Progress")
+        ...
+        notifier.stop_digest()
+        notifier.close()  # post what is pending (within the timeout)
+
+    :param backend: The posting backend (see BACKENDS).
+    :param coalesce_s: How long to wait for more messages before posting the pending ones.
+    :param max_queue: The max number of queued messages.
+    :param max_message_len: The max length of a posted message, longer batches are split.
+    """
+
+    def __init__(self, backend, coalesce_s: float = 2.0, max_queue: int = 1_000, max_message_len: int = 3_500):
+        """Constructor method
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.backend = backend
+        self.coalesce_s = coalesce_s
+        self.max_message_len = max_message_len
+        self.pid = os.getpid()  # a notifier only works in the process that created it (i.e., not after a fork)
+
+        # stats
+        self.posted = 0  # the messages posted (after coalescing)
+        self.coalesced = 0  # the messages sent that were joined with others
+        self.dropped = 0  # the messages dropped because the queue was full
+        self.failed = 0  # the posts that failed
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="slack-notifier", daemon=True)
+        self._thread.start()
+
+    def send(self, text: str):
+        """Queue a message to be posted (never blocks).
+
+        :param text: The message.
+        """
+        self._put(('message', text))
+
+    def start_digest(self, provider: Callable[[], dict], interval_s: float, title: str = "Progress"):
+        """Post a digest of the values returned by the provider every interval (replacing any earlier digest).
+
+        :param provider: Returns the values of the digest. It is called from the notifier thread.
+        :param interval_s: The interval between two digests. Zero (or less) posts none.
+        :param title: The title of the digests.
+        """
+        if interval_s > 0:
+            self._put(('digest', (provider, interval_s, title)))
+
+    def stop_digest(self):
+        """Stop posting digests.
+        """
+        self._put(('digest', None))
+
+    def close(self, timeout_s: float = TIMEOUT_S):
+        """Post the pending messages and stop the notifier thread.
+
+        :param timeout_s: The max wait for the pending messages to be posted.
+        """
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(('stop', None), timeout=timeout_s)
+        except queue.Full:
+            self.log.warning("Could not stop the slack notifier, its queue is full")
+            return
+        self._thread.join(timeout=timeout_s)
+        if self._thread.is_alive():
+            self.log.warning(f"The slack notifier did not finish posting within {timeout_s} seconds")
+
+    def _put(self, item: Tuple[str, Any]):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1:
+                self.log.warning("The slack queue is full, dropping messages")
+
+    def _post(self, text: str):
+        chunks = [text[i:i + self.max_message_len] for i in range(0, len(text), self.max_message_len)] or [""]
+        for chunk in chunks:
+            try:
+                self.backend.post(chunk)
+                self.posted += 1
+            except Exception as e:  # e.g., a timeout, the notifications must never fail the run
+                self.failed += 1
+                self.log.warning(f"Could not post to slack: {e!r}")
+
+    def _run(self):
+        pending: List[str] = []
+        post_at = None  # when the pending messages are posted
+        digest = None  # (provider, interval_s, title)
+        digest_at = None  # when the next digest is posted
+        stop = False
+        while not stop:
+            deadlines = [t for t in (post_at, digest_at) if t is not None]
+            timeout = max(min(deadlines) - time.monotonic(), 0.0) if deadlines else None
+            try:
+                kind, value = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                kind, value = None, None
+
+            if kind == 'message':
+                if pending:
+                    self.coalesced += 1
+                else:
+                    post_at = time.monotonic() + self.coalesce_s
+                pending.append(value)
+            elif kind == 'digest':
+                digest = value
+                digest_at = None if digest is None else time.monotonic() + digest[1]
+            elif kind == 'stop':
+                stop = True
+
+            now = time.monotonic()
+            if digest is not None and now >= digest_at:
+                provider, interval_s, title = digest
+                try:
+                    pending.append(format_digest(title, provider()))
+                except Exception as e:
+                    self.log.warning(f"Could not take the slack digest: {e!r}")
+                digest_at = now + interval_s
+                post_at = now
+            if pending and (stop or now >= post_at):
+                self._post("\n\n".join(pending))
+                pending = []
+                post_at = None
 
 
 def post_message_to_slack_using_web_hooks(text: str):
@@ -54,27 +298,23 @@ def post_message_to_slack_using_web_hooks(text: str):
     We now use tokens and specific channels instead.
     :param text: The message to be posted.
     """
-    slack_data = {'text': f"*{HOST}:* {text}"}
-    response = requests.post(webhook_url, data=json.dumps(slack_data), headers={'Content-Type': 'application/json'})
-
-    if response.status_code != 200:
-        logger.warning(f'Request to slack returned an error {response.status_code}, the response is:\n{response.text}')
+    try:
+        WebhookBackend().post(text)
+    except Exception as e:
+        logger.warning(f"{e}")
 
 
 def post_message_to_slack(text: str):
     """
-    Post a message to Slack using a token and a channel. The app must bne added to the channel for this method to work.
+    Post a message to Slack using a token and a channel (blocks until it is posted or timed out, see Notifier for
+    posting in the background). The app must bne added to the channel for this method to work.
 
     :param text: The message to be posted.
     """
-    response = requests.post('https://slack.com/api/chat.postMessage',
-                             {'token': slack_token,
-                              'channel': f"#{slack_channel}",
-                              'text': f"*{HOST}:* {text}",
-                              }).json()
-
-    if not bool(response['ok']):
-        logger.warning(f'Request to slack returned an error. {response}')
+    try:
+        WebApiBackend().post(text)
+    except Exception as e:
+        logger.warning(f"{e}")
 
 
 def post_file_to_slack(message: str, file_name: str, content: str, file_type="text"):
@@ -88,14 +328,18 @@ def post_file_to_slack(message: str, file_name: str, content: str, file_type="te
     :param content: The content of the file.
     :param file_type: The file types.
     """
+    import requests
+
+    credentials = _credentials()
     response = requests.post('https://slack.com/api/files.upload',
-                             {'token': slack_token,
+                             {'token': credentials['TOKEN'],
                               'filename': file_name,
-                              'channel': f"#{slack_channel}",
+                              'channel': f"#{credentials['CHANNEL']}",
                               'filetype': file_type,
                               'initial_comment': f"*{HOST}:* {message}"
                               },
-                             files={'file': content}
+                             files={'file': content},
+                             timeout=TIMEOUT_S
                              ).json()
 
     if not bool(response['ok']):
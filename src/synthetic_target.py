@@ -0,0 +1,305 @@
+__author__ = "Ziyad Alsaeed"
+__email__ = "zalsaeed@cs.uoregon.edu"
+__status__ = "Testing"
+
+"""
+A stand-in for the afl-socket server (resources/afl-socket.c) with a synthetic target instead of an instrumented
+application. It speaks the same wire protocol (a targetAppConnect.Payload per execution), thus a search connects to it
+as it does to the real server, and the engine can be exercised (e.g., benchmarked, see benchmarks.end_to_end) without
+Docker or AFL:
+
+    python synthetic_target.py --port 2300 --model depth
+
+The synthetic target "executes" an input by counting the hits of its edges (the perf_bits of afl-socket), given a cost
+model. Every model starts with a lexer pass (an edge per pair of adjacent byte classes, hit once per byte), and adds:
+    - 'length': nothing else, the cost is linear in the input length.
+    - 'depth': a parser that re-scans its open brackets, the cost is quadratic in the nesting depth.
+    - 'repeats': a symbol table with colliding words, the cost is quadratic in the repetitions of a word.
+    - 'constructs': a weight per occurrence of specific grammar constructs (e.g., b'<svg' or b'digraph').
+The cost of an execution is the sum of the hits plus a base cost (the startup of the application). As in afl-socket,
+a normal run (not "wup") updates the max hits of each edge and the coverage, and the answer has:
+    - hnm: True if any edge was hit more times than ever before.
+    - hs: the max hits of a single edge (the hotspot).
+    - hnb: 2 if an edge was never hit before, 1 if the hits of an edge moved to a new AFL count class, 0 otherwise.
+
+As with afl-socket, the state (max hits and coverage) starts fresh with each connection (i.e., each experiment). The
+connections are served each in its own thread.
+"""
+
+import re
+import zlib
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from ctypes import sizeof
+from typing import Dict, List, Optional, Tuple
+
+from executors import FeedbackState
+from targetAppConnect import Payload
+
+COST_MODELS = ['length', 'depth', 'repeats', 'constructs']
+"""The synthetic cost models."""
+
+MAP_SIZE = 1 << 16
+"""The number of edges (as in the AFL bitmap)."""
+
+BASE_COST = 100
+"""The cost of an empty input (the startup of the application)."""
+
+DEFAULT_CONSTRUCTS = {b'<': 4, b'{': 4, b'(': 2, b'[': 2, b'"': 2, b'=': 1}
+"""The weights of the 'constructs' model when none are given (the openings of the grammars of the target apps)."""
+
+_OPENING = b'([{<'
+_CLOSING = b')]}>'
+_WORD = re.compile(rb"[A-Za-z0-9_]+")
+
+# the byte classes of the lexer pass (letters, digits, space, the brackets each on its own, and the rest)
+_BYTE_CLASS = bytes(1 if chr(b).isalpha() else 2 if chr(b).isdigit() else 3 if chr(b).isspace() else
+                    4 + _OPENING.index(b) if b in _OPENING else 8 + _CLOSING.index(b) if b in _CLOSING else
+                    12 + (b & 0x3) for b in range(256))
+
+
+def _edge(*key) -> int:
+    return zlib.crc32(repr(key).encode('ascii')) % MAP_SIZE
+
+
+class CostModel:
+    """The 'length' model, and the base of the other models: a lexer pass over the input, an edge per pair of adjacent
+    byte classes hit once per byte.
+    """
+
+    name = 'length'
+
+    def __init__(self):
+        self._lexer_edges = [[_edge('lex', a, b) for b in range(16)] for a in range(16)]
+
+    def hits(self, text: bytes) -> Dict[int, int]:
+        """
+        :param text: The input.
+        :return: The hits of each edge the execution of the input went through.
+        """
+        perf_bits: Dict[int, int] = {}
+        previous = 0
+        edges = self._lexer_edges
+        for cls in text.translate(_BYTE_CLASS):
+            edge = edges[previous][cls]
+            perf_bits[edge] = perf_bits.get(edge, 0) + 1
+            previous = cls
+        return perf_bits
+
+
+class DepthCostModel(CostModel):
+    """A parser that re-scans the open brackets each time a new one is opened, an edge per depth (the cost of a nesting
+    of depth d is d * (d + 1) / 2).
+    """
+
+    name = 'depth'
+
+    def hits(self, text: bytes) -> Dict[int, int]:
+        perf_bits = super().hits(text)
+        depth = 0
+        for byte in text:
+            if byte in _OPENING:
+                depth += 1
+                edge = _edge('depth', min(depth, 64))
+                perf_bits[edge] = perf_bits.get(edge, 0) + depth
+            elif byte in _CLOSING and depth > 0:
+                depth -= 1
+        return perf_bits
+
+
+class RepeatsCostModel(CostModel):
+    """A symbol table whose words collide, each occurrence of a word walks over all of its earlier occurrences (the cost
+    of a word repeated k times is k * (k - 1) / 2), an edge per bucket of the table.
+
+    :param buckets: The number of buckets of the table.
+    """
+
+    name = 'repeats'
+
+    def __init__(self, buckets: int = 64):
+        super().__init__()
+        self._buckets = [_edge('repeats', i) for i in range(buckets)]
+
+    def hits(self, text: bytes) -> Dict[int, int]:
+        perf_bits = super().hits(text)
+        seen: Dict[bytes, int] = {}
+        for word in _WORD.findall(text):
+            earlier = seen.get(word, 0)
+            seen[word] = earlier + 1
+            if earlier:
+                edge = self._buckets[zlib.crc32(word) % len(self._buckets)]
+                perf_bits[edge] = perf_bits.get(edge, 0) + earlier
+        return perf_bits
+
+
+class ConstructsCostModel(CostModel):
+    """A weight per occurrence of specific grammar constructs, an edge per construct.
+
+    :param constructs: The weight of each construct (a byte string).
+    """
+
+    name = 'constructs'
+
+    def __init__(self, constructs: Optional[Dict[bytes, int]] = None):
+        super().__init__()
+        constructs = DEFAULT_CONSTRUCTS if not constructs else constructs
+        self._constructs: List[Tuple[bytes, int, int]] = [(construct, weight, _edge('construct', construct))
+                                                          for construct, weight in constructs.items()]
+
+    def hits(self, text: bytes) -> Dict[int, int]:
+        perf_bits = super().hits(text)
+        for construct, weight, edge in self._constructs:
+            occurrences = text.count(construct)
+            if occurrences:
+                perf_bits[edge] = perf_bits.get(edge, 0) + occurrences * weight
+        return perf_bits
+
+
+_MODEL_CLASSES = {cls.name: cls for cls in (CostModel, DepthCostModel, RepeatsCostModel, ConstructsCostModel)}
+
+
+def make_cost_model(name: str, constructs: Optional[Dict[bytes, int]] = None) -> CostModel:
+    """
+    :param name: The name of the model (see COST_MODELS).
+    :param constructs: The weights of the 'constructs' model (None takes DEFAULT_CONSTRUCTS).
+    :return: The cost model.
+    """
+    if name not in _MODEL_CLASSES:
+        raise ValueError(f"Unknown cost model '{name}', it must be one of {COST_MODELS}")
+    if name == 'constructs':
+        return ConstructsCostModel(constructs)
+    return _MODEL_CLASSES[name]()
+
+
+class SyntheticTarget:
+    """The synthetic target of one experiment: the cost model and the feedback state afl-socket keeps (the max hits of
+    each edge and the coverage).
+
+    :param model: The cost model.
+    :param base_cost: The cost of an empty input.
+    """
+
+    def __init__(self, model: CostModel, base_cost: int = BASE_COST):
+        """Constructor method
+        """
+        self.model = model
+        self.base_cost = base_cost
+        self.state = FeedbackState()
+        self.executions = 0
+
+    def run(self, text: bytes, run_type: str = "nml") -> Tuple[int, int, bool, int]:
+        """Execute an input (see InputHandler.run_input).
+
+        :param text: The input.
+        :param run_type: "wup" (warmup) leaves the max hits and the coverage as they are.
+        :return: A tuple of (total-execution-cost: int, hnb: int, hnm: bool, hotspot: int).
+        """
+        self.executions += 1
+        cost, hnb, hnm, hs = self.state.update(self.model.hits(text), run_type)
+        return self.base_cost + cost, hnb, hnm, hs
+
+
+class _PayloadHandler(socketserver.BaseRequestHandler):
+    # a connection (experiment) with its own synthetic target state
+
+    def handle(self):
+        target = SyntheticTarget(self.server.model, base_cost=self.server.base_cost)
+        size = sizeof(Payload)
+        buffer = bytearray()
+        while True:
+            data = self.request.recv(size - len(buffer))
+            if not data:
+                break
+            buffer += data
+            if len(buffer) < size:
+                continue
+            payload = Payload.from_buffer_copy(buffer)
+            buffer.clear()
+            # the input is read as a C string (up to the first NUL), as in afl-socket
+            cost, hnb, hnm, hs = target.run(payload.input, payload.run_type.decode('ascii', 'replace'))
+            payload.exec_cost, payload.hnb, payload.hnm, payload.hs = cost, hnb, hnm, hs
+            self.request.sendall(bytes(payload))
+        self.server.log.info(f"Connection from {self.client_address} closed after {target.executions:,} executions")
+
+
+class SyntheticTargetServer(socketserver.ThreadingTCPServer):
+    """The synthetic target served over the afl-socket wire protocol.
+
+    :param model: The cost model (shared by the connections, the models are stateless).
+    :param host: The host to listen on.
+    :param port: The port to listen on. Zero takes a free port (see port).
+    :param base_cost: The cost of an empty input.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, model: CostModel, host: str = 'localhost', port: int = 2300, base_cost: int = BASE_COST):
+        """Constructor method
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.model = model
+        self.base_cost = base_cost
+        super().__init__((host, port), _PayloadHandler)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """
+        :return: The port the server listens to.
+        """
+        return self.server_address[1]
+
+    def start(self) -> "SyntheticTargetServer":
+        """Serve in a background thread (e.g., within a test or a benchmark).
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="synthetic-target", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket.
+        """
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def parse_constructs(values: List[str]) -> Dict[bytes, int]:
+    """
+    :param values: The constructs as "CONSTRUCT=WEIGHT" (or just "CONSTRUCT" for a weight of 1).
+    :return: The weight of each construct.
+    """
+    constructs = {}
+    for value in values:
+        construct, _, weight = value.rpartition('=') if '=' in value[1:] else (value, '', '1')
+        constructs[construct.encode('utf-8')] = int(weight)
+    return constructs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a synthetic target over the afl-socket wire protocol.")
+    parser.add_argument("--host", type=str, default="localhost", help="The host to listen on.")
+    parser.add_argument("--port", type=int, default=2300, help="The port to listen on (0 takes a free port).")
+    parser.add_argument("--model", type=str, default="depth", choices=COST_MODELS, help="The synthetic cost model.")
+    parser.add_argument("--construct", type=str, action="append", default=[],
+                        help="A construct of the 'constructs' model as CONSTRUCT=WEIGHT (can be repeated).")
+    parser.add_argument("--base-cost", type=int, default=BASE_COST, help="The cost of an empty input.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    server = SyntheticTargetServer(make_cost_model(args.model, parse_constructs(args.construct)), host=args.host,
+                                   port=args.port, base_cost=args.base_cost)
+    print(f"Serving the '{args.model}' synthetic target on {args.host}:{server.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
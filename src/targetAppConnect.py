@@ -25,17 +25,21 @@ class Payload(Structure):
 
 class InputHandler:
 
-    def __init__(self):
+    def __init__(self, host: str = 'localhost', port: int = 2300):
         self.logger = logging.getLogger(self.__class__.__name__)
-        self._server = InputHandler.server_connect()
+        self.host = host
+        self.port = port
+        self._server = InputHandler.server_connect(host, port)
 
     @staticmethod
-    def server_connect():
+    def server_connect(host: str = 'localhost', port: int = 2300):
         """
         Setting up the client connection to the C app server.
+        :param host: The host of the server.
+        :param port: The port the server listens to.
         :return: socket
         """
-        server_address = ('localhost', 2300)
+        server_address = (host, port)
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 8192)
         # s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8192)
@@ -59,18 +63,20 @@ class InputHandler:
         """
         Run target application and log interactions.
 
-        :param test_case: The input to run on the target application.
+        :Note: The server reads the input as a C string, thus the input is truncated at its first NUL byte.
+
+        :param test_case: The input to run on the target application (a str is encoded as utf-8).
         :param run_type: The run type "***": would lead to changing the max_count on AFL side, "wup": will skip that.
         :return: A tuple of (total-execution-cost: int, hnb: int, hnm: bool, hotspot: int).
         """
 
+        if isinstance(test_case, str):
+            test_case = test_case.encode('utf_8')
+
         if len(test_case) > _MAX_INPUT_SIZE:
             raise RuntimeError(f"Got input with size ({len(test_case)}) larger than the allowed limit "
                                f"({_MAX_INPUT_SIZE})")
 
-        if isinstance(test_case, str):
-            test_case = test_case.encode('utf_8')
-
         payload_out = Payload(0,  # exec_cost
                               False,  # hnm
                               0,  # hs
@@ -79,16 +85,20 @@ class InputHandler:
                               test_case  # input (must be sent as a stream of bytes)
                               )
         # sending input to instrumentor to run on target app and collect cost
-        self.logger.debug(f"Sending: input={payload_out.input}, run-type={payload_out.run_type}, "
-                          f"execution_cost={payload_out.exec_cost}, hnb={payload_out.hnb}, hnm={payload_out.hnm}, "
-                          f"hs={payload_out.hs}")
+        log_debug = self.logger.isEnabledFor(logging.DEBUG)
+        if log_debug:
+            self.logger.debug(f"Sending: input={payload_out.input}, run-type={payload_out.run_type}, "
+                              f"execution_cost={payload_out.exec_cost}, hnb={payload_out.hnb}, "
+                              f"hnm={payload_out.hnm}, hs={payload_out.hs}")
         nsent = self._server.send(payload_out)
-        self.logger.debug("Sent %d bytes" % nsent)
+        if log_debug:
+            self.logger.debug("Sent %d bytes", nsent)
         buff = self._server.recv(sizeof(Payload))
         payload_in = Payload.from_buffer_copy(buff)
-        self.logger.debug(f"Received: input={payload_in.input}, run-type={payload_in.run_type}, "
-                          f"execution_cost={payload_in.exec_cost}, hnb={payload_in.hnb}, hnm={payload_in.hnm}, "
-                          f"hs={payload_in.hs}")
+        if log_debug:
+            self.logger.debug(f"Received: input={payload_in.input}, run-type={payload_in.run_type}, "
+                              f"execution_cost={payload_in.exec_cost}, hnb={payload_in.hnb}, hnm={payload_in.hnm}, "
+                              f"hs={payload_in.hs}")
         return payload_in.exec_cost, payload_in.hnb, payload_in.hnm, payload_in.hs
 
     def close_connection(self):
@@ -100,5 +110,5 @@ class InputHandler:
         if self._server is not None:
             print("Socket already open!")
         else:
-            self._server = InputHandler.server_connect()
+            self._server = InputHandler.server_connect(self.host, self.port)
             print("\nSocket Open")
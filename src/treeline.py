@@ -3,22 +3,544 @@ __email__ = "zalsaeed@cs.uoregon.edu"
 __status__ = "Testing"
 
 import os
-import csv
+import queue
+import codecs
+import logging.handlers
 import platform
+import statistics
 import argparse
+import traceback
+import multiprocessing
+import multiprocessing.util
+import concurrent.futures
 from itertools import product
 from datetime import datetime
-
-import psutil
-import graphviz
+from typing import Dict, List, Optional, Tuple
 
 import slack
+import replay
+import executors
 import helpers as helper
 import configuration_loader
-import mcts.mcts_globals as mg  # MCTS globals
-from pygramm.llparse import *
-from pygramm.grammar import FactorEmpty
+from mcts import bias_store
+from mcts import grammar_cache
 from mcts.mcts import MonteCarloTreeSearch
+from mcts.search_context import SearchContext
+
+CHECKPOINT_FILE_NAME = "checkpoint.pkl"
+"""The checkpoint of a search within its output directory (to continue it with a longer duration, e.g., by a sweep)."""
+
+SWEEP_METRICS = ['max_cost', 'auc']
+"""How the experiments of a sweep are ranked: by the max cost observed or the area under the max cost over time."""
+
+logging_format = logging.Formatter('%(asctime)s: %(levelname)s [%(name)s:%(funcName)s:%(lineno)d] - %(message)s')
+
+_grid_slots: Optional[multiprocessing.Queue] = None  # the free (index, port) slots of experiments (set in each worker)
+_notifier: Optional[slack.Notifier] = None  # the slack notifier of this process (see slack_notifier)
+
+
+def slack_notifier(grid: dict) -> Optional[slack.Notifier]:
+    """The slack notifier of this process (the main one or a grid worker), created on first use. The pending messages
+    are posted when the process exits.
+
+    :param grid: The settings shared by all the experiments of the grid.
+    :return: The notifier, or None if the experiments are not reported to slack.
+    """
+    global _notifier
+    if not grid['slack']:
+        return None
+    if _notifier is None or _notifier.pid != os.getpid():  # a forked worker can't use the thread of its parent
+        immutable_params = grid['immutable_params']
+        backend = slack.make_backend(immutable_params['slack_backend'], url=immutable_params['slack_url'],
+                                     timeout_s=immutable_params['slack_timeout_s'])
+        _notifier = slack.Notifier(backend, coalesce_s=immutable_params['slack_coalesce_s'])
+        multiprocessing.util.Finalize(_notifier, _notifier.close, exitpriority=10)
+    return _notifier
+
+
+def make_executor(grid: dict, port: int) -> executors.Executor:
+    """The executor of an experiment given the executor backend of the grid (see executors).
+
+    :param grid: The settings shared by all the experiments of the grid.
+    :param port: The port of the target server (only used by the 'socket' backend).
+    :return: The executor (connected).
+    """
+    immutable_params = grid['immutable_params']
+    return executors.make_executor(immutable_params['executor_backend'], host=grid['fuzz_server'], port=port,
+                                   target=immutable_params['showmax_target'],
+                                   workers=immutable_params['showmax_workers'])
+
+
+def run_experiment(grid: dict, combination: tuple, combination_id: int, repetition: int,
+                   input_handler: Optional[executors.Executor] = None, port: int = 2300,
+                   duration: Optional[Tuple[float, int]] = None, resume_dir: Optional[str] = None,
+                   checkpoint: bool = False) -> Optional[str]:
+    """Run a single experiment of the grid (a combination of the mutable parameters) and record its results.
+
+    :param grid: The settings shared by all the experiments of the grid (see the main block).
+    :param combination: The values of the mutable parameters (in the order of mutable_param).
+    :param combination_id: The number of the combination (starting from 1).
+    :param repetition: The repetition of the combination (starting from 0).
+    :param input_handler: The executor of this experiment (see make_executor). None connects to the fuzz server at the
+        given port.
+    :param port: The port of the target server (recorded in the experiment configurations).
+    :param duration: The (time cap in seconds, number of iterations) the search runs for instead of the ones of the
+        combination (e.g., a rung of a sweep). Both count the earlier runs of a resumed search.
+    :param resume_dir: The output directory of an earlier run of the experiment to continue from its checkpoint.
+    :param checkpoint: If True, save a checkpoint of the search in the output directory to be resumed later.
+    :return: The output directory of the experiment, or None if the experiment was skipped.
+    """
+    c, e, budget, is_time_based, time_cap_in_s, num_iter, reward_type, gram_used, alg, \
+        locking, bias, max_reward, tail_len, max_cutting_threshold, threshold_decay_rate = combination
+    immutable_params = grid['immutable_params']
+    root_output_dir = grid['root_output_dir']
+    search_time_cap_in_s, search_num_iter = (time_cap_in_s, num_iter) if duration is None else duration
+
+    time_cap_in_h = time_cap_in_s / 3600
+    gram_base_file_name = os.path.basename(gram_used)
+    date = datetime.now().date().strftime("%m/%d/%Y")
+    time = datetime.now().time().strftime("%H:%M:%S")
+    print("====================================================")
+    exper_info = f"Experiment Info:\n ```\ngram={gram_base_file_name}, algorithm={alg}, c={c}, e={e}, " \
+                 f"locking={locking}, bias={bias}, budget={budget}, reward-type={reward_type}, " \
+                 f"reward-max={max_reward}, " \
+                 f"tail-len={tail_len}, max-cutting-threshold={max_cutting_threshold}," \
+                 f"threshold-decay-rate={threshold_decay_rate:f}, time-based?={is_time_based}, " \
+                 f"time-cap-h={time_cap_in_h} iter={num_iter}\n```"
+    run_seq = f"This is combination {combination_id} of {grid['number_of_experiments']}. And this is run " \
+              f"{repetition+1} of {immutable_params['number_of_repetitions']}."
+    print(exper_info)
+    print(run_seq)
+    print("====================================================")
+    notifier = slack_notifier(grid)
+    if notifier is not None:
+        notifier.send(f"New Experiment [date: {date}, time: {time}]")
+        notifier.send(run_seq)
+        notifier.send(exper_info)
+
+    # the search parameters of this experiment (instead of the MCTS globals, so experiments can run side by side)
+    # the repetitions of a seeded combination are seeded differently (seed + repetition)
+    seed = None if immutable_params['seed'] is None else immutable_params['seed'] + repetition
+
+    # a replay answers the inputs from a recorded run instead of the target server
+    replay_executor = replay.open_replay(immutable_params['replay_executions'], model=immutable_params['replay_model'])
+    context = SearchContext(c=c, e=e, literal_encoding=codecs.lookup(immutable_params['literal_encoding']).name,
+                            input_handler=input_handler if replay_executor is None else replay_executor)
+    context.connect(host=grid['fuzz_server'], port=port)
+
+    # if one is given prep for file name
+    expr_desc_with_id = "" if immutable_params['expr_desc'] == "" else f"desc:{immutable_params['expr_desc']}-"
+    duration_info = f"time_based(h={time_cap_in_h})" if is_time_based else f"iter_based(iter={num_iter})"
+    bias_ind = 'T' if bias else "F"
+    locking_ind = 'T' if locking else "F"
+    expr_identifier = f"app:{immutable_params['app_name']}-{expr_desc_with_id}alg:{alg}-" \
+                      f"gram:{gram_base_file_name.replace('-', '_')}-c:{c}-e:{e}-" \
+                      f"BDG:{budget}-rType:{reward_type}-rMax:{max_reward}-bias:{bias_ind}-" \
+                      f"tail:{tail_len}-unqMax:{max_cutting_threshold}-unqGrwRate:{threshold_decay_rate:f}-" \
+                      f"lock:{locking_ind}-DUR:{duration_info}-" \
+                      f"date:{date.replace('/', '')}-time:{time.replace(':','')}"
+    output_dir = os.path.join(root_output_dir, expr_identifier)
+    if resume_dir is not None:
+        output_dir = resume_dir.rstrip("/")
+        expr_identifier = os.path.basename(output_dir)
+    else:
+        try:
+            os.makedirs(output_dir)
+        except FileExistsError:  # repetitions of a combination started within the same second (by grid workers)
+            expr_identifier += f"-rep:{repetition+1}"
+            output_dir = os.path.join(root_output_dir, expr_identifier)
+            os.makedirs(output_dir)
+    checkpoint_file = os.path.join(output_dir, CHECKPOINT_FILE_NAME)
+
+    # record the answers of the target server to replay this experiment offline (see replay)
+    recorder = None
+    if immutable_params['record_executions']:
+        recorder = replay.RecordingExecutor(context.input_handler, os.path.join(output_dir, replay.RECORDING_FILE_NAME),
+                                            append=resume_dir is not None)
+        context.input_handler = recorder
+
+    # make sure all handlers are removed
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    if immutable_params['log_to_file']:
+        # File logging:
+        h = logging.FileHandler(f'{output_dir}/traces.log')
+    else:
+        # Stream logging:
+        h = logging.StreamHandler()
+    h.setFormatter(logging_format)
+    log_listener = None
+    if immutable_params['async_logging']:
+        # the search only puts the records in a queue, the listener thread does the writing.
+        log_queue = queue.SimpleQueue()
+        log_listener = logging.handlers.QueueListener(log_queue, h)
+        log_listener.start()
+        logging.root.addHandler(logging.handlers.QueueHandler(log_queue))
+    else:
+        logging.root.addHandler(h)
+
+    try:
+        # build grammar (parsed and transformed only once per grammar content, see grammar_cache)
+        gram, gram_dump = grammar_cache.load_grammar(gram_used, cache_dir=grid['grammar_cache_dir'],
+                                                     len_based_size=True)
+
+        # print gram info after parsing and adjusting costs
+        with open(f"{output_dir}/gram-with-cost.txt", "w") as file:
+            file.write(gram_dump)
+
+        # start from the bias learned by earlier runs on the same grammar (if any)
+        initial_bias = None
+        bias_snapshot = None
+        bias_base = None
+        if immutable_params['bias_snapshot_dir'] and resume_dir is None:
+            os.makedirs(immutable_params['bias_snapshot_dir'], exist_ok=True)
+            bias_snapshot = os.path.join(immutable_params['bias_snapshot_dir'],
+                                         bias_store.snapshot_file_name(gram))
+            bias_base = bias_store.snapshot_created(bias_snapshot)
+            initial_bias = bias_store.load_bias(gram, bias_snapshot, decay=immutable_params['bias_decay'])
+            if initial_bias is not None:
+                print(f"Starting from the bias snapshot '{bias_snapshot}'")
+
+        mcts = MonteCarloTreeSearch(gram=gram,
+                                    output_dir=output_dir + "/",
+                                    expr_id=expr_identifier,
+                                    budget=budget,
+                                    reward_type=reward_type,
+                                    use_locking=locking,
+                                    use_bias=bias,
+                                    tail_len=tail_len,
+                                    max_threshold=max_cutting_threshold,
+                                    threshold_decay=threshold_decay_rate,
+                                    surrogate_candidates=immutable_params['surrogate_candidates'],
+                                    surrogate_exploration=immutable_params['surrogate_exploration'],
+                                    bias=initial_bias,
+                                    profile_phases=immutable_params['profile_phases'],
+                                    profiler_sampler=immutable_params['profiler'],
+                                    profiler_interval_ms=immutable_params['profiler_interval_ms'],
+                                    metrics_port=immutable_params['metrics_port'],
+                                    metrics_snapshot_interval_s=immutable_params['metrics_snapshot_interval_s'],
+                                    progress_bar_hz=immutable_params['progress_bar_hz'],
+                                    trace_memory=immutable_params['trace_memory'],
+                                    exec_trace=immutable_params['exec_trace'],
+                                    progress_sampling=immutable_params['progress_sampling'],
+                                    progress_every_n=immutable_params['progress_every_n'],
+                                    progress_chunk_rows=immutable_params['progress_chunk_rows'],
+                                    corpus_format=immutable_params['corpus_format'],
+                                    tree_export_top_k=immutable_params['tree_export_top_k'],
+                                    tree_export_max_depth=immutable_params['tree_export_max_depth'],
+                                    tree_export_min_visits=immutable_params['tree_export_min_visits'],
+                                    tree_export_best_path_only=immutable_params['tree_export_best_path_only'],
+                                    seed=seed,
+                                    context=context)
+
+        if not mcts.dry_run():  # skip any experiment we cannot warmup for within allowed time.
+            return None
+
+        if resume_dir is not None:
+            # continue the search where the earlier run stopped
+            mcts.load_checkpoint(checkpoint_file)
+            print(f"Resuming the search after {mcts.exec_count} executions ({mcts.search_ms / 60_000:.1f} minutes)")
+        elif immutable_params['seed_inputs'] and alg == 'treeline':
+            # bootstrap the tree from the existing corpus (if any) to skip the cold start
+            mcts.seed(immutable_params['seed_inputs'])
+
+        # post a digest of the live metrics every interval while the search runs (if reported to slack)
+        if notifier is not None:
+            notifier.start_digest(lambda: {name: value for name, value in mcts.metrics.snapshot().items()
+                                           if name not in ('search', 'time')},
+                                  immutable_params['slack_digest_interval_s'],
+                                  title=f"Progress of combination {combination_id} run {repetition+1}")
+
+        # use the specified algorithm to do the search
+        if alg == 'treeline':
+            mcts.treeline(is_time_based, time_cap_h=search_time_cap_in_s / 3600, num_iter=search_num_iter)
+        elif alg == 'random':
+            # the additional executors of the pipeline (if any) have the backend (and recording) of the experiment
+            extra_handlers = []
+            if immutable_params['generator_workers'] > 0:
+                for extra_port in immutable_params['executor_ports']:
+                    executor = make_executor(grid, extra_port)
+                    extra_handlers.append(executor if recorder is None else recorder.share(executor))
+            mcts.random_search(is_time_based, time_cap_h=search_time_cap_in_s / 3600, num_iter=search_num_iter,
+                               num_generators=immutable_params['generator_workers'], extra_handlers=extra_handlers)
+        else:
+            raise RuntimeError(f"Unknown algorithm {alg}")
+
+        if checkpoint:
+            print("Saving a checkpoint of the search ...")
+            mcts.save_checkpoint(checkpoint_file)
+
+        # keep the learned bias for the next runs on the same grammar
+        if bias_snapshot is not None:
+            mcts.save_bias(bias_snapshot, shared=True, base=bias_base)
+
+        # run a simulation of the best path
+        if immutable_params['sim']:
+            mcts.simulate()
+
+        # save the tree as binary
+        if immutable_params['save_tree_as_binary']:
+            print("Saving tree as binary ...")
+            mcts.save_tree()
+
+        # print the tree to file
+        if immutable_params['write_tree_to_file_as_text']:
+            print("Saving tree as text ...")
+            with open(f"{output_dir}/Tree.txt", "w") as tree_file:
+                mcts.write_tree_as_text(tree_file)
+
+        if immutable_params['generate_tree_vis']:
+            print("Rendering the tree based on dot file ...")
+            import graphviz
+            g = graphviz.Source(helper.tree_to_dot(mcts.root, mcts.tree_export_options))
+            g.render(filename=f"{output_dir}/TreeVis", format="pdf", cleanup=True)
+
+        # getting dict report and adding high-level info (e.g. date, gram file, etc).
+        report = mcts.get_report()
+        report['Period: Run date-time'] = str(date) + "-" + str(time)
+        report['Config: grammar file'] = str(gram_base_file_name)
+        report['Env: available mem'] = str(grid['available_mem'])
+        report['Env: cpu cores'] = str(grid['cpu_cores'])
+        report['Env: os'] = str(grid['hosting_os'])
+        report['Config: Target App'] = immutable_params['app_name']
+        report['Config: Expr Description'] = immutable_params['expr_desc']
+        report['Config: Search Algorithm'] = alg
+        report['Config: Executor Backend'] = immutable_params['executor_backend']
+        if replay_executor is not None:
+            report['Replay: # replayed executions'] = str(replay_executor.replayed)
+            report['Replay: # repeated executions'] = str(replay_executor.repeated)
+            report['Replay: # unseen executions'] = str(replay_executor.unseen)
+            report['Replay: Fingerprint'] = replay_executor.fingerprint()
+
+        # logging high-level info for this experiment in the target app file
+        print("Logging high-level info of this target app ...")
+        print(f"Max cost observed: {report['Results: Max Observed Cost']}")
+        helper.append_experiment_info(f"{root_output_dir}/experiments-info-{immutable_params['app_name']}.csv", report)
+
+        # write final stats to file
+        print("Write high-level stats to file ...")
+        with open(f"{output_dir}/config-and-stats-report.txt", "w") as report_file:
+            stats_summery = helper.beautify_final_report(report)
+            report_file.write(stats_summery)
+
+        # merge the configurations The server options (not in use yet) | immutable option | mutable options based
+        # on this run.
+        exper_configurations = dict(FUZZ_SERVER=grid['fuzz_server'], FUZZ_PORT=port) | immutable_params | dict(
+            log_level=grid['log_level'],
+            c=[c],  # exploration
+            e=[e],  # visits before expansion
+            budget=[budget],  # budget allowed for an input
+            is_time_based=[is_time_based],  # are running based on time or iterations?
+            time_cap_in_h=[time_cap_in_s],  # if based on time, how long in hours are we allowed to run?
+            num_iter=[num_iter],  # if based on iterations, what is the number of search iteration planned?
+            reward_type=[reward_type],  # the reward strategy
+            grams=[gram_used],
+            algorithm=alg,  # The search algorithm to use
+            use_locking=[locking],
+            use_bias=[bias],
+            max_reward=[max_reward],
+            tail_len=[tail_len],
+            max_cutting_threshold=[max_cutting_threshold],
+            threshold_decay_rate=[threshold_decay_rate],
+            seed=seed,
+        )
+
+        # save configurations to file for re-run
+        configuration_loader.Settings.dump_yaml_from_dict(exper_configurations, f"{output_dir}/configurations.yaml")
+
+        if notifier is not None:
+            notifier.send(f"Experiment Ended (it started at {date}, {time}). "
+                          f"Here are some stats:\n\n```\n{stats_summery}\n```\n")
+
+        mcts.close_connection()
+
+        # make sure the logging level is set-back to whatever the user chose for the next run
+        # FIXME, where did we change the log level to need this?
+        logging.root.setLevel(grid['log_level'])
+        return output_dir
+    finally:
+        if notifier is not None:
+            notifier.stop_digest()
+        if recorder is not None:
+            recorder.close()
+        # write any queued records and release this experiment log file
+        if log_listener is not None:
+            log_listener.stop()
+        h.close()
+
+
+def _init_grid_worker(slots: multiprocessing.Queue):
+    global _grid_slots
+    _grid_slots = slots
+
+
+def _run_grid_job(grid: dict, combination: tuple, combination_id: int, repetition: int,
+                  options: dict) -> Tuple[int, int, Optional[str], Optional[str]]:
+    """The body of a grid worker. Take a free executor slot from the pool (e.g., the port of a target server), run the
+    experiment on an executor of that slot, and give the slot back.
+
+    :param grid: The settings shared by all the experiments of the grid.
+    :param combination: The values of the mutable parameters.
+    :param combination_id: The number of the combination (starting from 1).
+    :param repetition: The repetition of the combination (starting from 0).
+    :param options: The optional arguments of run_experiment (e.g., the duration of a sweep rung).
+    :return: A tuple of (combination id, repetition, output dir or None, error or None).
+    """
+    index, port = _grid_slots.get()
+    try:
+        input_handler = make_executor(grid, port)
+        if not input_handler.is_connected():
+            return combination_id, repetition, None, f"No connection to the target server at port {port}"
+        immutable_params = grid['immutable_params']
+        if immutable_params['metrics_port'] > 0:  # each worker serves its metrics at its own port
+            immutable_params = immutable_params | dict(metrics_port=immutable_params['metrics_port'] + index)
+        try:
+            output_dir = run_experiment(grid | dict(immutable_params=immutable_params), combination, combination_id,
+                                        repetition, input_handler=input_handler, port=port, **options)
+        finally:
+            if input_handler.is_connected():
+                input_handler.close_connection()
+        return combination_id, repetition, output_dir, None
+    except Exception:
+        return combination_id, repetition, None, traceback.format_exc()
+    finally:
+        _grid_slots.put((index, port))
+
+
+def run_experiments(grid: dict, jobs: List[Tuple[tuple, int, int, dict]]) \
+        -> List[Tuple[int, int, Optional[str], Optional[str]]]:
+    """Run the given experiments, one after another or (with two or more grid ports, or showmax grid workers) as many
+    at once as there are target servers (or workers).
+
+    :param grid: The settings shared by all the experiments.
+    :param jobs: The experiments as (combination, combination id, repetition, optional arguments of run_experiment).
+    :return: A tuple of (combination id, repetition, output dir or None, error or None) per experiment, in the order
+        they finished. Without the workers, an error is raised right away.
+    """
+    grid_ports = grid['grid_ports']
+    immutable_params = grid['immutable_params']
+    is_replay = bool(immutable_params['replay_executions'])  # no target server
+    port = grid_ports[0] if grid_ports else grid['fuzz_port']
+    if immutable_params['executor_backend'] == 'showmax':  # no target server, each worker runs its own afl-showmax
+        slots = [(index, port) for index in range(immutable_params['showmax_grid_workers'])]
+    else:
+        slots = list(enumerate(grid_ports))
+    results = []
+    if len(slots) > 1 and not is_replay:
+        # each worker process owns a slot (i.e., a target server or a showmax pool) at a time.
+        if immutable_params['executor_backend'] == 'showmax':
+            print(f"Running {len(jobs)} experiment(s) on {len(slots)} afl-showmax workers ...")
+        else:
+            print(f"Running {len(jobs)} experiment(s) on {len(slots)} target servers (ports: {grid_ports}) ...")
+        grid = grid | dict(immutable_params=immutable_params | dict(progress_bar_hz=0))  # don't overdraw
+        free_slots = multiprocessing.Queue()
+        for slot in slots:
+            free_slots.put(slot)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(slots),
+                                                    mp_context=multiprocessing.get_context('fork'),
+                                                    initializer=_init_grid_worker, initargs=(free_slots,)) as pool:
+            futures = [pool.submit(_run_grid_job, grid, *job) for job in jobs]
+            for future in concurrent.futures.as_completed(futures):
+                combination_id, r, output_dir, error = future.result()
+                if error is not None:
+                    print(f"Combination {combination_id} run {r+1} failed:\n{error}")
+                else:
+                    print(f"Combination {combination_id} run {r+1} is done ({output_dir})")
+                results.append((combination_id, r, output_dir, error))
+    else:
+        # a single executor (reopened by each search) for all the experiments
+        input_handler = None if is_replay else make_executor(grid, port)
+        try:
+            for combination, combination_id, r, options in jobs:
+                output_dir = run_experiment(grid, combination, combination_id, r, input_handler=input_handler,
+                                            port=port, **options)
+                results.append((combination_id, r, output_dir, None))
+        finally:
+            if input_handler is not None and input_handler.is_connected():
+                input_handler.close_connection()
+    return results
+
+
+def _sweep_scores(root_output_dir: str, output_dirs: Dict[Tuple[int, int], str], metric: str) \
+        -> Dict[Tuple[int, int], float]:
+    """Score the experiments of a sweep from what they saved so far (see analysis.engine).
+
+    :param root_output_dir: The root of all the experiments.
+    :param output_dirs: The output directory of each experiment by (combination id, repetition).
+    :param metric: 'max_cost' (the max cost observed) or 'auc' (the area under the max cost over time curve).
+    :return: The score of each experiment by (combination id, repetition). Higher is better.
+    """
+    import numpy as np
+    from analysis.engine import ResultsIndex
+
+    results = ResultsIndex(root_output_dir)
+    if metric == 'auc':
+        # a common time grid up to the last input saved by any experiment, so the areas are comparable
+        end_s = max(float(results.inputs['dur'].max()) / 1_000 if len(results.inputs) else 0.0, 1.0)
+        values = results.auc(np.linspace(0, end_s, 101))
+    else:
+        values = results.final_stats()['max_cost'].to_numpy()
+    by_name = dict(zip(results.experiments['name'], values))
+    return {key: float(by_name.get(os.path.basename(output_dir), 0.0)) for key, output_dir in output_dirs.items()}
+
+
+def run_sweep(grid: dict, jobs: List[Tuple[tuple, int, int]], rungs: int, eta: int, metric: str):
+    """An adaptive sweep of the grid by successive halving. All the combinations start with a short duration (their
+    time cap or number of iterations divided by eta^(rungs-1)). After each rung, the combinations are ranked by the
+    metric (the mean over their repetitions) and only the top 1/eta of them are promoted to the next rung, where the
+    duration is eta times longer. A promoted experiment resumes its search from its checkpoint, thus it continues the
+    same tree (and inputs) rather than starting over. The last rung runs the full duration of the combinations.
+
+    The scores and promotions of each rung are appended to sweep-<app>.csv in the root output directory.
+
+    :param grid: The settings shared by all the experiments.
+    :param jobs: The experiments as (combination, combination id, repetition).
+    :param rungs: The number of rungs.
+    :param eta: The promotion rate (the top 1/eta is promoted) and the duration growth between two rungs.
+    :param metric: The ranking metric, 'max_cost' or 'auc' (see _sweep_scores).
+    """
+    sweep_file = os.path.join(grid['root_output_dir'], f"sweep-{grid['immutable_params']['app_name']}.csv")
+    alive = list(jobs)
+    output_dirs: Dict[Tuple[int, int], str] = {}
+    for rung in range(rungs):
+        scale = eta ** (rungs - 1 - rung)
+        print(f"Sweep rung {rung+1} of {rungs}: {len(alive)} experiment(s) with 1/{scale} of their duration ...")
+        rung_jobs = []
+        for combination, combination_id, r in alive:
+            time_cap_in_s, num_iter = combination[4], combination[5]
+            rung_jobs.append((combination, combination_id, r,
+                              dict(duration=(time_cap_in_s / scale, max(num_iter // scale, 1)),
+                                   resume_dir=output_dirs.get((combination_id, r)), checkpoint=rung < rungs - 1)))
+        finished = set()
+        for combination_id, r, output_dir, error in run_experiments(grid, rung_jobs):
+            if output_dir is not None:
+                output_dirs[(combination_id, r)] = output_dir
+                finished.add((combination_id, r))
+
+        # rank the combinations by the mean score of their finished repetitions
+        scores = _sweep_scores(grid['root_output_dir'], {key: output_dirs[key] for key in finished}, metric)
+        combination_scores: Dict[int, List[float]] = {}
+        for (combination_id, r), score in scores.items():
+            combination_scores.setdefault(combination_id, []).append(score)
+        ranking = sorted(combination_scores, key=lambda cid: statistics.fmean(combination_scores[cid]), reverse=True)
+        promoted = set(ranking[:max(len(ranking) // eta, 1)]) if rung < rungs - 1 else set()
+
+        for combination, combination_id, r in alive:
+            if (combination_id, r) not in finished:
+                continue
+            helper.append_experiment_info(sweep_file, {
+                'rung': rung + 1, 'combination': combination_id, 'run': r + 1,
+                'time_cap_s': combination[4] / scale, 'num_iter': max(combination[5] // scale, 1),
+                'metric': metric, 'score': scores[(combination_id, r)],
+                'promoted': combination_id in promoted,
+                'experiment': os.path.basename(output_dirs[(combination_id, r)])})
+        print(f"Sweep rung {rung+1} ranking by {metric} (combination: mean score): " +
+              ", ".join(f"{cid}: {statistics.fmean(combination_scores[cid]):,.1f}" for cid in ranking))
+        alive = [job for job in alive if job[1] in promoted and (job[1], job[2]) in finished]
+
+    if ranking:
+        print(f"The sweep is done, the best combination is {ranking[0]} (see {sweep_file})")
 
 
 if __name__ == "__main__":
@@ -51,7 +573,6 @@ if __name__ == "__main__":
     for handler in logging.root.handlers[:]:  # make sure all handlers are removed
         logging.root.removeHandler(handler)
     logging.root.setLevel(log_level[settings["log_level"]])
-    logging_format = logging.Formatter('%(asctime)s: %(levelname)s [%(name)s:%(funcName)s:%(lineno)d] - %(message)s')
 
     # the run settings that are permutable
     mutable_param = dict(
@@ -83,195 +604,94 @@ if __name__ == "__main__":
         tree=settings['tree'],
         report=settings['report'],
         log_to_file=settings["log_to_file"],
+        surrogate_candidates=settings.get("surrogate_candidates", 1),
+        surrogate_exploration=settings.get("surrogate_exploration", 0.2),
+        seed_inputs=settings.get("seed_inputs", []),
+        bias_snapshot_dir=settings.get("bias_snapshot_dir", ""),
+        bias_decay=settings.get("bias_decay", 0.0),
+        generator_workers=settings.get("generator_workers", 0),
+        executor_ports=settings.get("executor_ports", []),
+        literal_encoding=settings.get("literal_encoding", "utf-8"),
+        profile_phases=settings.get("profile_phases", True),
+        profiler=settings.get("profiler", "none"),
+        profiler_interval_ms=settings.get("profiler_interval_ms", 5.0),
+        metrics_port=settings.get("metrics_port", 0),
+        metrics_snapshot_interval_s=settings.get("metrics_snapshot_interval_s", 0),
+        progress_bar_hz=settings.get("progress_bar_hz", 4),
+        trace_memory=settings.get("trace_memory", False),
+        async_logging=settings.get("async_logging", True),
+        exec_trace=settings.get("exec_trace", "none"),
+        progress_sampling=settings.get("progress_sampling", "all"),
+        progress_every_n=settings.get("progress_every_n", 100),
+        progress_chunk_rows=settings.get("progress_chunk_rows", 1024),
+        corpus_format=settings.get("corpus_format", "files"),
+        tree_export_top_k=settings.get("tree_export_top_k", 0),
+        tree_export_max_depth=settings.get("tree_export_max_depth", -1),
+        tree_export_min_visits=settings.get("tree_export_min_visits", 0),
+        tree_export_best_path_only=settings.get("tree_export_best_path_only", False),
+        grid_ports=settings.get("grid_ports", []),
+        slack_backend=settings.get("slack_backend", "api"),
+        slack_url=settings.get("slack_url", ""),
+        slack_timeout_s=settings.get("slack_timeout_s", 10.0),
+        slack_coalesce_s=settings.get("slack_coalesce_s", 2.0),
+        slack_digest_interval_s=settings.get("slack_digest_interval_s", 0),
+        seed=settings.get("seed", None),
+        record_executions=settings.get("record_executions", False),
+        replay_executions=settings.get("replay_executions", ""),
+        replay_model=settings.get("replay_model", "nearest"),
+        executor_backend=settings.get("executor_backend", "socket"),
+        showmax_target=settings.get("showmax_target", ""),
+        showmax_workers=settings.get("showmax_workers", 0),
+        showmax_grid_workers=settings.get("showmax_grid_workers", 1),
     )
+    if immutable_params['executor_backend'] not in executors.EXECUTOR_BACKENDS:
+        raise ValueError(f"Unknown executor backend '{immutable_params['executor_backend']}', it must be one of "
+                         f"{executors.EXECUTOR_BACKENDS}")
 
-    # collecting system info
-    available_mem = psutil.virtual_memory().total / 1_073_741_824
-    cpu_cores = psutil.cpu_count()
-    hosting_os = platform.platform()
 
     params = [v for v in mutable_param.values()]
 
     number_of_experiments = sum(1 for e in product(*params))  # count number of comb
-    combination_id = 0
     print(f"There are {number_of_experiments} experiment(s) configuration to run!")
 
     root_output_dir = os.path.abspath(args.output)
     print(f"Saving result to '{root_output_dir}'")
 
-    for c, e, budget, is_time_based, time_cap_in_s, num_iter, reward_type, gram_used, alg,\
-            locking, bias, max_reward, tail_len, max_cutting_threshold, threshold_decay_rate in product(*params):
-        combination_id += 1
-        time_cap_in_h = time_cap_in_s / 3600
-        gram_base_file_name = os.path.basename(gram_used)
-        for r in range(immutable_params["number_of_repetitions"]):
-            date = datetime.now().date().strftime("%m/%d/%Y")
-            time = datetime.now().time().strftime("%H:%M:%S")
-            print("====================================================")
-            exper_info = f"Experiment Info:\n ```\ngram={gram_base_file_name}, algorithm={alg}, c={c}, e={e}, " \
-                         f"locking={locking}, bias={bias}, budget={budget}, reward-type={reward_type}, " \
-                         f"reward-max={max_reward}, " \
-                         f"tail-len={tail_len}, max-cutting-threshold={max_cutting_threshold}," \
-                         f"threshold-decay-rate={threshold_decay_rate:f}, time-based?={is_time_based}, " \
-                         f"time-cap-h={time_cap_in_h} iter={num_iter}\n```"
-            run_seq = f"This is combination {combination_id} of {number_of_experiments}. And this is run {r+1} of "\
-                      f"{immutable_params['number_of_repetitions']}."
-            print(exper_info)
-            print(run_seq)
-            print("====================================================")
-            if args.slack:
-                slack.post_message_to_slack(f"New Experiment [date: {date}, time: {time}]")
-                slack.post_message_to_slack(run_seq)
-                slack.post_message_to_slack(exper_info)
-
-            # updating MCTS globals for all
-            mg.C = c
-            mg.E = e
-
-            # if one is given prep for file name
-            expr_desc_with_id = "" if immutable_params['expr_desc'] == "" else f"desc:{immutable_params['expr_desc']}-"
-            duration_info = f"time_based(h={time_cap_in_h})" if is_time_based else f"iter_based(iter={num_iter})"
-            bias_ind = 'T' if bias else "F"
-            locking_ind = 'T' if locking else "F"
-            expr_identifier = f"app:{immutable_params['app_name']}-{expr_desc_with_id}alg:{alg}-" \
-                              f"gram:{gram_base_file_name.replace('-', '_')}-c:{mg.C}-e:{mg.E}-" \
-                              f"BDG:{budget}-rType:{reward_type}-rMax:{max_reward}-bias:{bias_ind}-" \
-                              f"tail:{tail_len}-unqMax:{max_cutting_threshold}-unqGrwRate:{threshold_decay_rate:f}-" \
-                              f"lock:{locking_ind}-DUR:{duration_info}-" \
-                              f"date:{date.replace('/', '')}-time:{time.replace(':','')}"
-            output_dir = os.path.join(root_output_dir, expr_identifier)
-            os.makedirs(output_dir)
-
-            # make sure all handlers are removed
-            for handler in logging.root.handlers[:]:
-                logging.root.removeHandler(handler)
-
-            if immutable_params['log_to_file']:
-                # File logging:
-                h = logging.FileHandler(f'{output_dir}/traces.log')
-                h.setFormatter(logging_format)
-                logging.root.addHandler(h)
-            else:
-                # Stream logging:
-                h = logging.StreamHandler()
-                h.setFormatter(logging_format)
-                logging.root.addHandler(h)
-
-            # build grammar
-            gram = parse(open(gram_used, 'r'), len_based_size=True)
-            xform = FactorEmpty(gram)
-            xform.transform_all_rhs(gram)
-
-            # print gram info after parsing and adjusting costs
-            with open(f"{output_dir}/gram-with-cost.txt", "w") as file:
-                file.write(gram.dump())
-
-            mcts = MonteCarloTreeSearch(gram=gram,
-                                        output_dir=output_dir + "/",
-                                        expr_id=expr_identifier,
-                                        budget=budget,
-                                        reward_type=reward_type,
-                                        use_locking=locking,
-                                        use_bias=bias,
-                                        tail_len=tail_len,
-                                        max_threshold=max_cutting_threshold,
-                                        threshold_decay=threshold_decay_rate)
-
-            if not mcts.dry_run():  # skip any experiment we cannot warmup for within allowed time.
-                continue
-
-            # use the specified algorithm to do the search
-            if alg == 'treeline':
-                mcts.treeline(is_time_based, time_cap_h=time_cap_in_h, num_iter=num_iter)
-            elif alg == 'random':
-                mcts.random_search(is_time_based, time_cap_h=time_cap_in_h, num_iter=num_iter)
-            else:
-                raise RuntimeError(f"Unknown algorithm {alg}")
-
-            # run a simulation of the best path
-            if immutable_params['sim']:
-                mcts.simulate()
-
-            # save the tree as binary
-            if immutable_params['save_tree_as_binary']:
-                print("Saving tree as binary ...")
-                mcts.save_tree()
-
-            # print the tree to file
-            if immutable_params['write_tree_to_file_as_text']:
-                print("Saving tree as text ...")
-                with open(f"{output_dir}/Tree.txt", "w") as tree_file:
-                    tree_file.write(mcts.get_tree())
-
-            if immutable_params['generate_tree_vis']:
-                print("Rendering the tree based on dot file ...")
-                g = graphviz.Source(helper.tree_to_dot(mcts.root))
-                g.render(filename=f"{output_dir}/TreeVis", format="pdf", cleanup=True)
-
-            # getting dict report and adding high-level info (e.g. date, gram file, etc).
-            report = mcts.get_report()
-            report['Period: Run date-time'] = str(date) + "-" + str(time)
-            report['Config: grammar file'] = str(gram_base_file_name)
-            report['Env: available mem'] = str(available_mem)
-            report['Env: cpu cores'] = str(cpu_cores)
-            report['Env: os'] = str(hosting_os)
-            report['Config: Target App'] = immutable_params['app_name']
-            report['Config: Expr Description'] = immutable_params['expr_desc']
-            report['Config: Search Algorithm'] = alg
-
-            # logging high-level info for this experiment in the target app file
-            print("Logging high-level info of this target app ...")
-            print(f"Max cost observed: {report['Results: Max Observed Cost']}")
-            report_file = f"{root_output_dir}/experiments-info-{immutable_params['app_name']}.csv"
-            if os.path.exists(report_file):
-                with open(report_file, "a") as e_file:
-                    writer = csv.writer(e_file)
-                    values = [*report.values()]
-                    writer.writerow(values)
-            else:
-                with open(report_file, "a") as e_file:
-                    writer = csv.writer(e_file)
-                    header = [*report.keys()]
-                    writer.writerow(header)  # header (should only be written once)
-                    values = [*report.values()]
-                    writer.writerow(values)
-
-            # write final stats to file
-            print("Write high-level stats to file ...")
-            with open(f"{output_dir}/config-and-stats-report.txt", "w") as report_file:
-                stats_summery = helper.beautify_final_report(report)
-                report_file.write(stats_summery)
-
-            # merge the configurations The server options (not in use yet) | immutable option | mutable options based
-            # on this run.
-            exper_configurations = dict(FUZZ_SERVER="localhost", FUZZ_PORT=2300) | immutable_params | dict(
-                log_level=settings['log_level'],
-                c=[c],  # exploration
-                e=[e],  # visits before expansion
-                budget=[budget],  # budget allowed for an input
-                is_time_based=[is_time_based],  # are running based on time or iterations?
-                time_cap_in_h=[time_cap_in_s],  # if based on time, how long in hours are we allowed to run?
-                num_iter=[num_iter],  # if based on iterations, what is the number of search iteration planned?
-                reward_type=[reward_type],  # the reward strategy
-                grams=[gram_used],
-                algorithm=alg,  # The search algorithm to use
-                use_locking=[locking],
-                use_bias=[bias],
-                max_reward=[max_reward],
-                tail_len=[tail_len],
-                max_cutting_threshold=[max_cutting_threshold],
-                threshold_decay_rate=[threshold_decay_rate],
-            )
-
-            # save configurations to file for re-run
-            configuration_loader.Settings.dump_yaml_from_dict(exper_configurations, f"{output_dir}/configurations.yaml")
-
-            if args.slack:
-                slack.post_message_to_slack(f"Experiment Ended (it started at {date}, {time}). "
-                                            f"Here are some stats:\n\n```\n{stats_summery}\n```\n")
-
-            mcts.close_connection()
-
-            # make sure the logging level is set-back to whatever the user chose for the next run
-            # FIXME, where did we change the log level to need this?
-            logging.root.setLevel(log_level[settings["log_level"]])
+    # what all the experiments share (including the collected system info)
+    import psutil
+    grid = dict(
+        immutable_params=immutable_params,
+        root_output_dir=root_output_dir,
+        number_of_experiments=number_of_experiments,
+        log_level=settings["log_level"],
+        slack=args.slack,
+        fuzz_server=settings.get("FUZZ_SERVER", "localhost"),
+        fuzz_port=settings.get("FUZZ_PORT", 2300),
+        grid_ports=immutable_params['grid_ports'],
+        grammar_cache_dir=None if not settings.get("grammar_cache", True) else
+        os.path.abspath(settings.get("grammar_cache_dir", "") or os.path.join(root_output_dir, ".grammar-cache")),
+        available_mem=psutil.virtual_memory().total / 1_073_741_824,
+        cpu_cores=psutil.cpu_count(),
+        hosting_os=platform.platform(),
+    )
+    jobs = [(combination, combination_id, r)
+            for combination_id, combination in enumerate(product(*params), start=1)
+            for r in range(immutable_params["number_of_repetitions"])]
+
+    # parse the grammars once before any experiment starts, the (forked) workers find them cached
+    if grid['grammar_cache_dir'] is not None:
+        for gram_file in set(mutable_param['grams']):
+            grammar_cache.load_grammar(gram_file, cache_dir=grid['grammar_cache_dir'], len_based_size=True)
+
+    if settings.get("sweep", False):
+        sweep_metric = settings.get("sweep_metric", "max_cost")
+        if sweep_metric not in SWEEP_METRICS:
+            raise ValueError(f"Unknown sweep metric '{sweep_metric}', it must be one of {SWEEP_METRICS}")
+        run_sweep(grid, jobs, rungs=max(settings.get("sweep_rungs", 3), 1), eta=max(settings.get("sweep_eta", 3), 2),
+                  metric=sweep_metric)
+    else:
+        results = run_experiments(grid, [(combination, combination_id, r, {})
+                                         for combination, combination_id, r in jobs])
+        failed = [(combination_id, r + 1) for combination_id, r, _, error in results if error is not None]
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(jobs)} experiment(s) failed (combination, run): {failed}")